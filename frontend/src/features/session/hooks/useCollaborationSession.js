@@ -1,66 +1,162 @@
-import { useState, useEffect, useRef } from "react";
+import { useState, useEffect, useRef, useCallback } from "react";
 import useCollaborationSocket from "./useCollaborationSocket";
+import { apply, compose, fromDiff, isNoop, transform } from "../../../shared/utils/textOperation";
 
 export default function useCollaborativeSession(sessionId, userId, username) {
   const [code, setCode] = useState("");
   const [language, setLanguage] = useState("javascript");
 
-  // Tracks if we're currently typing to avoid overwriting our own changes
-  const isTypingRef = useRef(false);
-  const typingTimeoutRef = useRef(null);
-  const lastSentCodeRef = useRef("");
-  const pendingUpdateRef = useRef(null);
-
-  const { socketReady, sessionState, sendMessage, partnerLeft } =
-    useCollaborationSocket(sessionId, userId, username);
+  // Only edits travel over the socket. The server numbers the edits it
+  // applies (version); we keep one edit in flight at a time, buffer what
+  // is typed meanwhile, and transform both past remote edits.
+  const codeRef = useRef("");
+  const versionRef = useRef(0);
+  const inFlightRef = useRef(null);   // sent, waiting for code_ack
+  const bufferRef = useRef(null);     // typed since, not yet sent
+  const sendRef = useRef(() => false);
+  const loadedRef = useRef(false);     // a document has been received
+  const resyncingRef = useRef(false);  // waiting for session_resume/session_state
+
+  const flushEdits = useCallback(() => {
+    if (resyncingRef.current || inFlightRef.current || !bufferRef.current) return;
+    const op = bufferRef.current;
+    if (!sendRef.current("code_update", { version: versionRef.current, op })) return;
+    inFlightRef.current = op;
+    bufferRef.current = null;
+  }, []);
+
+  // Apply an edit committed by someone else on top of our pending edits
+  const applyRemote = useCallback((op, version) => {
+    let remote = op;
+    if (inFlightRef.current) {
+      [inFlightRef.current, remote] = transform(inFlightRef.current, remote);
+    }
+    if (bufferRef.current) {
+      [bufferRef.current, remote] = transform(bufferRef.current, remote);
+    }
+    versionRef.current = version;
+    if (!isNoop(remote)) {
+      codeRef.current = apply(codeRef.current, remote);
+      setCode(codeRef.current);
+    }
+  }, []);
+
+  // Ask for what we missed since our version (or the whole state)
+  const resync = useCallback((fromVersion = true) => {
+    resyncingRef.current = true;
+    sendRef.current("request_state", fromVersion ? { version: versionRef.current } : {});
+  }, []);
+
+  const handleCodeEvent = useCallback((msg) => {
+    switch (msg.type) {
+      case "session_state": {
+        codeRef.current = msg.data.code || "";
+        versionRef.current = msg.data.version ?? 0;
+        inFlightRef.current = null;
+        bufferRef.current = null;
+        loadedRef.current = true;
+        resyncingRef.current = false;
+        setCode(codeRef.current);
+        break;
+      }
 
-  // Update editor from incoming sessionState
-  useEffect(() => {
-    if (!sessionState) return;
-
-    // Only update code if we're not actively typing
-    if (sessionState.code !== undefined && sessionState.code !== lastSentCodeRef.current) {
-      if (isTypingRef.current) {
-        pendingUpdateRef.current = sessionState.code;
-      } else {
-        setCode(sessionState.code);
-        lastSentCodeRef.current = sessionState.code;
+      case "session_resume": {
+        resyncingRef.current = false;
+        try {
+          for (const entry of msg.ops) {
+            if (entry.version <= versionRef.current) continue;
+            if (entry.user_id === userId && inFlightRef.current) {
+              // Our edit in flight, committed before its code_ack reached us
+              versionRef.current = entry.version;
+              inFlightRef.current = null;
+            } else {
+              applyRemote(entry.op, entry.version);
+            }
+          }
+        } catch (err) {
+          console.error("Could not replay missed edits", err);
+          resync(false);
+          return;
+        }
+        // Never reached the server: send it again with what was typed since
+        if (inFlightRef.current) {
+          bufferRef.current = bufferRef.current
+            ? compose(inFlightRef.current, bufferRef.current)
+            : inFlightRef.current;
+          inFlightRef.current = null;
+        }
+        flushEdits();
+        break;
       }
-    }
-  }, [sessionState]);
 
-  const handleCodeChange = (newCode) => {
-    setCode(newCode);
+      case "code_ack": {
+        // Covered by the session_resume we are waiting for
+        if (resyncingRef.current) return;
+        if (msg.version !== versionRef.current + 1) {
+          resync();
+          return;
+        }
+        versionRef.current = msg.version;
+        inFlightRef.current = null;
+        flushEdits();
+        break;
+      }
 
-    isTypingRef.current = true;
+      case "code_update": {
+        if (resyncingRef.current) return;
+        // Missed an edit (or an older server sent the whole document)
+        if (!msg.op) {
+          resync(false);
+          return;
+        }
+        if (msg.version !== versionRef.current + 1) {
+          resync();
+          return;
+        }
+        try {
+          applyRemote(msg.op, msg.version);
+        } catch (err) {
+          console.error("Could not merge remote edit", err);
+          resync(false);
+        }
+        break;
+      }
 
-    if (typingTimeoutRef.current) {
-      clearTimeout(typingTimeoutRef.current);
+      default:
+        break;
     }
+  }, [flushEdits, applyRemote, resync, userId]);
 
-    typingTimeoutRef.current = setTimeout(() => {
-      isTypingRef.current = false;
+  // The socket is reconnecting: resume from the last version we saw
+  const handleReconnect = useCallback(() => {
+    if (!loadedRef.current) return null;
+    resyncingRef.current = true;
+    return versionRef.current;
+  }, []);
 
-      if (pendingUpdateRef.current && pendingUpdateRef.current !== newCode) {
-        setCode(pendingUpdateRef.current);
-        lastSentCodeRef.current = pendingUpdateRef.current;
-        pendingUpdateRef.current = null;
-      }
-    }, 500);
+  const { socketReady, sessionState, sendMessage, partnerLeft } =
+    useCollaborationSocket(sessionId, userId, username, handleCodeEvent, handleReconnect);
+
+  sendRef.current = (type, data) => {
+    if (!socketReady) return false;
+    sendMessage(type, data);
+    return true;
+  };
+
+  const handleCodeChange = (newCode) => {
+    // Diff each change on its own so the edit stays as small as the keystroke
+    const edit = fromDiff(codeRef.current, newCode);
+    bufferRef.current = bufferRef.current ? compose(bufferRef.current, edit) : edit;
+    codeRef.current = newCode;
+    setCode(newCode);
   };
 
-  // Broadcast code updates
+  // Send local edits (debounced while typing)
   useEffect(() => {
     if (!socketReady) return;
-    if (code === lastSentCodeRef.current) return;
-
-    const debounce = setTimeout(() => {
-      sendMessage("code_update", { code });
-      lastSentCodeRef.current = code;
-    }, 150);
-
+    const debounce = setTimeout(flushEdits, 150);
     return () => clearTimeout(debounce);
-  }, [code, socketReady, sendMessage]);
+  }, [code, socketReady, flushEdits]);
 
   // Broadcast language changes
   useEffect(() => {
@@ -1,6 +1,11 @@
 import { useEffect, useRef, useState } from "react";
 
-export default function useCollaborationSocket(sessionId, userId, username) {
+// onCodeEvent receives session_state, session_resume, code_update and
+// code_ack messages in arrival order; edits must be applied one by one, not
+// batched into state. After a dropped connection the socket reconnects;
+// onReconnect returns the last document version seen (or null) so the
+// server sends only what was missed.
+export default function useCollaborationSocket(sessionId, userId, username, onCodeEvent, onReconnect) {
   const [socketReady, setSocketReady] = useState(false);
   const [sessionState, setSessionState] = useState({
     status: "preparing",
@@ -11,6 +16,12 @@ export default function useCollaborationSocket(sessionId, userId, username) {
   });
   const [partnerLeft, setPartnerLeft] = useState(false);
   const socketRef = useRef(null);
+  const onCodeEventRef = useRef(onCodeEvent);
+  onCodeEventRef.current = onCodeEvent;
+  const onReconnectRef = useRef(onReconnect);
+  onReconnectRef.current = onReconnect;
+  // Chat messages received from the server (system lines not counted)
+  const chatCountRef = useRef(0);
 
   const usersByIdRef = useRef(new Map());
 
@@ -77,23 +88,19 @@ export default function useCollaborationSocket(sessionId, userId, username) {
   useEffect(() => {
     if (!sessionId || !userId) return;
 
-    const wsUrl = `/api/v1/ws/session/active/${encodeURIComponent(
-      sessionId
-    )}?user_id=${encodeURIComponent(userId)}&username=${encodeURIComponent(username || "")}`;
+    let socket = null;
+    let retryTimer = null;
+    let attempts = 0;
+    let connected = false;
+    let stopped = false;
 
-    const socket = new WebSocket(wsUrl);
-    socketRef.current = socket;
-
-    socket.onopen = () => {
-      setSocketReady(true);
-      safeSend({ type: "introduce", user_id: userId, username });
-    };
-
-    socket.onmessage = (event) => {
+    const handleMessage = (event) => {
       const msg = JSON.parse(event.data);
 
       switch (msg.type) {
         case "session_state": {
+          if (msg.data && "code" in msg.data) onCodeEventRef.current?.(msg);
+          if (msg.data?.chat) chatCountRef.current = msg.data.chat.length;
           const incomingUsers = normalizeUsers(msg.data?.users || []);
           setSessionState((prev) => withPresenceDiff(
             { ...prev, status: msg.data ? "ready" : "preparing", code: msg.data?.code || "", chatMessages: msg.data?.chat || prev.chatMessages },
@@ -102,6 +109,17 @@ export default function useCollaborationSocket(sessionId, userId, username) {
           break;
         }
 
+        case "session_resume": {
+          onCodeEventRef.current?.(msg);
+          chatCountRef.current += msg.chat.length;
+          const incomingUsers = normalizeUsers(msg.users || []);
+          setSessionState((prev) => withPresenceDiff(
+            { ...prev, status: "ready", chatMessages: [...(prev.chatMessages || []), ...msg.chat] },
+            incomingUsers
+          ));
+          break;
+        }
+
         case "presence_snapshot": {
           const incomingUsers = normalizeUsers(msg.users || []);
           setSessionState((prev) => withPresenceDiff(prev, incomingUsers));
@@ -151,6 +169,7 @@ export default function useCollaborationSocket(sessionId, userId, username) {
         case "chat_message": {
           // Normalize username from user_id if missing
           const resolvedName = msg.username || nameOf(msg.user_id, "Someone");
+          chatCountRef.current += 1;
           setSessionState((prev) => ({
             ...prev,
             chatMessages: [...(prev.chatMessages || []), { ...msg, username: resolvedName }],
@@ -158,18 +177,53 @@ export default function useCollaborationSocket(sessionId, userId, username) {
           break;
         }
 
-        case "code_update": {
-          setSessionState((prev) => ({ ...prev, code: msg.code }));
+        case "code_update":
+        case "code_ack": {
+          onCodeEventRef.current?.(msg);
           break;
         }
         default:
           console.warn("Unhandled message type:", msg.type);
       }
     };
-    socket.onclose = () => setSocketReady(false);
-    socket.onerror = (err) => console.error("WebSocket error", err);
 
-    return () => socket.close();
+    const connect = () => {
+      let wsUrl = `/api/v1/ws/session/active/${encodeURIComponent(
+        sessionId
+      )}?user_id=${encodeURIComponent(userId)}&username=${encodeURIComponent(username || "")}`;
+      // Reconnecting: ask only for the edits and chat we missed
+      const resumeVersion = connected ? onReconnectRef.current?.() : null;
+      if (resumeVersion != null) {
+        wsUrl += `&version=${resumeVersion}&chat_length=${chatCountRef.current}`;
+      }
+
+      socket = new WebSocket(wsUrl);
+      socketRef.current = socket;
+
+      socket.onopen = () => {
+        connected = true;
+        attempts = 0;
+        setSocketReady(true);
+        safeSend({ type: "introduce", user_id: userId, username });
+      };
+      socket.onmessage = handleMessage;
+      socket.onclose = () => {
+        setSocketReady(false);
+        if (stopped) return;
+        // Back off 1s, 2s, 4s ... up to 10s between attempts
+        retryTimer = setTimeout(connect, Math.min(1000 * 2 ** attempts, 10000));
+        attempts += 1;
+      };
+      socket.onerror = (err) => console.error("WebSocket error", err);
+    };
+
+    connect();
+
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      socket.close();
+    };
   }, [sessionId, userId, username]);
 
   const safeSend = (obj) => {
@@ -178,7 +232,13 @@ export default function useCollaborationSocket(sessionId, userId, username) {
     }
   };
 
-  const sendMessage = (type, data = {}) => safeSend({ type, ...data });
+  const sendMessage = (type, data = {}) => {
+    // A resync from a known version also says how much chat we already have
+    if (type === "request_state" && data.version != null) {
+      data = { ...data, chat_length: chatCountRef.current };
+    }
+    safeSend({ type, ...data });
+  };
 
   return { socketReady, sessionState, sendMessage, partnerLeft };
 }
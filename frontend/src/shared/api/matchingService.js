@@ -134,6 +134,11 @@ export function connectMatchingWebSocket(token, onMessage) {
   ws.onmessage = (event) => {
     try {
       const data = JSON.parse(event.data);
+      // Heartbeat: the server closes sockets that stop answering pings
+      if (data.type === "ping") {
+        ws.send(JSON.stringify({ type: "pong" }));
+        return;
+      }
       onMessage?.(data);
     } catch (err) {
       console.error("[MatchingWS] invalid message", err);
@@ -0,0 +1,170 @@
+// Operational transformation for the collaborative editor; mirrors
+// collaboration-service/app/utils/text_operation.py.
+// An operation walks the whole document: a positive number keeps that many
+// characters, a negative number deletes that many, a string inserts it.
+// Lengths count code points (not UTF-16 units) to match the server.
+
+const isRetain = (c) => typeof c === "number" && c > 0;
+const isDelete = (c) => typeof c === "number" && c < 0;
+const isInsert = (c) => typeof c === "string";
+
+const cpLength = (s) => Array.from(s).length;
+
+function builder() {
+  const ops = [];
+  return {
+    ops,
+    retain(n) {
+      if (n <= 0) return;
+      if (isRetain(ops[ops.length - 1])) ops[ops.length - 1] += n;
+      else ops.push(n);
+    },
+    insert(text) {
+      if (!text) return;
+      const last = ops[ops.length - 1];
+      if (isInsert(last)) ops[ops.length - 1] += text;
+      else if (isDelete(last)) {
+        // keep inserts before deletes, as the server does
+        if (isInsert(ops[ops.length - 2])) ops[ops.length - 2] += text;
+        else ops.splice(ops.length - 1, 0, text);
+      } else ops.push(text);
+    },
+    delete(n) {
+      if (n <= 0) return;
+      if (isDelete(ops[ops.length - 1])) ops[ops.length - 1] -= n;
+      else ops.push(-n);
+    },
+  };
+}
+
+export function isNoop(op) {
+  return op.every(isRetain);
+}
+
+export function apply(doc, op) {
+  const chars = Array.from(doc);
+  const out = [];
+  let pos = 0;
+  for (const c of op) {
+    if (isInsert(c)) out.push(c);
+    else if (c > 0) {
+      out.push(chars.slice(pos, pos + c).join(""));
+      pos += c;
+    } else pos -= c;
+  }
+  if (pos !== chars.length) {
+    throw new Error(`Operation expects a document of length ${pos}, got ${chars.length}`);
+  }
+  return out.join("");
+}
+
+// Returns [a', b'] with apply(apply(doc, a), b') === apply(apply(doc, b), a').
+// Where both insert at the same position, a's text goes first.
+export function transform(a, b) {
+  const aPrime = builder();
+  const bPrime = builder();
+  let i = 0;
+  let j = 0;
+  let opA = a[i++];
+  let opB = b[j++];
+
+  while (opA !== undefined || opB !== undefined) {
+    if (isInsert(opA)) {
+      aPrime.insert(opA);
+      bPrime.retain(cpLength(opA));
+      opA = a[i++];
+      continue;
+    }
+    if (isInsert(opB)) {
+      aPrime.retain(cpLength(opB));
+      bPrime.insert(opB);
+      opB = b[j++];
+      continue;
+    }
+    if (opA === undefined || opB === undefined) {
+      throw new Error("Concurrent operations must apply to the same document");
+    }
+
+    const n = Math.min(Math.abs(opA), Math.abs(opB));
+    if (isRetain(opA) && isRetain(opB)) {
+      aPrime.retain(n);
+      bPrime.retain(n);
+    } else if (isDelete(opA) && isRetain(opB)) {
+      aPrime.delete(n);
+    } else if (isRetain(opA) && isDelete(opB)) {
+      bPrime.delete(n);
+    }
+
+    opA = opA > 0 ? opA - n : opA + n;
+    opB = opB > 0 ? opB - n : opB + n;
+    if (opA === 0) opA = a[i++];
+    if (opB === 0) opB = b[j++];
+  }
+  return [aPrime.ops, bPrime.ops];
+}
+
+// Combines a (doc0 -> doc1) and b (doc1 -> doc2) into one operation doc0 -> doc2
+export function compose(a, b) {
+  const result = builder();
+  const slice = (text, start, end) => Array.from(text).slice(start, end).join("");
+  let i = 0;
+  let j = 0;
+  let opA = a[i++];
+  let opB = b[j++];
+
+  while (opA !== undefined || opB !== undefined) {
+    if (isDelete(opA)) {
+      result.delete(-opA);
+      opA = a[i++];
+      continue;
+    }
+    if (isInsert(opB)) {
+      result.insert(opB);
+      opB = b[j++];
+      continue;
+    }
+    if (opA === undefined || opB === undefined) {
+      throw new Error("Operations cannot be composed: lengths do not match");
+    }
+
+    const lenA = isInsert(opA) ? cpLength(opA) : opA;
+    const lenB = Math.abs(opB);
+    const n = Math.min(lenA, lenB);
+    if (isRetain(opA) && isRetain(opB)) {
+      result.retain(n);
+    } else if (isInsert(opA) && isRetain(opB)) {
+      result.insert(slice(opA, 0, n));
+    } else if (isRetain(opA) && isDelete(opB)) {
+      result.delete(n);
+    }
+    // Text inserted by a and deleted by b never appears in the result
+
+    opA = lenA > n ? (isInsert(opA) ? slice(opA, n) : opA - n) : a[i++];
+    opB = lenB > n ? (opB > 0 ? opB - n : opB + n) : b[j++];
+  }
+  return result.ops;
+}
+
+// Single-splice operation turning `oldText` into `newText`
+export function fromDiff(oldText, newText) {
+  const oldChars = Array.from(oldText);
+  const newChars = Array.from(newText);
+  const limit = Math.min(oldChars.length, newChars.length);
+
+  let prefix = 0;
+  while (prefix < limit && oldChars[prefix] === newChars[prefix]) prefix += 1;
+  let suffix = 0;
+  while (
+    suffix < limit - prefix &&
+    oldChars[oldChars.length - 1 - suffix] === newChars[newChars.length - 1 - suffix]
+  ) {
+    suffix += 1;
+  }
+
+  const op = builder();
+  op.retain(prefix);
+  op.insert(newChars.slice(prefix, newChars.length - suffix).join(""));
+  op.delete(oldChars.length - prefix - suffix);
+  op.retain(suffix);
+  return op.ops;
+}
@@ -1,52 +1,154 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException, Body
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import json
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import islice
 import asyncio
-import redis.asyncio as redis
 from pydantic import BaseModel
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.services.session_persister import SessionPersister
+from app.services.session_relay import session_relay
+from app.utils import text_operation
+from app.utils.text_operation import Operation, OperationError
+from shared.websocket.connection import ClientConnection
 
 router = APIRouter()
 
+# Delivery counters for this replica (GET /sessions)
+delivery_metrics: Dict[str, int] = {
+    "coalesced_messages": 0,
+    "dropped_messages": 0,
+    "slow_disconnects": 0,
+}
+
+
+def open_connection(user_id: str, websocket: WebSocket) -> ClientConnection:
+    """
+    Wrap a socket in its own writer and bounded send queue. Cursor moves are
+    coalesced and dropped when the queue is full; any other overflow closes
+    the socket (1013), and the client reconnects and resumes.
+    """
+    return ClientConnection(
+        user_id,
+        websocket,
+        queue_size=settings.WS_SEND_QUEUE_SIZE,
+        send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+        metrics=delivery_metrics,
+    )
+
+
 # Session storage
 class Session:
     def __init__(self, session_id: str, question_id: str = None):
         self.session_id = session_id
         self.question_id = question_id
+        # Sockets connected to this replica
         self.users: Dict[str, dict] = {}
+        # Everyone in the session, on any replica: user_id -> username, cursor
+        self.members: Dict[str, dict] = {}
         self.code: str = ""
         self.chat: List[dict] = []
         self.language: str = "python"
+        # Document version = number of operations applied to `code`; the
+        # most recent ones (with their author) are kept to transform edits
+        # made on older versions and to bring reconnecting clients up to date
+        self.version: int = 0
+        self.history: deque = deque(maxlen=settings.CODE_HISTORY_SIZE)
+        self.code_lock = asyncio.Lock()
+        # Writes changes made by this replica's users back to Redis
+        self.persister = SessionPersister(session_id)
         self.created_at = datetime.utcnow()
         self.last_code_update = datetime.utcnow()
         self.last_chat_message = datetime.utcnow()
     
-    def add_user(self, user_id: str, websocket: WebSocket, username: str = None):
+    def add_user(self, user_id: str, connection: ClientConnection, username: str = None):
         self.users[user_id] = {
-            "websocket": websocket,
+            "connection": connection,
             "username": username or f"User {user_id[:8]}",
             "joined_at": datetime.utcnow(),
             "cursor": None,
             "last_seen": datetime.utcnow()
         }
+        self.members[user_id] = {"username": self.users[user_id]["username"], "cursor": None}
     
     def update_user_cursor(self, user_id: str, cursor: dict):
+        if user_id in self.members:
+            self.members[user_id]["cursor"] = cursor
         if user_id in self.users:
             self.users[user_id]["cursor"] = cursor
             self.users[user_id]["last_seen"] = datetime.utcnow()
     
-    def remove_user(self, user_id: str):
-        if user_id in self.users:
-            del self.users[user_id]
+    def remove_user(self, user_id: str, connection: Optional[ClientConnection] = None) -> bool:
+        """Remove the user, or only their `connection` if given and still current"""
+        user = self.users.get(user_id)
+        if user is None or (connection is not None and user["connection"] is not connection):
+            return False
+        del self.users[user_id]
+        return True
     
-    def get_user_websockets(self, exclude_user_id: Optional[str] = None) -> List[WebSocket]:
+    def get_connections(self, exclude_user_id: Optional[str] = None) -> List[ClientConnection]:
         return [
-            user["websocket"] 
+            user["connection"] 
             for uid, user in self.users.items() 
             if uid != exclude_user_id
         ]
     
+    def transform_operation(self, op: Operation, version: int) -> Operation:
+        """
+        Rebase a client edit made against `version` onto the current document.
+
+        The edit is transformed past every operation applied since that
+        version, so concurrent edits merge instead of overwriting each other.
+        """
+        missed = self.version - version
+        if missed < 0 or missed > len(self.history):
+            raise OperationError(f"Unknown document version {version} (current {self.version})")
+        for applied, _ in islice(self.history, len(self.history) - missed, None):
+            op, _ = text_operation.transform(op, applied)
+        return op
+
+    def apply_operation(self, op: Operation, user_id: Optional[str] = None):
+        """Apply the next committed operation to this replica's copy"""
+        self.code = text_operation.apply(self.code, op)
+        self.version += 1
+        self.history.append((op, user_id))
+        self.last_code_update = datetime.utcnow()
+
+    def reset_document(self, code: str, version: int):
+        self.code = code
+        self.version = version
+        self.history.clear()
+        self.last_code_update = datetime.utcnow()
+
+    def operations_since(self, version: int) -> Optional[List[dict]]:
+        """Edits applied after `version`, or None if they are no longer all kept"""
+        missed = self.version - version
+        if missed < 0 or missed > len(self.history):
+            return None
+        first = len(self.history) - missed
+        return [
+            {"version": version + i + 1, "user_id": user_id, "op": op}
+            for i, (op, user_id) in enumerate(islice(self.history, first, None))
+        ]
+
+    def get_resume(self, version: int, chat_length: int = 0) -> Optional[dict]:
+        """
+        What a client that has seen `version` and the first `chat_length`
+        chat messages is missing, or None if it needs the full state
+        """
+        ops = self.operations_since(version)
+        if ops is None:
+            return None
+        return {
+            "version": self.version,
+            "ops": ops,
+            "chat": self.chat[max(chat_length, 0):],
+            "language": self.language,
+            "users": self.get_users()
+        }
+
     def is_empty(self) -> bool:
         return len(self.users) == 0
     
@@ -55,24 +157,29 @@ class Session:
             "session_id": self.session_id,
             "question_id": self.question_id,
             "code": self.code,
+            "version": self.version,
             "chat": self.chat,
             "language": self.language,
-            "users": [
-                {
-                    "user_id": uid,
-                    "username": user["username"],
-                    "cursor": user.get("cursor")
-                }
-                for uid, user in self.users.items()
-            ],
+            "users": self.get_users(),
             "created_at": self.created_at.isoformat()
         }
+
+    def get_users(self) -> List[dict]:
+        return [
+            {
+                "user_id": uid,
+                "username": member["username"],
+                "cursor": member.get("cursor")
+            }
+            for uid, member in self.members.items()
+        ]
     
     def get_stats(self) -> dict:
         return {
             "session_id": self.session_id,
             "user_count": len(self.users),
             "code_length": len(self.code),
+            "version": self.version,
             "chat_length": len(self.chat),
             "last_code_update": self.last_code_update.isoformat(),
             "last_chat_message": self.last_chat_message.isoformat(),
@@ -82,36 +189,208 @@ class Session:
 class SessionEndedPayload(BaseModel):
     ended_by: Optional[str] = None
     
-# Global storage
+# Sessions with at least one socket on this replica
 active_sessions: Dict[str, Session] = {}
 
+# Attempts to commit an edit while other replicas keep committing first
+COMMIT_ATTEMPTS = 5
+
 async def broadcast_to_session(
     session_id: str,
     message: dict,
     exclude_user_id: Optional[str] = None
 ):
-    """Broadcast message to all users in session except sender"""
+    """
+    Broadcast message to all users in session except sender.
+    The message is encoded once and queued on each connection, so a slow
+    client never delays the others; a connection that fails closes itself.
+    """
     session = active_sessions.get(session_id)
     if not session:
         return
-    
-    websockets = session.get_user_websockets(exclude_user_id)
-    disconnected = []
-    
-    for ws in websockets:
-        try:
-            await ws.send_json(message)
-        except Exception as e:
-            print(f"Error broadcasting: {e}")
-            disconnected.append(ws)
-    
-    # Clean up disconnected
-    for ws in disconnected:
-        for user_id, user_data in list(session.users.items()):
-            if user_data["websocket"] == ws:
-                session.remove_user(user_id)
 
-redis_client = redis.from_url("redis://redis:6379/0")
+    data = json.dumps(message)
+    # Only the latest position of each cursor is worth delivering
+    coalesce_key = f"cursor:{message['user_id']}" if message.get("type") == "cursor_move" else None
+    for connection in session.get_connections(exclude_user_id):
+        connection.send(data, coalesce_key)
+
+
+def sync_message(session: Session, version=None, chat_length=None) -> dict:
+    """
+    Bring a client up to date: only what it missed (session_resume) when it
+    says which version it has seen, otherwise the whole session_state
+    """
+    resume = None
+    if isinstance(version, int):
+        resume = session.get_resume(version, chat_length if isinstance(chat_length, int) else 0)
+    if resume is None:
+        return {
+            "type": "session_state",
+            "data": session.get_state(),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    return {
+        "type": "session_resume",
+        **resume,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+async def publish_to_session(
+    session_id: str,
+    kind: str,
+    message: dict,
+    exclude_user_id: Optional[str] = None
+):
+    """
+    Send a message to everyone in the session, whichever replica they are on.
+    `kind` says how each replica updates its copy of the session first.
+    """
+    await session_relay.publish(session_id, {
+        "kind": kind,
+        "message": message,
+        "exclude_user_id": exclude_user_id
+    })
+
+
+async def handle_relay_event(session_id: str, event: dict):
+    """Apply an event from the session channel to this replica and deliver it locally"""
+    session = active_sessions.get(session_id)
+    if not session:
+        return
+
+    kind = event.get("kind")
+    if kind == "op":
+        async with session.code_lock:
+            await apply_operation_event(session, event)
+        return
+
+    message = event["message"]
+    if kind == "chat":
+        session.chat.append(message)
+        session.last_chat_message = datetime.utcnow()
+    elif kind == "language":
+        session.language = message["language"]
+    elif kind == "cursor":
+        session.update_user_cursor(message["user_id"], message.get("cursor"))
+    elif kind == "join":
+        session.members.setdefault(message["user_id"], {"username": message["username"], "cursor": None})
+    elif kind == "leave":
+        if message["user_id"] not in session.users:
+            session.members.pop(message["user_id"], None)
+
+    await broadcast_to_session(session_id, message, exclude_user_id=event.get("exclude_user_id"))
+
+    if kind == "closed":
+        # The state is being deleted, so pending changes are not written back
+        await close_local_session(session_id, persist=False)
+        await asyncio.gather(
+            *(connection.close(drain=True) for connection in session.get_connections()),
+            return_exceptions=True
+        )
+
+
+async def apply_operation_event(session: Session, event: dict):
+    """
+    Apply a committed edit and deliver it: code_ack to its author,
+    code_update to everyone else. Call with session.code_lock held.
+    """
+    version = event["version"]
+    if version <= session.version:
+        # Already applied: our own commit, or fetched while catching up
+        return
+    if version > session.version + 1:
+        await catch_up_document(session)
+        return
+
+    session.apply_operation(event["op"], event["user_id"])
+    if event.get("cursor"):
+        session.update_user_cursor(event["user_id"], event["cursor"])
+
+    author = session.users.get(event["user_id"])
+    if author:
+        author["connection"].send_json({"type": "code_ack", "version": version})
+
+    await broadcast_to_session(session.session_id, {
+        "type": "code_update",
+        "user_id": event["user_id"],
+        "op": event["op"],
+        "version": version,
+        "cursor": event.get("cursor"),
+        "timestamp": event["timestamp"]
+    }, exclude_user_id=event["user_id"])
+
+
+async def catch_up_document(session: Session):
+    """Apply the edits this replica missed. Call with session.code_lock held."""
+    await apply_missed_operations(
+        session, *await session_relay.read_operations(session.session_id, session.version)
+    )
+
+
+async def apply_missed_operations(
+    session: Session, snapshot: Optional[Tuple[str, int]], events: List[dict]
+):
+    if snapshot is None:
+        for event in events:
+            await apply_operation_event(session, event)
+        return
+    # Too far behind to replay edit by edit: rebuild the whole document
+    restore_document(session, snapshot, events)
+    await broadcast_to_session(session.session_id, {
+        "type": "session_state",
+        "data": session.get_state(),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+
+def restore_document(session: Session, snapshot: Tuple[str, int], events: List[dict]):
+    """Set the document to a saved snapshot plus the edits committed after it"""
+    session.reset_document(*snapshot)
+    for event in events:
+        if event["version"] > session.version:
+            session.apply_operation(event["op"], event["user_id"])
+
+
+async def load_session(session_id: str) -> Optional[Session]:
+    """Load a session on this replica from Redis and join its channel"""
+    session_data = await redis_client.get(session_id)
+    if not session_data:
+        return None
+    session_data = json.loads(session_data)
+
+    await session_relay.join(session_id)
+    session = Session(session_id=session_id, question_id=session_data["question"]["id"])
+    language, chat = await session_relay.load_state(session_id)
+    session.language = language or session_data.get("language", "python")
+    session.chat = chat or session_data.get("chat", [])
+    for uid, name in (await session_relay.get_members(session_id)).items():
+        session.members[uid] = {"username": name, "cursor": None}
+    # Read the document last: edits committed from here on arrive on the channel
+    restore_document(session, *await session_relay.load_document(session_id, session_data.get("code", "")))
+
+    # Another connection may have loaded it while we waited
+    return active_sessions.setdefault(session_id, session)
+
+
+async def close_local_session(session_id: str, persist: bool = True):
+    session = active_sessions.pop(session_id, None)
+    if session is not None:
+        await session_relay.leave(session_id)
+        await session.persister.close(flush=persist)
+
+
+async def persist_sessions():
+    """Write pending changes of every session on this replica (on shutdown)"""
+    await asyncio.gather(
+        *(session.persister.close() for session in active_sessions.values()),
+        return_exceptions=True
+    )
+
+
+session_relay.on_event = handle_relay_event
+
 
 @router.websocket("/ws/session/active/{session_id}")
 async def websocket_endpoint(
@@ -119,6 +398,8 @@ async def websocket_endpoint(
     session_id: str,
     user_id: str = Query(..., description="User ID from JWT"),
     username: str = Query(None, description="Display name"),
+    version: Optional[int] = Query(None, description="Last document version seen, when reconnecting"),
+    chat_length: Optional[int] = Query(None, description="Chat messages already received, when reconnecting"),
 ):
     """
     Main WebSocket endpoint for real-time collaboration
@@ -129,41 +410,35 @@ async def websocket_endpoint(
     - No manual "send" button needed
     
     Connection: ws://localhost:8003/api/v1/ws/session/{session_id}?user_id={user_id}&username={name}
+    Reconnecting clients add &version={n}&chat_length={m} to receive only what they missed
     """
     
     await websocket.accept()
     print(f"{username or user_id} connecting to session {session_id}")
     
-    # Try to load session from active_sessions
-    session = active_sessions.get(session_id)
+    # Try to load session from active_sessions, then from Redis
+    session = active_sessions.get(session_id) or await load_session(session_id)
 
     if not session:
-        # Check Redis if session exists
-        session_data = await redis_client.get(session_id)
-        if session_data:
-            session_data = json.loads(session_data)
-            session = Session(session_id=session_id, question_id=session_data["question"]["id"])
-            session.code = session_data.get("code", "")
-            session.language = session_data.get("language", "python")
-            session.chat = session_data.get("chat", [])
-            active_sessions[session_id] = session
-        else:
-            # Session not found anywhere, error
-            await websocket.send_json({"type": "error", "message": "Session not ready"})
-            await websocket.close()
-            return
-
-    # Add user
-    session.add_user(user_id, websocket, username)
+        # Session not found anywhere, error
+        await websocket.send_json({"type": "error", "message": "Session not ready"})
+        await websocket.close()
+        return
 
-    # Send current state
-    await websocket.send_json({
-        "type": "session_state",
-        "data": session.get_state()
-    })
+    # Add user and send current state; under the lock so edits committed
+    # meanwhile are either in the state or sent after it
+    connection = open_connection(user_id, websocket)
+    previous = session.users.get(user_id)
+    async with session.code_lock:
+        session.add_user(user_id, connection, username)
+        connection.send_json(sync_message(session, version, chat_length))
+    if previous is not None:
+        # Only the newest socket of a user receives events; release the old one
+        await previous["connection"].close()
+    await session_relay.add_member(session_id, user_id, session.users[user_id]["username"])
     
     # Notify others
-    await broadcast_to_session(session_id, {
+    await publish_to_session(session_id, "join", {
         "type": "user_joined",
         "user_id": user_id,
         "username": username or f"User {user_id[:8]}",
@@ -172,82 +447,122 @@ async def websocket_endpoint(
     
     try:
         # Main message loop - handles real-time updates
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            msg_type = message.get("type")
-            
-            # Handle different message types
-            if msg_type == "code_update":
-                await handle_code_update(session, user_id, message)
-            
-            elif msg_type == "cursor_move":
-                await handle_cursor_move(session, user_id, message)
-            
-            elif msg_type == "chat_message":
-                await handle_chat_update(session, user_id, message)
-            
-            elif msg_type == "language_change":
-                await handle_language_change(session, user_id, message)
-            
-            elif msg_type == "execute_code":
-                await handle_code_execution(session, user_id, message)
-            
-            elif msg_type == "request_state":
-                await websocket.send_json({
-                    "type": "session_state",
-                    "data": session.get_state(),
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            
-            else:
-                print(f"Unknown message type: {msg_type}")
-    
+        await connection.serve(lambda message: handle_message(session, user_id, message))
     except WebSocketDisconnect:
-        print(f"{username or user_id} disconnected from {session_id}")
-        
-        session.remove_user(user_id)
-        
-        # Notify others
-        await broadcast_to_session(session_id, {
-            "type": "user_left",
-            "user_id": user_id,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-        
-        # Clean up empty sessions
-        if session.is_empty():
-            print(f"Session {session_id} empty, cleaning up")
-            # TODO: Save to database before deleting
-            if session_id in active_sessions:
-                del active_sessions[session_id]
-    
+        pass
     except Exception as e:
         print(f"Error in WebSocket: {e}")
-        await websocket.close(code=1011)
+        await connection.close(code=1011)
+
+    print(f"{username or user_id} disconnected from {session_id}")
+    await connection.close()
+
+    if not session.remove_user(user_id, connection):
+        # Already replaced by the same user's new connection
+        return
+    await session_relay.remove_member(session_id, user_id)
+    await session.persister.flush()
+
+    # Notify others
+    await publish_to_session(session_id, "leave", {
+        "type": "user_left",
+        "user_id": user_id,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+    # Clean up empty sessions
+    if session.is_empty():
+        print(f"Session {session_id} empty on this replica, cleaning up")
+        await close_local_session(session_id)
+
+
+async def handle_message(session: Session, user_id: str, message: dict):
+    msg_type = message.get("type")
+
+    # Handle different message types
+    if msg_type == "code_update":
+        await handle_code_update(session, user_id, message)
+
+    elif msg_type == "cursor_move":
+        await handle_cursor_move(session, user_id, message)
+
+    elif msg_type == "chat_message":
+        await handle_chat_update(session, user_id, message)
+
+    elif msg_type == "language_change":
+        await handle_language_change(session, user_id, message)
+
+    elif msg_type == "execute_code":
+        await handle_code_execution(session, user_id, message)
+
+    elif msg_type == "request_state":
+        async with session.code_lock:
+            session.users[user_id]["connection"].send_json(
+                sync_message(session, message.get("version"), message.get("chat_length"))
+            )
+
+    else:
+        print(f"Unknown message type: {msg_type}")
 
 
 async def handle_code_update(session: Session, user_id: str, message: dict):
     """
-    Handle real-time code updates
-    Updates are sent automatically as user types (debounced by frontend)
+    Handle real-time code edits
+    Clients send only the edit ({"op": [...], "version": n}); it is merged
+    with concurrent edits, committed in Redis (which orders edits across
+    replicas), acknowledged to the sender and relayed as an edit to
+    everyone else. A full "code" replacement is still accepted from older
+    clients and relayed as an edit.
     """
-    if "code" in message:
-        session.code = message["code"]
-        session.last_code_update = datetime.utcnow()
-    
-    # Update cursor if provided
-    if "cursor" in message:
-        session.update_user_cursor(user_id, message["cursor"])
-    
-    # Broadcast immediately to other users
-    await broadcast_to_session(session.session_id, {
-        "type": "code_update",
-        "user_id": user_id,
-        "code": session.code,
-        "cursor": message.get("cursor"),
-        "timestamp": datetime.utcnow().isoformat()
-    }, exclude_user_id=user_id)
+    connection = session.users[user_id]["connection"]
+
+    # Commit and deliver under the lock so every user sees edits in version order
+    async with session.code_lock:
+        try:
+            if "op" in message:
+                await commit_code_operation(
+                    session, user_id, text_operation.normalize(message["op"]),
+                    int(message.get("version", -1)), message.get("cursor")
+                )
+            elif "code" in message:
+                await commit_code_operation(
+                    session, user_id, text_operation.from_diff(session.code, message["code"]),
+                    session.version, message.get("cursor")
+                )
+            elif "cursor" in message:
+                session.update_user_cursor(user_id, message["cursor"])
+        except (OperationError, TypeError, ValueError) as e:
+            # Out of sync: let the client start again from the current document
+            connection.send_json({"type": "error", "message": f"Rejected code update: {e}"})
+            connection.send_json({
+                "type": "session_state",
+                "data": session.get_state(),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+
+async def commit_code_operation(
+    session: Session, user_id: str, op: Operation, version: int, cursor: Optional[dict]
+):
+    """Commit a client edit made against `version`. Call with session.code_lock held."""
+    for _ in range(COMMIT_ATTEMPTS):
+        transformed = session.transform_operation(op, version)
+        event = {
+            "kind": "op",
+            "user_id": user_id,
+            "version": session.version + 1,
+            "op": transformed,
+            "cursor": cursor,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        missed = await session_relay.commit_operation(session.session_id, session.version, event)
+        if missed is None:
+            await apply_operation_event(session, event)
+            session.persister.save_code(session.code, session.version)
+            return
+        # Another replica committed first: apply its edits and transform again
+        await apply_missed_operations(session, *missed)
+    raise OperationError("Too many concurrent edits, try again")
 
 
 async def handle_cursor_move(session: Session, user_id: str, message: dict):
@@ -256,11 +571,9 @@ async def handle_cursor_move(session: Session, user_id: str, message: dict):
     Shows where other users are typing
     """
     cursor = message.get("cursor")
-    if cursor:
-        session.update_user_cursor(user_id, cursor)
     
     # Broadcast cursor position
-    await broadcast_to_session(session.session_id, {
+    await publish_to_session(session.session_id, "cursor", {
         "type": "cursor_move",
         "user_id": user_id,
         "cursor": cursor,
@@ -282,18 +595,10 @@ async def handle_chat_update(session: Session, user_id: str, message: dict):
         "timestamp": datetime.utcnow().isoformat()
     }
 
-    session.chat.append(payload)
-
-    await redis_client.set(session.session_id, json.dumps({
-        "match_id": session.question_id,  # optional
-        "session_id": session.session_id,
-        "question": {"id": session.question_id},
-        "language": session.language,
-        "code": session.code,
-        "chat": session.chat
-    }))
-
-    await broadcast_to_session(session.session_id, payload)
+    # session.chat is appended when the message comes back on the channel;
+    # only the sender's replica saves it
+    session.persister.append_chat(payload)
+    await publish_to_session(session.session_id, "chat", payload)
 
 
 async def handle_language_change(session: Session, user_id: str, message: dict):
@@ -301,14 +606,14 @@ async def handle_language_change(session: Session, user_id: str, message: dict):
     Handle programming language changes
     Syncs across all users
     """
-    if "language" in message:
-        session.language = message["language"]
-    
+    language = message.get("language", session.language)
+    session.persister.save_language(language)
+
     # Broadcast to all users (including sender for confirmation)
-    await broadcast_to_session(session.session_id, {
+    await publish_to_session(session.session_id, "language", {
         "type": "language_change",
         "user_id": user_id,
-        "language": session.language,
+        "language": language,
         "timestamp": datetime.utcnow().isoformat()
     })
 
@@ -319,7 +624,7 @@ async def handle_code_execution(session: Session, user_id: str, message: dict):
     TODO: Integrate with code execution service
     """
     # Show loading state to all users
-    await broadcast_to_session(session.session_id, {
+    await publish_to_session(session.session_id, "message", {
         "type": "code_executing",
         "user_id": user_id,
         "timestamp": datetime.utcnow().isoformat()
@@ -327,7 +632,7 @@ async def handle_code_execution(session: Session, user_id: str, message: dict):
     
     # TODO: Call code execution service
     # For now, just send a placeholder response
-    await broadcast_to_session(session.session_id, {
+    await publish_to_session(session.session_id, "message", {
         "type": "execution_result",
         "output": "Code execution not yet implemented",
         "status": "pending",
@@ -340,8 +645,9 @@ async def notify_session_ended(session_id: str, payload: SessionEndedPayload):
     Called by matching-service when someone ends the session.
     Broadcasts 'session_ended' to all connected users in that collab session.
     """
-    await broadcast_to_session(
+    await publish_to_session(
         session_id,
+        "message",
         {
             "type": "session_ended",
             "session_id": session_id,
@@ -356,20 +662,21 @@ async def notify_session_ended(session_id: str, payload: SessionEndedPayload):
 
 @router.get("/sessions")
 async def list_active_sessions():
-    """List all active collaboration sessions"""
+    """List the collaboration sessions with sockets on this replica"""
     return {
         "sessions": [
             session.get_stats()
             for session in active_sessions.values()
         ],
         "total_sessions": len(active_sessions),
-        "total_users": sum(len(s.users) for s in active_sessions.values())
+        "total_users": sum(len(s.users) for s in active_sessions.values()),
+        "delivery": delivery_metrics
     }
 
 
 @router.get("/sessions/{session_id}")
 async def get_session_info(session_id: str):
-    """Get detailed information about a session"""
+    """Get detailed information about a session hosted on this replica"""
     session = active_sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -383,22 +690,19 @@ async def get_session_info(session_id: str):
 @router.delete("/sessions/{session_id}")
 async def close_session(session_id: str):
     """Close a session (admin only - add auth later)"""
-    if session_id not in active_sessions:
+    if session_id not in active_sessions and not await redis_client.exists(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = active_sessions[session_id]
-    
-    # Notify all users
-    await broadcast_to_session(session_id, {
+    # Notify all users; every replica then drops its copy
+    await publish_to_session(session_id, "closed", {
         "type": "session_closed",
         "message": "Session has been closed",
         "timestamp": datetime.utcnow().isoformat()
     })
+    await session_relay.delete_state(session_id)
     
     # TODO: Save to database
     
-    del active_sessions[session_id]
-    
     return {"message": "Session closed successfully"}
 
 
@@ -16,6 +16,27 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = "your-secret"
     JWT_ALGORITHM: str = "HS256"
 
+    # Redis: session data, and the relay between service replicas
+    REDIS_URL: str = "redis://redis:6379/0"
+
+    # Collaborative editing: recent operations kept per session (in memory
+    # and in Redis) to merge edits made against an older document version
+    # and to bring a replica that missed some edits up to date
+    CODE_HISTORY_SIZE: int = 500
+
+    # Code, language and chat changes are written to Redis together, at
+    # most once per interval per session (and when a user disconnects)
+    PERSIST_INTERVAL_MS: int = 1000
+    # Shared session state in Redis expires this long after its last write
+    SESSION_STATE_TTL_SECONDS: int = 24 * 60 * 60
+
+    # WebSocket delivery: each socket has its own writer and a bounded send
+    # queue. Cursor updates are coalesced per user and dropped when the queue
+    # is full; any other overflow, or a send slower than the timeout,
+    # disconnects the client (code 1013), which then reconnects and resumes.
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SEND_TIMEOUT_SECONDS: float = 5
+
     class Config:
         env_file = ".env"
         case_sensitive = False
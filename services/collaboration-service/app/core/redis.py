@@ -0,0 +1,6 @@
+import redis.asyncio as redis
+from app.core.config import settings
+
+# One client per process, shared by the WebSocket handlers, the session
+# relay and the RabbitMQ consumer
+redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
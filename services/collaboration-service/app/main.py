@@ -4,6 +4,7 @@ import asyncio
 from app.core.config import settings
 from app.api import websocket
 from app.events import consumer
+from app.services.session_relay import session_relay
 
 # Create FastAPI app
 app = FastAPI(
@@ -46,4 +47,6 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    print(f"{settings.APP_NAME} shutting down...")
\ No newline at end of file
+    print(f"{settings.APP_NAME} shutting down...")
+    await websocket.persist_sessions()
+    await session_relay.close()
\ No newline at end of file
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.session_relay import session_relay
+
+
+class SessionPersister:
+    """
+    Write-behind persistence of one session's code, language and chat.
+
+    Changes are only marked dirty here; they are written to Redis together
+    at most once every PERSIST_INTERVAL_MS, or right away by `flush()` (when
+    a user disconnects). Any number of edits in between become a single code
+    snapshot, and new chat messages are appended instead of rewriting the
+    whole history.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self._snapshot: Optional[Tuple[str, int]] = None
+        self._language: Optional[str] = None
+        self._chat: List[dict] = []
+        self._last_flush = 0.0
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def save_code(self, code: str, version: int):
+        self._snapshot = (code, version)
+        self._schedule()
+
+    def save_language(self, language: str):
+        self._language = language
+        self._schedule()
+
+    def append_chat(self, message: dict):
+        self._chat.append(message)
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        delay = self._last_flush + settings.PERSIST_INTERVAL_MS / 1000 - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Changes made while flushing start a new timer
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Write pending changes now"""
+        async with self._lock:
+            snapshot, language, chat = self._snapshot, self._language, self._chat
+            if snapshot is None and language is None and not chat:
+                return
+            self._snapshot, self._language, self._chat = None, None, []
+            try:
+                await session_relay.save_state(self.session_id, snapshot, language, chat)
+            except Exception as e:
+                print(f"Failed to persist session {self.session_id}: {e}")
+                # Keep them for the next flush, behind anything newer
+                self._snapshot = self._snapshot or snapshot
+                self._language = self._language or language
+                self._chat = chat + self._chat
+                self._schedule()
+            finally:
+                self._last_flush = time.monotonic()
+
+    async def close(self, flush: bool = True):
+        """Stop the timer and write what is left, or drop it (`flush=False`)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        if flush:
+            await self.flush()
+        else:
+            self._snapshot, self._language, self._chat = None, None, []
@@ -0,0 +1,323 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.redis import redis_client
+
+# Every replica holding sockets for a session subscribes to its channel;
+# events are published there and each replica delivers them to its own
+# sockets, so peers can be connected to different processes or nodes
+SESSION_CHANNEL_PREFIX = "collab_session:"
+# Shared document hash: `version` (operations committed so far), the
+# last persisted snapshot (`code` at `code_version`) and `language`; the
+# operations list keeps every edit after the snapshot (JSON events), so the
+# document is the snapshot with those edits replayed. Redis decides the
+# order of edits, so document versions agree on every replica.
+DOCUMENT_KEY_PREFIX = "collab_doc:"
+OPERATIONS_KEY_PREFIX = "collab_ops:"
+# Chat messages (JSON), appended as they are sent
+CHAT_KEY_PREFIX = "collab_chat:"
+# user_id -> username of everyone connected to the session, on any replica
+MEMBERS_KEY_PREFIX = "collab_members:"
+# All four keys expire together SESSION_STATE_TTL_SECONDS after the last
+# write, so abandoned sessions don't stay in Redis
+_REFRESH_TTL = """
+local function refresh_ttl(ttl)
+    for _, key in ipairs(KEYS) do
+        redis.call('EXPIRE', key, ttl)
+    end
+end
+"""
+
+# Operations after version `since`, or the snapshot and the operations
+# after it when the list no longer reaches back that far (or since < 0)
+_OPERATIONS_SINCE = """
+local function operations_since(version, since)
+    local missed = version - since
+    if since >= 0 and missed <= 0 then
+        return {'ops', {}}
+    end
+    if since >= 0 and missed <= redis.call('LLEN', KEYS[2]) then
+        return {'ops', redis.call('LRANGE', KEYS[2], -missed, -1)}
+    end
+    local snapshot = redis.call('HMGET', KEYS[1], 'code', 'code_version')
+    local snapshot_version = tonumber(snapshot[2] or '0')
+    local ops = {}
+    if version > snapshot_version then
+        ops = redis.call('LRANGE', KEYS[2], snapshot_version - version, -1)
+    end
+    return {'document', snapshot[1] or '', snapshot_version, ops}
+end
+"""
+
+# Commit an edit only if nobody else committed since the version it was
+# transformed against; the event is published in the same step so every
+# replica receives edits in version order. On conflict, returns the edits
+# this replica missed so it can transform again without another round trip.
+# Only the edit is written: the code itself is saved by the session's
+# persister, and edits after the last snapshot are never trimmed.
+# KEYS: document, operations, chat, members
+COMMIT_OPERATION_SCRIPT = _OPERATIONS_SINCE + _REFRESH_TTL + """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if version ~= tonumber(ARGV[1]) then
+    return operations_since(version, tonumber(ARGV[1]))
+end
+redis.call('HSET', KEYS[1], 'version', version + 1)
+redis.call('RPUSH', KEYS[2], ARGV[2])
+local snapshot_version = tonumber(redis.call('HGET', KEYS[1], 'code_version') or '0')
+local keep = math.max(tonumber(ARGV[3]), version + 1 - snapshot_version)
+redis.call('LTRIM', KEYS[2], -keep, -1)
+refresh_ttl(ARGV[5])
+redis.call('PUBLISH', ARGV[4], ARGV[2])
+return {}
+"""
+
+READ_OPERATIONS_SCRIPT = _OPERATIONS_SINCE + """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+return operations_since(version, tonumber(ARGV[1]))
+"""
+
+# Save what changed since the last flush: the code snapshot (unless a newer
+# one is already stored), the language, and new chat messages.
+# KEYS: document, chat, operations, members
+# ARGV: TTL, snapshot version ('' for none), its code, language ('' for
+# none), then the chat messages.
+SAVE_STATE_SCRIPT = _REFRESH_TTL + """
+if ARGV[2] ~= '' then
+    local stored = tonumber(redis.call('HGET', KEYS[1], 'code_version') or '0')
+    if tonumber(ARGV[2]) > stored then
+        redis.call('HSET', KEYS[1], 'code', ARGV[3], 'code_version', ARGV[2])
+    end
+end
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[1], 'language', ARGV[4])
+end
+if #ARGV > 4 then
+    redis.call('RPUSH', KEYS[2], unpack(ARGV, 5))
+end
+refresh_ttl(ARGV[1])
+return 1
+"""
+
+# (None, events) with the edits after the requested version, or
+# ((code, version), events) with a snapshot and the edits after it when the
+# missed edits are no longer all kept
+MissedOperations = Tuple[Optional[Tuple[str, int]], List[dict]]
+
+
+def session_channel(session_id: str) -> str:
+    return f"{SESSION_CHANNEL_PREFIX}{session_id}"
+
+
+def document_key(session_id: str) -> str:
+    return f"{DOCUMENT_KEY_PREFIX}{session_id}"
+
+
+def operations_key(session_id: str) -> str:
+    return f"{OPERATIONS_KEY_PREFIX}{session_id}"
+
+
+def chat_key(session_id: str) -> str:
+    return f"{CHAT_KEY_PREFIX}{session_id}"
+
+
+def members_key(session_id: str) -> str:
+    return f"{MEMBERS_KEY_PREFIX}{session_id}"
+
+
+def state_keys(session_id: str) -> List[str]:
+    """Every key holding the session's shared state"""
+    return [document_key(session_id), operations_key(session_id), chat_key(session_id), members_key(session_id)]
+
+
+class SessionRelay:
+    """
+    Fans session events out to every replica through Redis pub/sub.
+
+    Events are dicts with a "kind"; `on_event(session_id, event)` is called
+    for each event on a session this replica has joined, including the
+    events it published itself. Each session has its own delivery queue
+    and task, so events of a session are handled in order while a session
+    busy with its document lock never holds up the others.
+    """
+
+    def __init__(self):
+        self.pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        # session_id -> (pending events, task handing them to on_event)
+        self._dispatchers: Dict[str, Tuple[asyncio.Queue, asyncio.Task]] = {}
+        self._joined: Set[str] = set()
+        self.on_event: Optional[Callable[[str, dict], Awaitable[None]]] = None
+        self._commit_script = redis_client.register_script(COMMIT_OPERATION_SCRIPT)
+        self._read_script = redis_client.register_script(READ_OPERATIONS_SCRIPT)
+        self._save_script = redis_client.register_script(SAVE_STATE_SCRIPT)
+
+    async def join(self, session_id: str):
+        """Start receiving the session's events on this replica"""
+        if self.pubsub is None:
+            self.pubsub = redis_client.pubsub()
+        await self.pubsub.subscribe(session_channel(session_id))
+        self._joined.add(session_id)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def leave(self, session_id: str):
+        self._joined.discard(session_id)
+        dispatcher = self._dispatchers.pop(session_id, None)
+        if dispatcher is not None:
+            # Not cancelled: leave() may be called by the handler it runs
+            dispatcher[0].put_nowait(None)
+        if self.pubsub is None:
+            return
+        try:
+            await self.pubsub.unsubscribe(session_channel(session_id))
+        except Exception as e:
+            print(f"Failed to unsubscribe from session {session_id}: {e}")
+
+    async def publish(self, session_id: str, event: dict):
+        await redis_client.publish(session_channel(session_id), json.dumps(event))
+
+    async def load_document(self, session_id: str, initial_code: str) -> MissedOperations:
+        """
+        Last snapshot of the shared document and the edits after it,
+        created from `initial_code` on first use
+        """
+        key = document_key(session_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(key, "code", initial_code)
+            pipe.hsetnx(key, "code_version", 0)
+            pipe.hsetnx(key, "version", 0)
+            pipe.expire(key, settings.SESSION_STATE_TTL_SECONDS)
+            await pipe.execute()
+        return await self.read_operations(session_id, -1)
+
+    async def load_state(self, session_id: str) -> Tuple[Optional[str], List[dict]]:
+        """Saved language (None until it is first changed) and chat history"""
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hget(document_key(session_id), "language")
+            pipe.lrange(chat_key(session_id), 0, -1)
+            language, chat = await pipe.execute()
+        return language, [json.loads(m) for m in chat]
+
+    async def save_state(
+        self,
+        session_id: str,
+        snapshot: Optional[Tuple[str, int]],
+        language: Optional[str],
+        chat: List[dict],
+    ):
+        """Write the fields that changed; see SessionPersister"""
+        code, version = snapshot if snapshot else ("", "")
+        await self._save_script(
+            keys=[document_key(session_id), chat_key(session_id), operations_key(session_id), members_key(session_id)],
+            args=[
+                settings.SESSION_STATE_TTL_SECONDS, version, code, language or "",
+                *(json.dumps(m) for m in chat),
+            ],
+            client=redis_client,
+        )
+
+    async def commit_operation(
+        self, session_id: str, base_version: int, event: dict
+    ) -> Optional[MissedOperations]:
+        """
+        Record an edit transformed against `base_version` and publish it.
+        Returns None once committed, or the edits committed by other
+        replicas since `base_version`.
+        """
+        result = await self._commit_script(
+            keys=state_keys(session_id),
+            args=[
+                base_version, json.dumps(event), settings.CODE_HISTORY_SIZE,
+                session_channel(session_id), settings.SESSION_STATE_TTL_SECONDS,
+            ],
+            client=redis_client,
+        )
+        return self._missed(result) if result else None
+
+    async def read_operations(self, session_id: str, since: int) -> MissedOperations:
+        """Edits committed after version `since`"""
+        result = await self._read_script(
+            keys=[document_key(session_id), operations_key(session_id)],
+            args=[since],
+            client=redis_client,
+        )
+        return self._missed(result)
+
+    @staticmethod
+    def _missed(result) -> MissedOperations:
+        if result[0] == "document":
+            _, code, version, events = result
+            return (code, int(version)), [json.loads(e) for e in events]
+        return None, [json.loads(e) for e in result[1]]
+
+    async def add_member(self, session_id: str, user_id: str, username: str):
+        key = members_key(session_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, user_id, username)
+            pipe.expire(key, settings.SESSION_STATE_TTL_SECONDS)
+            await pipe.execute()
+
+    async def remove_member(self, session_id: str, user_id: str):
+        await redis_client.hdel(members_key(session_id), user_id)
+
+    async def get_members(self, session_id: str) -> Dict[str, str]:
+        return await redis_client.hgetall(members_key(session_id))
+
+    async def delete_state(self, session_id: str):
+        """Drop the session's shared state from Redis"""
+        await redis_client.delete(*state_keys(session_id))
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Session relay listener error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message or message["type"] != "message" or self.on_event is None:
+                continue
+            session_id = message["channel"][len(SESSION_CHANNEL_PREFIX):]
+            self._dispatch(session_id, message["data"])
+
+    def _dispatch(self, session_id: str, data: str):
+        dispatcher = self._dispatchers.get(session_id)
+        if dispatcher is None:
+            if session_id not in self._joined:
+                # Still buffered from before leave()
+                return
+            queue: asyncio.Queue = asyncio.Queue()
+            dispatcher = self._dispatchers[session_id] = (queue, asyncio.create_task(self._deliver(session_id, queue)))
+        dispatcher[0].put_nowait(data)
+
+    async def _deliver(self, session_id: str, queue: asyncio.Queue):
+        """Hand a session's events to on_event one at a time; None ends it"""
+        while True:
+            data = await queue.get()
+            if data is None:
+                return
+            try:
+                await self.on_event(session_id, json.loads(data))
+            except Exception as e:
+                print(f"Error handling event for session {session_id}: {e}")
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        tasks = [task for _, task in self._dispatchers.values()]
+        self._dispatchers.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+
+
+session_relay = SessionRelay()
@@ -0,0 +1,185 @@
+"""
+Operational transformation for the shared code document.
+
+An operation is a list of components that walks the whole document from
+start to end: a positive int keeps that many characters, a negative int
+deletes that many, and a string inserts it. Lengths count Unicode code
+points, e.g. replacing "b" in "abc" with "XY" is [1, "XY", -1, 1].
+"""
+from typing import Iterator, List, Optional, Tuple, Union
+
+Component = Union[int, str]
+Operation = List[Component]
+
+
+class OperationError(ValueError):
+    """The operation is malformed or does not fit the document"""
+
+
+class _Builder:
+    """Accumulates components, merging neighbours of the same kind"""
+
+    def __init__(self):
+        self.ops: Operation = []
+
+    def retain(self, n: int):
+        if n <= 0:
+            return
+        if self.ops and _is_retain(self.ops[-1]):
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+
+    def insert(self, text: str):
+        if not text:
+            return
+        if self.ops and isinstance(self.ops[-1], str):
+            self.ops[-1] += text
+        elif self.ops and _is_delete(self.ops[-1]):
+            # Keep inserts before deletes so equal edits have one spelling
+            if len(self.ops) > 1 and isinstance(self.ops[-2], str):
+                self.ops[-2] += text
+            else:
+                self.ops.insert(len(self.ops) - 1, text)
+        else:
+            self.ops.append(text)
+
+    def delete(self, n: int):
+        if n <= 0:
+            return
+        if self.ops and _is_delete(self.ops[-1]):
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+
+
+def _is_retain(c: Component) -> bool:
+    return isinstance(c, int) and c > 0
+
+
+def _is_delete(c: Component) -> bool:
+    return isinstance(c, int) and c < 0
+
+
+def normalize(op) -> Operation:
+    """Validate an operation received from a client and merge its components"""
+    if not isinstance(op, list):
+        raise OperationError("Operation must be a list")
+    builder = _Builder()
+    for c in op:
+        if isinstance(c, bool) or not isinstance(c, (int, str)):
+            raise OperationError(f"Invalid operation component: {c!r}")
+        if isinstance(c, str):
+            builder.insert(c)
+        elif c > 0:
+            builder.retain(c)
+        else:
+            builder.delete(-c)
+    return builder.ops
+
+
+def base_length(op: Operation) -> int:
+    """Length of the document the operation applies to"""
+    return sum(abs(c) for c in op if isinstance(c, int))
+
+
+def target_length(op: Operation) -> int:
+    """Length of the document after the operation"""
+    return sum(c if isinstance(c, int) else len(c) for c in op if not _is_delete(c))
+
+
+def is_noop(op: Operation) -> bool:
+    return all(_is_retain(c) for c in op)
+
+
+def apply(doc: str, op: Operation) -> str:
+    if base_length(op) != len(doc):
+        raise OperationError(
+            f"Operation expects a document of length {base_length(op)}, got {len(doc)}"
+        )
+    parts = []
+    pos = 0
+    for c in op:
+        if isinstance(c, str):
+            parts.append(c)
+        elif c > 0:
+            parts.append(doc[pos:pos + c])
+            pos += c
+        else:
+            pos -= c
+    return "".join(parts)
+
+
+def _components(op: Operation) -> Iterator[Optional[Component]]:
+    yield from op
+    while True:
+        yield None
+
+
+def transform(a: Operation, b: Operation) -> Tuple[Operation, Operation]:
+    """
+    Transform two concurrent operations on the same document.
+
+    Returns (a', b') such that apply(apply(doc, a), b') == apply(apply(doc, b), a').
+    Where both insert at the same position, a's text goes first.
+    """
+    if base_length(a) != base_length(b):
+        raise OperationError("Concurrent operations must apply to the same document")
+
+    a_prime, b_prime = _Builder(), _Builder()
+    it_a, it_b = _components(a), _components(b)
+    op_a, op_b = next(it_a), next(it_b)
+
+    while op_a is not None or op_b is not None:
+        if isinstance(op_a, str):
+            a_prime.insert(op_a)
+            b_prime.retain(len(op_a))
+            op_a = next(it_a)
+            continue
+        if isinstance(op_b, str):
+            a_prime.retain(len(op_b))
+            b_prime.insert(op_b)
+            op_b = next(it_b)
+            continue
+
+        # Only retains and deletes left; equal base lengths keep both in step
+        n = min(abs(op_a), abs(op_b))
+        if _is_retain(op_a) and _is_retain(op_b):
+            a_prime.retain(n)
+            b_prime.retain(n)
+        elif _is_delete(op_a) and _is_retain(op_b):
+            a_prime.delete(n)
+        elif _is_retain(op_a) and _is_delete(op_b):
+            b_prime.delete(n)
+        # Both deleted the same text: nothing left to do on either side
+
+        op_a = _consume(op_a, n) or next(it_a)
+        op_b = _consume(op_b, n) or next(it_b)
+
+    return a_prime.ops, b_prime.ops
+
+
+def _consume(c: int, n: int) -> int:
+    """What is left of a retain/delete component after n characters"""
+    return c - n if c > 0 else c + n
+
+
+def from_diff(old: str, new: str) -> Operation:
+    """Single-splice operation turning `old` into `new` (common prefix and suffix kept)"""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < limit - prefix
+        and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]
+    ):
+        suffix += 1
+
+    builder = _Builder()
+    builder.retain(prefix)
+    builder.insert(new[prefix:len(new) - suffix])
+    builder.delete(len(old) - prefix - suffix)
+    builder.retain(suffix)
+    return builder.ops
@@ -0,0 +1,15 @@
+import pytest
+from fakeredis import aioredis
+
+import app.core.redis as core_redis
+from app.api import websocket as ws_api
+from app.services import session_relay as relay_module
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """In-memory Redis (with Lua) in place of the shared client, empty for each test"""
+    client = aioredis.FakeRedis(decode_responses=True)
+    for module in (core_redis, relay_module, ws_api):
+        monkeypatch.setattr(module, "redis_client", client)
+    return client
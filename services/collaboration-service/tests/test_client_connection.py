@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from app.api import websocket as ws_api
+from app.api.websocket import Session, broadcast_to_session, open_connection
+from app.core.config import settings
+
+
+class StalledSocket:
+    """WebSocket whose client has stopped reading"""
+
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+        self.close_code = None
+
+    async def send_text(self, data: str):
+        await self.release.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def test_stalled_client_does_not_delay_others():
+    """Test a broadcast returns at once and reaches fast clients while one is stalled"""
+    async def run():
+        session = Session("s1")
+        ws_api.active_sessions["s1"] = session
+        fast, slow = StalledSocket(), StalledSocket()
+        fast.release.set()
+        session.add_user("fast", open_connection("fast", fast))
+        session.add_user("slow", open_connection("slow", slow))
+        try:
+            await asyncio.wait_for(broadcast_to_session("s1", {"type": "chat_message", "text": "hi"}), 0.1)
+            await asyncio.sleep(0)
+            assert fast.sent == [{"type": "chat_message", "text": "hi"}]
+            assert slow.sent == []
+        finally:
+            del ws_api.active_sessions["s1"]
+            for user in session.users.values():
+                await user["connection"].close()
+
+    asyncio.run(run())
+
+
+def test_cursor_updates_coalesce_and_overflow_disconnects():
+    """Test queued cursor moves collapse to the latest, and a full queue closes the socket"""
+    async def run():
+        socket = StalledSocket()
+        connection = open_connection("u1", socket)
+        await asyncio.sleep(0)  # the writer takes the first message and stalls
+
+        connection.send_json({"type": "first"})
+        for column in range(3):
+            data = json.dumps({"type": "cursor_move", "user_id": "u2", "cursor": column})
+            connection.send(data, coalesce_key="cursor:u2")
+        assert connection.queue.qsize() == 2
+
+        socket.release.set()
+        await asyncio.sleep(0.01)
+        assert [m.get("cursor") for m in socket.sent] == [None, 2]
+
+        socket.release.clear()
+        connection.send_json({"type": "stalls"})
+        await asyncio.sleep(0)
+        for _ in range(settings.WS_SEND_QUEUE_SIZE + 1):
+            connection.send_json({"type": "code_update"})
+        await asyncio.sleep(0.01)
+        assert connection.closed.is_set()
+        assert socket.close_code == 1013
+
+    asyncio.run(run())
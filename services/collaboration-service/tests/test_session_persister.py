@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.session_persister import SessionPersister
+from app.services.session_relay import session_relay
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Records each save_state call instead of writing to Redis"""
+    monkeypatch.setattr(settings, "PERSIST_INTERVAL_MS", 50)
+    calls = []
+
+    async def save_state(session_id, snapshot, language, chat):
+        calls.append((snapshot, language, chat))
+
+    monkeypatch.setattr(session_relay, "save_state", save_state)
+    return calls
+
+
+def test_edits_within_the_interval_are_saved_once(saves):
+    """Test edits inside one PERSIST_INTERVAL_MS become a single write of the latest snapshot"""
+    async def run():
+        persister = SessionPersister("s1")
+        persister.save_code("", 0)
+        await persister.flush()
+        saves.clear()
+        for version in range(1, 4):
+            persister.save_code("x" * version, version)
+        persister.append_chat({"message": "hi"})
+        await asyncio.sleep(0.01)
+        assert saves == []
+
+        await asyncio.sleep(0.08)
+        assert saves == [(("xxx", 3), None, [{"message": "hi"}])]
+
+    asyncio.run(run())
+
+
+def test_flush_writes_at_once(saves):
+    """Test flush() does not wait for the timer"""
+    async def run():
+        persister = SessionPersister("s1")
+        persister.save_language("java")
+        await persister.flush()
+        assert saves == [(None, "java", [])]
+
+        await persister.close()
+        assert len(saves) == 1
+
+    asyncio.run(run())
+
+
+def test_failed_save_keeps_state_behind_newer_changes(saves, monkeypatch):
+    """Test a failed write is retried, with what changed meanwhile taking precedence"""
+    persister = SessionPersister("s1")
+    failures = []
+
+    async def save_state(session_id, snapshot, language, chat):
+        if not failures:
+            failures.append(snapshot)
+            # Newer changes arrive while the write is in flight
+            persister.save_code("new", 2)
+            persister.append_chat({"message": "second"})
+            raise ConnectionError("redis down")
+        saves.append((snapshot, language, chat))
+
+    monkeypatch.setattr(session_relay, "save_state", save_state)
+
+    async def run():
+        persister.save_code("old", 1)
+        persister.save_language("java")
+        persister.append_chat({"message": "first"})
+        await persister.flush()
+        assert failures == [("old", 1)] and saves == []
+
+        await asyncio.sleep(0.1)
+        assert saves == [(("new", 2), "java", [{"message": "first"}, {"message": "second"}])]
+        await persister.close()
+
+    asyncio.run(run())
+
+
+def test_close_without_flush_drops_pending_state(saves):
+    """Test close(flush=False) cancels the timer and writes nothing"""
+    async def run():
+        persister = SessionPersister("s1")
+        persister.save_code("x", 1)
+        persister.append_chat({"message": "hi"})
+        await persister.close(flush=False)
+        await asyncio.sleep(0.1)
+        assert saves == []
+
+        await persister.flush()
+        assert saves == []
+
+    asyncio.run(run())
@@ -0,0 +1,168 @@
+import asyncio
+import json
+from datetime import datetime
+
+from app.api import websocket as ws_api
+from app.api.websocket import Session, handle_relay_event
+from app.core.config import settings
+from app.services.session_relay import SessionRelay, operations_key, session_relay
+from app.utils.text_operation import apply
+
+
+def edit(version: int, user_id: str = "u1") -> dict:
+    """The edit committed as `version` on a document starting as "ab": appends "x" """
+    return {
+        "kind": "op",
+        "user_id": user_id,
+        "version": version,
+        "op": [1 + version, "x"],
+        "cursor": None,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+async def commit_edits(session_id: str, count: int):
+    await session_relay.load_document(session_id, "ab")
+    for version in range(1, count + 1):
+        assert await session_relay.commit_operation(session_id, version - 1, edit(version)) is None
+
+
+def test_stale_commit_returns_exactly_the_missed_edits(redis_client):
+    """Test a commit against an old version is refused with the edits made since"""
+    async def run():
+        await commit_edits("s1", 3)
+
+        snapshot, missed = await session_relay.commit_operation("s1", 1, edit(2, "u2"))
+
+        assert snapshot is None
+        assert [(e["version"], e["user_id"]) for e in missed] == [(2, "u1"), (3, "u1")]
+        assert await redis_client.hget("collab_doc:s1", "version") == "3"
+
+    asyncio.run(run())
+
+
+def test_trim_keeps_every_edit_after_the_snapshot(redis_client, monkeypatch):
+    """Test the operations list only drops edits already in the saved snapshot"""
+    monkeypatch.setattr(settings, "CODE_HISTORY_SIZE", 2)
+
+    async def run():
+        await commit_edits("s1", 4)
+        await session_relay.save_state("s1", ("abx", 1), None, [])
+        await session_relay.commit_operation("s1", 4, edit(5))
+        # Four edits follow the snapshot, more than CODE_HISTORY_SIZE: all kept
+        assert await redis_client.llen(operations_key("s1")) == 4
+        assert [e["version"] for e in (await session_relay.read_operations("s1", 1))[1]] == [2, 3, 4, 5]
+
+        await session_relay.save_state("s1", ("abxxxx", 4), None, [])
+        await session_relay.commit_operation("s1", 5, edit(6))
+        # Once the snapshot catches up, the list shrinks back to CODE_HISTORY_SIZE
+        assert await redis_client.llen(operations_key("s1")) == 2
+
+    asyncio.run(run())
+
+
+def test_read_from_scratch_returns_snapshot_and_later_edits(redis_client):
+    """Test read_operations(-1) rebuilds the document from the snapshot and the edits after it"""
+    async def run():
+        await commit_edits("s1", 3)
+        await session_relay.save_state("s1", ("abx", 1), "java", [])
+
+        snapshot, events = await session_relay.read_operations("s1", -1)
+
+        assert snapshot == ("abx", 1)
+        assert [e["version"] for e in events] == [2, 3]
+        code = snapshot[0]
+        for e in events:
+            code = apply(code, e["op"])
+        assert code == "abxxx"
+
+    asyncio.run(run())
+
+
+def make_session(monkeypatch) -> Session:
+    session = Session("s1")
+    session.reset_document("ab", 0)
+    monkeypatch.setitem(ws_api.active_sessions, "s1", session)
+    return session
+
+
+def test_own_committed_edit_is_not_applied_twice(redis_client, monkeypatch):
+    """Test the channel echo of an edit this replica committed changes nothing"""
+    session = make_session(monkeypatch)
+    delivered = []
+
+    async def broadcast(session_id, message, exclude_user_id=None):
+        delivered.append(message)
+
+    monkeypatch.setattr(ws_api, "broadcast_to_session", broadcast)
+
+    async def run():
+        await session_relay.load_document("s1", "ab")
+        event = edit(1)
+        assert await session_relay.commit_operation("s1", 0, event) is None
+        async with session.code_lock:
+            await ws_api.apply_operation_event(session, event)
+        delivered.clear()
+
+        await handle_relay_event("s1", event)
+
+        assert (session.code, session.version) == ("abx", 1)
+        assert delivered == []
+
+    asyncio.run(run())
+
+
+def test_version_gap_catches_up_from_redis(redis_client, monkeypatch):
+    """Test an edit arriving past a missed one makes the replica fetch what it missed"""
+    session = make_session(monkeypatch)
+    catch_ups = []
+    catch_up = ws_api.catch_up_document
+
+    async def spy(session):
+        catch_ups.append(session.version)
+        await catch_up(session)
+
+    monkeypatch.setattr(ws_api, "catch_up_document", spy)
+
+    async def run():
+        await commit_edits("s1", 3)
+
+        await handle_relay_event("s1", edit(3))
+
+        assert catch_ups == [0]
+        assert (session.code, session.version) == ("abxxx", 3)
+
+    asyncio.run(run())
+
+
+def test_busy_session_does_not_hold_up_other_sessions():
+    """Test events keep flowing to other sessions while one session's handler is stuck"""
+    async def run():
+        relay = SessionRelay()
+        release = asyncio.Event()
+        handled = []
+
+        async def on_event(session_id, event):
+            if session_id == "busy":
+                await release.wait()
+            handled.append((session_id, event["n"]))
+
+        relay.on_event = on_event
+        relay._joined.update({"busy", "free"})
+        for n in range(2):
+            relay._dispatch("busy", json.dumps({"n": n}))
+            relay._dispatch("free", json.dumps({"n": n}))
+        await asyncio.sleep(0.01)
+        assert handled == [("free", 0), ("free", 1)]
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert handled[2:] == [("busy", 0), ("busy", 1)]
+
+        await relay.leave("busy")
+        relay._dispatch("busy", json.dumps({"n": 2}))
+        await asyncio.sleep(0.01)
+        assert len(handled) == 4
+        await relay.close()
+
+    asyncio.run(run())
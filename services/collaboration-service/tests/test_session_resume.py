@@ -0,0 +1,38 @@
+from app.api.websocket import Session, sync_message
+from app.core.config import settings
+from app.utils.text_operation import apply
+
+
+def make_session(edits: int) -> Session:
+    session = Session("s1", "q1")
+    session.reset_document("ab", 0)
+    for i in range(edits):
+        session.apply_operation([2 + i, "x"], "u1" if i % 2 else "u2")
+    return session
+
+
+def test_resume_sends_only_missed_operations():
+    """Test a client at an older version gets just the edits after it"""
+    session = make_session(5)
+    session.chat = [{"text": "hi"}, {"text": "back"}]
+
+    resume = session.get_resume(3, chat_length=1)
+
+    assert resume["version"] == 5
+    assert [e["version"] for e in resume["ops"]] == [4, 5]
+    assert [e["user_id"] for e in resume["ops"]] == ["u1", "u2"]
+    assert resume["chat"] == [{"text": "back"}]
+    code = "abxxx"
+    for e in resume["ops"]:
+        code = apply(code, e["op"])
+    assert code == session.code
+
+
+def test_resume_falls_back_to_full_state():
+    """Test a version older than the kept history gets the whole session"""
+    session = make_session(settings.CODE_HISTORY_SIZE + 2)
+
+    assert session.get_resume(1) is None
+    assert sync_message(session, 1)["type"] == "session_state"
+    assert sync_message(session, None)["type"] == "session_state"
+    assert sync_message(session, session.version)["ops"] == []
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from app.utils.text_operation import (
+    OperationError, apply, from_diff, normalize, transform
+)
+
+
+def test_apply_insert_and_delete():
+    """Test applying an operation to a document"""
+    assert apply("abc", [1, "XY", -1, 1]) == "aXYc"
+
+
+def test_apply_rejects_wrong_length():
+    """Test an operation made for a different document is rejected"""
+    with pytest.raises(OperationError):
+        apply("abcd", [1, "XY", -1, 1])
+
+
+def test_normalize_merges_and_validates():
+    """Test client operations are merged and invalid components rejected"""
+    assert normalize([1, 2, "a", "b", -1, 0, -2]) == [3, "ab", -3]
+    with pytest.raises(OperationError):
+        normalize([1, None])
+    with pytest.raises(OperationError):
+        normalize("abc")
+
+
+def test_transform_concurrent_inserts_at_same_position():
+    """Test both orders converge and the first operation's insert wins the tie"""
+    a, b = [1, "A", 2], [1, "B", 2]
+    a_prime, b_prime = transform(a, b)
+    assert apply(apply("abc", a), b_prime) == apply(apply("abc", b), a_prime) == "aABbc"
+
+
+def test_transform_overlapping_deletes():
+    """Test text deleted by both users is only deleted once"""
+    a, b = [-2, 2], [1, -2, 1]
+    a_prime, b_prime = transform(a, b)
+    assert apply(apply("abcd", a), b_prime) == apply(apply("abcd", b), a_prime) == "d"
+
+
+def _random_operation(doc, rng):
+    op, pos = [], 0
+    while pos < len(doc):
+        n = rng.randint(1, len(doc) - pos)
+        kind = rng.random()
+        if kind < 0.4:
+            op.append(n)
+        elif kind < 0.7:
+            op.append(-n)
+        else:
+            op.append(rng.choice(["x", "yz", "\U0001F600"]))
+            continue
+        pos += n
+    if rng.random() < 0.5:
+        op.append("end")
+    return normalize(op)
+
+
+def test_transform_converges_on_random_edits():
+    """Test transform keeps documents in sync for arbitrary concurrent edits"""
+    rng = random.Random(3219)
+    for _ in range(2000):
+        doc = "".join(rng.choice("ab\n\U0001F600") for _ in range(rng.randint(0, 10)))
+        a, b = _random_operation(doc, rng), _random_operation(doc, rng)
+        a_prime, b_prime = transform(a, b)
+        assert apply(apply(doc, a), b_prime) == apply(apply(doc, b), a_prime)
+
+
+def test_from_diff_is_a_single_small_splice():
+    """Test a keystroke in a large document produces a small operation"""
+    doc = "x" * 5000
+    edited = doc[:2500] + "y" + doc[2500:]
+    op = from_diff(doc, edited)
+    assert apply(doc, op) == edited
+    assert op == [2500, "y", 2500]
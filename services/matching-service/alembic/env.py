@@ -12,8 +12,8 @@ from app.core.config import settings
 from app.core.database import Base
 
 # Import all models so Alembic can detect them
-from app.models.match_request import MatchRequest
-from app.models.match import Match
+from app.models.match_request import MatchRequest, MatchRequestArchive
+from app.models.match import Match, MatchArchive
 
 # this is the Alembic Config object
 config = context.config
@@ -0,0 +1,87 @@
+"""composite indexes and archive tables
+
+Revision ID: 8c1d2e4f6a90
+Revises: 37eefb9032c6
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d2e4f6a90'
+down_revision = '37eefb9032c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # match_requests: one composite index for the per-user pending lookups
+    # replaces the low-selectivity single-column ones
+    op.create_index('ix_match_requests_user_status_created', 'match_requests', ['user_id', 'status', 'created_at'], unique=False)
+    op.drop_index('ix_match_requests_user_id', table_name='match_requests')
+    op.drop_index('ix_match_requests_status', table_name='match_requests')
+    op.drop_index('ix_match_requests_difficulty', table_name='match_requests')
+    op.drop_index('ix_match_requests_topic', table_name='match_requests')
+
+    # matches had no secondary indexes at all
+    op.create_index('ix_matches_user1_created', 'matches', ['user1_id', 'created_at'], unique=False)
+    op.create_index('ix_matches_user2_created', 'matches', ['user2_id', 'created_at'], unique=False)
+    op.create_index('ix_matches_request1_id', 'matches', ['request1_id'], unique=False)
+    op.create_index('ix_matches_request2_id', 'matches', ['request2_id'], unique=False)
+    op.create_index(op.f('ix_matches_created_at'), 'matches', ['created_at'], unique=False)
+
+    # Archive tables; the enum types already exist from match_requests
+    op.create_table('match_requests_archive',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('difficulty', postgresql.ENUM('EASY', 'MEDIUM', 'HARD', name='difficultylevel', create_type=False), nullable=False),
+    sa.Column('topic', sa.String(), nullable=False),
+    sa.Column('status', postgresql.ENUM('PENDING', 'MATCHED', 'TIMEOUT', 'CANCELLED', name='matchstatus', create_type=False), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('matched_at', sa.DateTime(), nullable=True),
+    sa.Column('timeout_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_match_requests_archive_user_id', 'match_requests_archive', ['user_id'], unique=False)
+    op.create_index(op.f('ix_match_requests_archive_created_at'), 'match_requests_archive', ['created_at'], unique=False)
+    op.create_table('matches_archive',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('request1_id', sa.String(), nullable=False),
+    sa.Column('request2_id', sa.String(), nullable=False),
+    sa.Column('user1_id', sa.String(), nullable=False),
+    sa.Column('user2_id', sa.String(), nullable=False),
+    sa.Column('difficulty', sa.String(), nullable=False),
+    sa.Column('topic', sa.String(), nullable=False),
+    sa.Column('user1_confirmed', sa.Boolean(), nullable=True),
+    sa.Column('user2_confirmed', sa.Boolean(), nullable=True),
+    sa.Column('collaboration_session_id', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('confirmed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_matches_archive_created_at'), 'matches_archive', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_matches_archive_created_at'), table_name='matches_archive')
+    op.drop_table('matches_archive')
+    op.drop_index(op.f('ix_match_requests_archive_created_at'), table_name='match_requests_archive')
+    op.drop_index('ix_match_requests_archive_user_id', table_name='match_requests_archive')
+    op.drop_table('match_requests_archive')
+
+    op.drop_index(op.f('ix_matches_created_at'), table_name='matches')
+    op.drop_index('ix_matches_request2_id', table_name='matches')
+    op.drop_index('ix_matches_request1_id', table_name='matches')
+    op.drop_index('ix_matches_user2_created', table_name='matches')
+    op.drop_index('ix_matches_user1_created', table_name='matches')
+
+    op.create_index(op.f('ix_match_requests_topic'), 'match_requests', ['topic'], unique=False)
+    op.create_index(op.f('ix_match_requests_difficulty'), 'match_requests', ['difficulty'], unique=False)
+    op.create_index(op.f('ix_match_requests_status'), 'match_requests', ['status'], unique=False)
+    op.create_index(op.f('ix_match_requests_user_id'), 'match_requests', ['user_id'], unique=False)
+    op.drop_index('ix_match_requests_user_status_created', table_name='match_requests')
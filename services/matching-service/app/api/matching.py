@@ -1,12 +1,11 @@
 import asyncio
-import uuid, time
-import httpx
-from typing import Union, Optional, Dict
-from jose import jwt, JWTError, ExpiredSignatureError
-from fastapi import APIRouter, Depends, Header, Request, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+import time
+from typing import Union, Optional, Dict, Set
+from fastapi import APIRouter, Depends, Request, HTTPException, WebSocket, WebSocketDisconnect
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
-from app.core.auth import verify_token
+from app.core.auth import verify_token, decode_access_token
 from app.core.config import settings
 from app.core.redis import get_redis_client
 from app.schemas.matching import (
@@ -20,39 +19,177 @@ from app.schemas.matching import (
     EndSessionRequest,
 )
 from app.services.matching_service import matching_service
+from app.services.admission import AdmissionRejected
+from app.services.notifier import USER_CHANNEL_PREFIX, user_channel, notify_user
 from app.models.match_request import MatchRequest, MatchStatus
 from app.models.match import Match
 from app.clients.question_client import QuestionClient
 from shared.messaging.rabbitmq_client import RabbitMQClient
+from shared.websocket.connection import ClientConnection
 import json
-import traceback
+import logging
 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 router = APIRouter()
 qclient = QuestionClient()
 rabbit = RabbitMQClient()
+logger = logging.getLogger(__name__)
+
+# user_id -> session_id of the user's active collaboration session
+USER_SESSION_KEY_PREFIX = "user_session:"
+
+
+def _user_session_key(user_id: str) -> str:
+    return f"{USER_SESSION_KEY_PREFIX}{user_id}"
+
+PING_MESSAGE = json.dumps({"type": "ping"})
+
 
 # WebSocket connection manager for real-time updates
 class MatchingConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.active_connections: Dict[str, ClientConnection] = {}
+        # Server-sent event streams open on this replica, per user
+        self.streams: Dict[str, Set[asyncio.Queue]] = {}
+        self.pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, int] = {
+            "connections_opened": 0,
+            "dropped_messages": 0,
+            "slow_disconnects": 0,
+            "reaped_connections": 0,
+        }
+
+    async def _subscribe(self, user_id: str):
+        # Subscribe only for users connected to this replica
+        if self.pubsub is None:
+            from app.core.redis import redis_client
+            self.pubsub = redis_client.pubsub()
+        await self.pubsub.subscribe(user_channel(user_id))
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _unsubscribe_if_idle(self, user_id: str):
+        if user_id in self.active_connections or self.streams.get(user_id):
+            return
+        try:
+            await self.pubsub.unsubscribe(user_channel(user_id))
+        except Exception as e:
+            logger.warning(f"Failed to unsubscribe {user_id}: {e}")
     
-    async def connect(self, user_id: str, websocket: WebSocket):
+    async def connect(self, user_id: str, websocket: WebSocket) -> ClientConnection:
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        previous = self.active_connections.get(user_id)
+        connection = self.active_connections[user_id] = ClientConnection(
+            user_id,
+            websocket,
+            queue_size=settings.WS_SEND_QUEUE_SIZE,
+            send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+            slow_client_policy=settings.WS_SLOW_CLIENT_POLICY,
+            metrics=self.metrics,
+        )
+        self.metrics["connections_opened"] += 1
+        if previous is not None:
+            # Only the newest socket receives events; release the old one
+            await previous.close()
+        await self._subscribe(user_id)
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._ping_loop())
+        return connection
     
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    async def disconnect(self, user_id: str, websocket: Optional[WebSocket] = None):
+        connection = self.active_connections.get(user_id)
+        # A reconnect may already have replaced this socket; leave it subscribed
+        if connection is None or (websocket is not None and connection.websocket is not websocket):
+            return
+        del self.active_connections[user_id]
+        await connection.close()
+        await self._unsubscribe_if_idle(user_id)
+
+    async def open_stream(self, user_id: str) -> asyncio.Queue:
+        """Receive the user's events (JSON strings) on a local queue"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        self.streams.setdefault(user_id, set()).add(queue)
+        await self._subscribe(user_id)
+        return queue
+
+    async def close_stream(self, user_id: str, queue: asyncio.Queue):
+        queues = self.streams.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.streams[user_id]
+        await self._unsubscribe_if_idle(user_id)
     
     async def send_message(self, user_id: str, message: dict):
-        if user_id in self.active_connections:
+        """Deliver a message to the user's socket, whichever replica holds it"""
+        await notify_user(user_id, message)
+
+    def _deliver(self, user_id: str, data: str):
+        for queue in self.streams.get(user_id, ()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                self.metrics["dropped_messages"] += 1
+                logger.warning(f"Dropping event for slow stream of {user_id}")
+
+        connection = self.active_connections.get(user_id)
+        if connection is not None:
+            connection.send(data)
+
+    async def _listen(self):
+        while True:
             try:
-                await self.active_connections[user_id].send_json(message)
-            except:
-                self.disconnect(user_id)
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Matching pub/sub listener error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message and message["type"] == "message":
+                user_id = message["channel"][len(USER_CHANNEL_PREFIX):]
+                self._deliver(user_id, message["data"])
+
+    async def _ping_loop(self):
+        """Ping every socket and reap the ones that stopped answering"""
+        while self.active_connections:
+            await asyncio.sleep(settings.WS_PING_INTERVAL_SECONDS)
+            deadline = time.monotonic() - settings.WS_PING_INTERVAL_SECONDS - settings.WS_PONG_TIMEOUT_SECONDS
+            for user_id, connection in list(self.active_connections.items()):
+                if connection.last_seen < deadline:
+                    logger.info(f"Reaping unresponsive WebSocket of {user_id}")
+                    self.metrics["reaped_connections"] += 1
+                    await self.disconnect(user_id, connection.websocket)
+                else:
+                    connection.send(PING_MESSAGE)
+
+    def stats(self) -> dict:
+        """Connection counts and delivery counters for this replica"""
+        return {
+            "websocket_connections": len(self.active_connections),
+            "event_streams": sum(len(queues) for queues in self.streams.values()),
+            "queued_messages": sum(c.queue.qsize() for c in self.active_connections.values()),
+            **self.metrics,
+        }
+
+    async def close(self):
+        """Stop the listener and release the pub/sub connection"""
+        for task in (self._listener, self._heartbeat):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._listener = self._heartbeat = None
+        for connection in list(self.active_connections.values()):
+            await connection.close(code=1001)
+        self.active_connections.clear()
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
 
 manager = MatchingConnectionManager()
 
@@ -60,146 +197,37 @@ manager = MatchingConnectionManager()
 @router.post("/request", response_model=MatchRequestResponse)
 async def create_match_request(
     request: MatchRequestCreate,
-    background_tasks: BackgroundTasks,
     user: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new match request
-    User will be added to matching queue
+    User will be added to matching queue, which wakes the matcher
     """
     try:
-        match_request = matching_service.create_match_request(
+        match_request = await matching_service.create_match_request(
             db=db,
             user_id=user["user_id"],
             difficulty=request.difficulty,
             topic=request.topic
         )
         
-        # Start background task to find match
-        background_tasks.add_task(
-            find_match_async,
-            match_request.id,
-            user["user_id"]
-        )
-        
-        # Start timeout task
-        background_tasks.add_task(
-            handle_timeout_async,
-            match_request.id,
-            60  # 60 seconds timeout
-        )
-        
         return match_request
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-async def find_match_async(request_id: str, user_id: str):
-    """Background task to continuously search for matches"""
-    from app.core.database import SessionLocal
-    from app.core.config import settings
-    
-    db = SessionLocal()
-    try:
-        # Try to find match for up to 60 seconds
-        for _ in range(30):  # Check every 2 seconds
-            match = matching_service.find_and_create_match(db, request_id)
-            
-            if match:
-                # Notify both users via WebSocket
-                await manager.send_message(match.user1_id, {
-                    "type": "match_found",
-                    "match_id": match.id,
-                    "partner_id": match.user2_id,
-                    "difficulty": match.difficulty,
-                    "topic": match.topic
-                })
-                
-                await manager.send_message(match.user2_id, {
-                    "type": "match_found",
-                    "match_id": match.id,
-                    "partner_id": match.user1_id,
-                    "difficulty": match.difficulty,
-                    "topic": match.topic
-                })
-                
-                asyncio.create_task(confirm_timeout_task(match.id, settings.CONFIRM_MATCH_TIMEOUT_SECONDS))
-                break
-            
-            await asyncio.sleep(2)
-    finally:
-        db.close()
-
-async def confirm_timeout_task(match_id: str, timeout_seconds: int):
-    from app.core.database import SessionLocal
-    from app.models import Match, MatchRequest, MatchStatus
-    from app.utils.matching_queue import matching_queue
-
-    await asyncio.sleep(timeout_seconds)
-
-    db = SessionLocal()
-    try:
-        m = db.query(Match).filter(Match.id == match_id).first()
-        if not m:
-            return  # already cleaned up
-
-        # If not fully confirmed by now, expire & requeue both
-        if not (m.user1_confirmed and m.user2_confirmed):
-            # fetch original requests
-            r1 = db.query(MatchRequest).filter(MatchRequest.id == m.request1_id).first()
-            r2 = db.query(MatchRequest).filter(MatchRequest.id == m.request2_id).first()
-
-            for r in (r1, r2):
-                if r:
-                    r.status = MatchStatus.PENDING
-                    r.matched_at = None
-                    db.add(r)
-                    # put back into Redis queue
-                    difficulty_val = r.difficulty.value if hasattr(r.difficulty, "value") else r.difficulty
-                    matching_queue.add_to_queue(
-                        request_id=r.id,
-                        user_id=r.user_id,
-                        difficulty=difficulty_val,
-                        topic=r.topic
-                    )
-
-            # delete or mark match as expired; simplest is delete
-            db.delete(m)
-            db.commit()
-
-            # notify users over WS
-            try:
-                await manager.send_message(m.user1_id, {"type": "match_expired", "reason": "confirmation_timeout"})
-                await manager.send_message(m.user2_id, {"type": "match_expired", "reason": "confirmation_timeout"})
-            except Exception:
-                pass
-    finally:
-        db.close()
-
-
-async def handle_timeout_async(request_id: str, timeout_seconds: int):
-    """Handle match request timeout after specified seconds"""
-    from app.core.database import SessionLocal
-    
-    await asyncio.sleep(timeout_seconds)
-    
-    db = SessionLocal()
-    try:
-        matching_service.handle_timeout(db, request_id)
-        # Notify user via WebSocket here
-    finally:
-        db.close()
-
 @router.get("/requests/{request_id}/status", response_model=MatchRequestStatusResponse)
-def get_request_status(
+async def get_request_status(
     request_id: str,
     user: dict = Depends(verify_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     # Ensure the request exists and belongs to the caller
-    req = db.query(MatchRequest).filter(MatchRequest.id == request_id).first()
+    req = await db.get(MatchRequest, request_id)
     if not req or req.user_id != user["user_id"]:
         raise HTTPException(status_code=404, detail="Request not found")
 
@@ -209,23 +237,110 @@ def get_request_status(
 
     # If matched, fetch the match_id
     if req.status == MatchStatus.MATCHED:
-        m = db.query(Match).filter(
-            (Match.request1_id == request_id) | (Match.request2_id == request_id)
-        ).first()
+        m = await db.scalar(
+            select(Match)
+            .where((Match.request1_id == request_id) | (Match.request2_id == request_id))
+            .limit(1)
+        )
         if m:
             resp["match_id"] = m.id
 
     return resp
 
+# Events that end a request's status stream
+TERMINAL_EVENTS = {"match_timeout", "match_ready", "match_cancelled"}
+
+
+def _sse(data: str) -> str:
+    return f"data: {data}\n\n"
+
+
+async def _request_snapshot(request_id: str, user_id: str) -> Optional[dict]:
+    """Current state of a request (and its match), or None if it isn't the caller's"""
+    from app.core.database import SessionLocal
+
+    # Short-lived session: a stream must not hold a pooled connection
+    async with SessionLocal() as db:
+        req = await db.get(MatchRequest, request_id)
+        if not req or req.user_id != user_id:
+            return None
+        status_str = req.status.value if hasattr(req.status, "value") else str(req.status)
+        snapshot = {"type": "status", "status": status_str}
+        if req.status == MatchStatus.MATCHED:
+            m = await db.scalar(
+                select(Match)
+                .where((Match.request1_id == request_id) | (Match.request2_id == request_id))
+                .limit(1)
+            )
+            if m:
+                snapshot["match_id"] = m.id
+                snapshot["confirm_status"] = bool(m.user1_confirmed and m.user2_confirmed)
+                snapshot["session_id"] = m.collaboration_session_id
+    return snapshot
+
+
+@router.get("/requests/{request_id}/events")
+async def stream_request_events(
+    request_id: str,
+    user: dict = Depends(verify_token),
+):
+    """
+    Server-sent events for a match request, replacing status polling.
+
+    The first event is the current status snapshot; after that the stream
+    carries the same events as the WebSocket (match_found, partner_confirmed,
+    match_expired, match_ready, match_timeout, match_cancelled) and closes once the request
+    timed out, was cancelled, or its session is ready.
+    """
+    user_id = user["user_id"]
+    # Listen before reading the snapshot so no event falls in between
+    queue = await manager.open_stream(user_id)
+    try:
+        snapshot = await _request_snapshot(request_id, user_id)
+    except Exception:
+        await manager.close_stream(user_id, queue)
+        raise
+    if snapshot is None:
+        await manager.close_stream(user_id, queue)
+        raise HTTPException(status_code=404, detail="Request not found")
+
+    async def events():
+        try:
+            yield _sse(json.dumps(snapshot))
+            if snapshot["status"] in ("timeout", "cancelled") or snapshot.get("session_id"):
+                return
+
+            deadline = time.monotonic() + settings.STATUS_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=settings.STATUS_STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    # keep proxies from closing an idle stream
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(data)
+                event = json.loads(data)
+                # Events naming another of the user's requests don't end this one
+                if event.get("type") in TERMINAL_EVENTS and event.get("request_id", request_id) == request_id:
+                    return
+        finally:
+            await manager.close_stream(user_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.delete("/request/{request_id}")
 async def cancel_match_request(
     request_id: str,
     user: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Cancel a pending match request"""
     try:
-        matching_service.cancel_match_request(db, request_id, user["user_id"])
+        await matching_service.cancel_match_request(db, request_id, user["user_id"])
         return {"message": "Match request cancelled"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -235,14 +350,14 @@ async def cancel_match_request(
 async def confirm_match(
     confirmation: MatchConfirmRequest,
     user: dict = Depends(verify_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=True))
 ):
     """
     Confirm match and create collaboration session
     """
     try:
-        result = matching_service.confirm_match(
+        result = await matching_service.confirm_match(
             db=db,
             match_id=confirmation.match_id,
             user_id=user["user_id"],
@@ -251,6 +366,11 @@ async def confirm_match(
 
         # Service returns either a Match (confirmed path) or a dict like {"cancelled": True, "match_id": "..."}
         if isinstance(result, dict) and result.get("cancelled"):
+            await manager.send_message(result["partner_id"], {
+                "type": "match_expired",
+                "reason": "declined",
+                "match_id": result["match_id"],
+            })
             return {
                 "status": "cancelled",
                 "requeued_partner": True,
@@ -258,11 +378,24 @@ async def confirm_match(
             }
 
         match = result
-        print("user_1 ", match.user1_confirmed)
-        print("user_2 ", match.user2_confirmed)
+        logger.debug(
+            f"Match {match.id} confirmations: user1={match.user1_confirmed} user2={match.user2_confirmed}"
+        )
+
+        difficulty_val = (
+            match.difficulty.value
+            if hasattr(match.difficulty, "value")
+            else match.difficulty
+        )
+        # Forward the user's token to the question service
+        token = credentials.credentials if credentials else None
 
         # If not both confirmed yet, just return waiting status
         if not (match.user1_confirmed and match.user2_confirmed):
+            # Warm the question cache so the partner's confirmation doesn't wait on it
+            qclient.prefetch(difficulty=difficulty_val.lower(), topics=[match.topic], token=token)
+            partner_id = match.user2_id if match.user1_id == user["user_id"] else match.user1_id
+            await manager.send_message(partner_id, {"type": "partner_confirmed", "match_id": match.id})
             return JSONResponse(
                 status_code=200,
                 content={
@@ -272,78 +405,73 @@ async def confirm_match(
             )
 
         redis_client = await get_redis_client()
-        await rabbit.connect()
 
-        # Create session_id in DB if not already present
-        if not getattr(match, "session_id", None):
-            print("No session_id found. Creating one via matching_service...")
-            session_id = matching_service.create_and_store_session_id(db, match.id)
-            print("Session created and stored in DB:", session_id)
-        else:
-            session_id = match.session_id
-            print("Existing session_id found in DB:", session_id)
-        
-        # Check if session already exists in Redis
-        existing_session = await redis_client.get(session_id)
-        if not existing_session:
-            # Pick question based on match metadata
-            difficulty_val = (
-                match.difficulty.value
-                if hasattr(match.difficulty, "value")
-                else match.difficulty
-            )
-            topic_val = match.topic
-            # Forward the user's token to the question service
-            token = credentials.credentials if credentials else None
-            question = await qclient.pick_question(
-                difficulty=difficulty_val.lower(),
-                topics=[topic_val],
-                token=token
-            )
+        # Same session_id for both confirmers, however they interleave
+        session_id = match.collaboration_session_id or await matching_service.create_and_store_session_id(db, match.id)
 
-            # Initialize collaboration session in Redis
-            session_payload = {
-                "question": {
-                    "id": question["id"],
-                    "difficulty": question.get("difficulty"),
-                    "topics": question.get("topics", []),
-                    "title": question.get("title", "Untitled")
-                },
-                "code": "",
-                "language": "python",
-                "users": [match.user1_id, match.user2_id],
-            }
+        # Pick question based on match metadata
+        question = await qclient.pick_question(
+            difficulty=difficulty_val.lower(),
+            topics=[match.topic],
+            token=token
+        )
 
-            await redis_client.set(session_id, json.dumps(session_payload))
-            # debug: confirm it's stored
-            stored = await redis_client.get(session_id)
-            print("Session stored to Redis:", stored)
-        
-        else:
-            print("Session already exists in Redis")
-            # Session already exists in DB; retrieve from Redis
-            question = json.loads(existing_session).get("question")
-
-        # Publish match.found event (so collaboration-service consumer will create active session)
-        payload = {
-            "event_type": "match.found",
-            "version": 1,
-            "occurred_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "session_id": session_id,
+        # Initialize collaboration session in Redis
+        session_payload = {
             "question": {
-                "id": question.get("id"),
+                "id": question["id"],
                 "difficulty": question.get("difficulty"),
                 "topics": question.get("topics", []),
                 "title": question.get("title", "Untitled")
             },
-            "users": [{"user_id": match.user1_id}, {"user_id": match.user2_id}]
+            "code": "",
+            "language": "python",
+            "users": [match.user1_id, match.user2_id],
         }
 
-        await rabbit.publish_message(
-            exchange="matching.events",
-            routing_key="match.found",
-            message=payload
-        )
+        # One round trip: SET NX GET decides which confirmer bootstraps the
+        # session (and publishes), and hands the loser the winner's payload.
+        # The user -> session index is written by both; it is idempotent.
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(session_id, json.dumps(session_payload), nx=True, get=True, ex=settings.SESSION_TTL_SECONDS)
+            for uid in (match.user1_id, match.user2_id):
+                pipe.set(_user_session_key(uid), session_id, ex=settings.SESSION_INDEX_TTL_SECONDS)
+            existing_session, *_ = await pipe.execute()
+
+        if existing_session:
+            # Session already bootstrapped by the partner's confirmation
+            question = json.loads(existing_session).get("question") or question
+        else:
+            # Publish match.found event (so collaboration-service consumer will create active session)
+            payload = {
+                "event_type": "match.found",
+                "version": 1,
+                "occurred_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "session_id": session_id,
+                "question": session_payload["question"],
+                "users": [{"user_id": match.user1_id}, {"user_id": match.user2_id}]
+            }
+
+            try:
+                await rabbit.publish_message(
+                    exchange="matching.events",
+                    routing_key="match.found",
+                    message=payload
+                )
+            except Exception:
+                # Let a retried confirmation bootstrap (and publish) again, and
+                # don't leave /sessions/active pointing at the dropped session
+                await redis_client.delete(
+                    session_id, *(_user_session_key(uid) for uid in (match.user1_id, match.user2_id))
+                )
+                raise
+
+            for uid in (match.user1_id, match.user2_id):
+                await manager.send_message(uid, {
+                    "type": "match_ready",
+                    "match_id": match.id,
+                    "session_id": session_id,
+                })
 
         # Build response to caller
         partner_id = (
@@ -360,18 +488,17 @@ async def confirm_match(
         )
 
     except Exception as e:
-        print("Error confirming match:", e)
-        traceback.print_exc()
+        logger.exception(f"Error confirming match {confirmation.match_id}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/{match_id}/status")
-async def get_match_status(match_id: str, db: Session = Depends(get_db)):
+async def get_match_status(match_id: str, db: AsyncSession = Depends(get_db)):
     """
     Returns the confirmation + session status of a match.
     """
     # Fetch match from DB
-    match = db.query(Match).filter(Match.id == match_id).first()
+    match = await db.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
     
@@ -417,43 +544,29 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
     user_id = None
     try:
         # Decode with the *User Service* secret & settings
-        claims = jwt.decode(
-            token,
-            settings.AUTH_ACCESS_SECRET, # SAME value as user-service SECRET_KEY
-            algorithms=[settings.AUTH_ALGORITHM],
-            issuer=settings.AUTH_ISSUER,
-            options={"verify_aud": bool(settings.AUTH_AUDIENCE)},
-            audience=settings.AUTH_AUDIENCE,
-        )
-
-        # Must be an access token
-        if claims.get("type") != "access":
-            await websocket.close(code=4401)
-            return
+        claims = decode_access_token(token)
 
         # Get the canonical user id
-        user_id = claims.get("sub")
-        if not user_id:
-            await websocket.close(code=4401)
-            return
+        user_id = claims["sub"]
 
         # Accept the socket and register it
-        await manager.connect(user_id, websocket)
+        connection = await manager.connect(user_id, websocket)
 
-        # Keep alive / receive client messages if you need them
-        while True:
-            _ = await websocket.receive_json()
+        # Events are written by the connection's own task; here we only read
+        # client messages (pongs) until either side closes
+        await connection.serve()
+        await manager.disconnect(user_id, websocket)
 
-    except (ExpiredSignatureError, JWTError):
+    except HTTPException:
         # token invalid/expired
         try:
             await websocket.close(code=4401)
         finally:
             if user_id:
-                manager.disconnect(user_id)
+                await manager.disconnect(user_id, websocket)
     except WebSocketDisconnect:
         if user_id:
-            manager.disconnect(user_id)
+            await manager.disconnect(user_id, websocket)
     except Exception as e:
         # log the error if you wish
         print(f"WebSocket error: {e}")
@@ -461,26 +574,43 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
             await websocket.close(code=1011)
         finally:
             if user_id:
-                manager.disconnect(user_id)
+                await manager.disconnect(user_id, websocket)
+
+@router.get("/connections/stats")
+async def get_connection_stats():
+    """WebSocket / event-stream counts and delivery counters for this replica"""
+    return manager.stats()
 
 @router.get("/sessions/active", response_model=ActiveSessionResponse)
 async def get_active_session_for_user(
     user: dict = Depends(verify_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     redis_client = Depends(get_redis_client),
 ):
     """
     Return active collab session for this user.
     1. Try DB (normal flow)
-    2. If DB has nothing (e.g. service restarted), fall back to Redis scan
+    2. If DB has nothing (e.g. service restarted), fall back to the Redis user -> session index
     """
     user_id = user["user_id"]
 
-    # 1) try DB
-    query = db.query(Match).filter(
-        (Match.user1_id == user_id) | (Match.user2_id == user_id)
+    # 1) try DB: the user's latest match, one index seek per side
+    latest = union_all(*(
+        select(
+            select(Match.id, Match.created_at)
+            .where(column == user_id)
+            .order_by(Match.created_at.desc())
+            .limit(1)
+            .subquery()
+        )
+        for column in (Match.user1_id, Match.user2_id)
+    )).subquery()
+    match = await db.scalar(
+        select(Match)
+        .join(latest, Match.id == latest.c.id)
+        .order_by(latest.c.created_at.desc())
+        .limit(1)
     )
-    match = query.first()
 
     if match:
         # must be fully confirmed
@@ -503,31 +633,19 @@ async def get_active_session_for_user(
                     question=session_json.get("question", {}),
                 )
 
-    # 2) fallback: scan redis for any session that has this user
-    cursor = b"0"
+    # 2) fallback: user -> session index
     found_session: Optional[dict] = None
-    found_session_id: Optional[str] = None
-
-    while True:
-        cursor, keys = await redis_client.scan(cursor=cursor, match="*")
-        for key in keys:
-            raw = await redis_client.get(key)
-            if not raw:
-                continue
+    found_session_id = await redis_client.get(_user_session_key(user_id))
+    if found_session_id:
+        raw = await redis_client.get(found_session_id)
+        if raw:
             try:
                 obj = json.loads(raw)
             except json.JSONDecodeError:
-                continue
-
-            users = obj.get("users") or []
+                obj = {}
             # users in your redis payload are like ["user1", "user2"]
-            if user_id in users:
+            if user_id in (obj.get("users") or []):
                 found_session = obj
-                found_session_id = key.decode() if isinstance(key, bytes) else key
-                break
-
-        if found_session or cursor == b"0":
-            break
 
     if not found_session:
         raise HTTPException(status_code=404, detail="No active session")
@@ -546,7 +664,7 @@ async def get_active_session_for_user(
 async def leave_session(
     body: EndSessionRequest,
     user: dict = Depends(verify_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     redis_client = Depends(get_redis_client),
 ):
     session_id = body.session_id
@@ -570,7 +688,12 @@ async def leave_session(
     session_json["left_users"] = left_users
 
     # write back
-    await redis_client.set(session_id, json.dumps(session_json))
+    await redis_client.set(session_id, json.dumps(session_json), keepttl=True)
+
+    # drop the user's index entry unless it already points at a newer session
+    index_key = _user_session_key(user["user_id"])
+    if await redis_client.get(index_key) == session_id:
+        await redis_client.delete(index_key)
 
     # notify other user(s) over websocket
     for u in users:  # users now = remaining users
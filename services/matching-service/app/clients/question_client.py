@@ -1,8 +1,15 @@
-import os, random, aiohttp, asyncio
-from typing import List, Optional, Dict, Any
+import os, time, random, aiohttp, asyncio, logging
+from typing import List, Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
 
 QUESTION_BASE_URL = os.getenv("QUESTION_SERVICE_URL", "http://localhost:8003").rstrip("/")
 QUESTION_SERVICE_BASE_PATH = os.getenv("QUESTION_SERVICE_BASE_PATH", "/api/v1")
+# How long a cached candidate list is served before it is refreshed in the background
+QUESTION_CACHE_TTL_SECONDS = float(os.getenv("QUESTION_CACHE_TTL_SECONDS", "300"))
+QUESTION_POOL_SIZE = int(os.getenv("QUESTION_POOL_SIZE", "20"))
+
+CacheKey = Tuple[str, Tuple[str, ...]]
 
 class QuestionClient:
     """
@@ -10,10 +17,32 @@ class QuestionClient:
 
     This client is used by the Matching Service to request questions filtered
     by topic and difficulty when a match between two users is confirmed.
+    Candidates are cached per (difficulty, topics) and refreshed in the
+    background, so picking a question is normally an in-memory choice.
     """
     def __init__(self, base_url: str = QUESTION_BASE_URL):
         self.base_url = base_url
         self.base_path = QUESTION_SERVICE_BASE_PATH
+        self._session: Optional[aiohttp.ClientSession] = None
+        # (difficulty, topics) -> (fetched_at, candidates)
+        self._cache: Dict[CacheKey, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._refreshing: Dict[CacheKey, asyncio.Task] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Long-lived session so connections to the Question Service are reused"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=QUESTION_POOL_SIZE)
+            )
+        return self._session
+
+    async def close(self):
+        for task in self._refreshing.values():
+            task.cancel()
+        self._refreshing.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def _get(self, session, path, params, token=None, retries=2, timeout=3.0):
         attempt = 0
@@ -35,6 +64,69 @@ class QuestionClient:
                 await asyncio.sleep(0.3 * (attempt + 1))
                 attempt += 1
 
+    @staticmethod
+    def _cache_key(difficulty: Optional[str], topics: Optional[List[str]]) -> CacheKey:
+        return (difficulty or "", tuple(sorted(topics or [])))
+
+    @staticmethod
+    def _to_candidate(q: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": q.get("id") or q.get("question_id"),
+            "difficulty": q.get("difficulty"),
+            "topics": q.get("topics") or [],
+            "title": q.get("title") or q.get("name") or "Untitled"
+        }
+
+    async def _fetch_candidates(
+        self,
+        difficulty: Optional[str],
+        topics: Optional[List[str]],
+        token: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Download the candidate list for a filter and cache it"""
+        params = {}
+        if difficulty:
+            params["difficulty"] = difficulty  # expects "easy|medium|hard"
+        if topics:
+            params["topics"] = topics          # FastAPI accepts repeated params
+
+        data = await self._get(self._get_session(), "/questions/filter/topics-difficulty", params, token=token)
+
+        # Admin tokens also list inactive questions; never hand those out
+        candidates = [self._to_candidate(q) for q in data or [] if q.get("is_active", True)]
+        if candidates:
+            self._cache[self._cache_key(difficulty, topics)] = (time.monotonic(), candidates)
+        return candidates
+
+    def _refresh_in_background(self, difficulty, topics, token):
+        key = self._cache_key(difficulty, topics)
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                await self._fetch_candidates(difficulty, topics, token)
+            except Exception as e:
+                # keep serving the stale list; the next pick retries
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def prefetch(self, difficulty: Optional[str], topics: Optional[List[str]], token: Optional[str] = None):
+        """Warm the cache for a filter ahead of pick_question (no-op while the cache is fresh)"""
+        cached = self._cache.get(self._cache_key(difficulty, topics))
+        if not cached or time.monotonic() - cached[0] > QUESTION_CACHE_TTL_SECONDS:
+            self._refresh_in_background(difficulty, topics, token)
+
+    def invalidate(self, difficulty: Optional[str] = None, topics: Optional[List[str]] = None):
+        """Drop cached candidates for one filter, or all of them when called without arguments"""
+        if difficulty is None and topics is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(self._cache_key(difficulty, topics), None)
+
     async def pick_question(
         self,
         difficulty: Optional[str],
@@ -45,22 +137,16 @@ class QuestionClient:
         Select a random question from the Question Service that matches
         the given difficulty and/or topic filters.
         """
-        params = {}
-        if difficulty:
-            params["difficulty"] = difficulty  # expects "easy|medium|hard"
-        if topics:
-            params["topics"] = topics          # FastAPI accepts repeated params
-
-        async with aiohttp.ClientSession() as session:
-            data = await self._get(session, "/questions/filter/topics-difficulty", params, token=token)
+        cached = self._cache.get(self._cache_key(difficulty, topics))
+        if cached:
+            fetched_at, candidates = cached
+            if time.monotonic() - fetched_at > QUESTION_CACHE_TTL_SECONDS:
+                self._refresh_in_background(difficulty, topics, token)
+        else:
+            # Cache miss: fall back to a direct request
+            candidates = await self._fetch_candidates(difficulty, topics, token)
 
-        if not data:
+        if not candidates:
             raise RuntimeError("No questions available for the given filters.")
 
-        chosen = random.choice(data)
-        return {
-            "id": chosen.get("id") or chosen.get("question_id"),
-            "difficulty": chosen.get("difficulty"),
-            "topics": chosen.get("topics") or [],
-            "title": chosen.get("title") or chosen.get("name") or "Untitled"
-        }
+        return dict(random.choice(candidates))
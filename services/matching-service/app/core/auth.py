@@ -1,19 +1,68 @@
 # app/core/auth.py
-from typing import Optional, Dict
-import os, requests
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+import os, time, logging
+import httpx
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import jwt, JWTError, ExpiredSignatureError
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer(auto_error=True)
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:8001").rstrip("/")
 USER_SERVICE_VERIFY_PATH = os.getenv("USER_SERVICE_VERIFY_PATH", "/users/me")
 TIMEOUT = float(os.getenv("AUTH_HTTP_TIMEOUT", "5"))
 
-def _verify_with_user_service(token: str) -> Optional[Dict]:
+# token -> (principal, expires_at); most recently used last
+_principal_cache: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def decode_access_token(token: str) -> Dict:
+    """Verify an access token locally with the secret shared with user-service"""
+    try:
+        claims = jwt.decode(
+            token,
+            settings.AUTH_ACCESS_SECRET, # SAME value as user-service SECRET_KEY
+            algorithms=[settings.AUTH_ALGORITHM],
+            issuer=settings.AUTH_ISSUER,
+            options={"verify_aud": bool(settings.AUTH_AUDIENCE)}, # stays False if not set
+            audience=settings.AUTH_AUDIENCE,
+        )
+    except ExpiredSignatureError:
+        raise _unauthorized("Token expired")
+    except JWTError:
+        raise _unauthorized("Invalid authentication credentials")
+
+    # Must be an access token, not refresh
+    if claims.get("type") != "access":
+        raise _unauthorized("Wrong token type")
+
+    # Pull the user id from 'sub'
+    if not claims.get("sub"):
+        raise _unauthorized("Token missing user id")
+
+    return claims
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(base_url=USER_SERVICE_URL, timeout=TIMEOUT)
+    return _http_client
+
+
+async def _verify_with_user_service(token: str) -> Optional[Dict]:
+    """Ask user-service whether the token is still accepted (e.g. not revoked)"""
     headers = {"Authorization": f"Bearer {token}"}
-    url = f"{USER_SERVICE_URL}{USER_SERVICE_VERIFY_PATH}"
     try:
-        r = requests.get(url, headers=headers, timeout=TIMEOUT)
+        r = await _get_http_client().get(USER_SERVICE_VERIFY_PATH, headers=headers)
         if r.status_code == 200:
             data = r.json() or {}
             # user-service /users/me returns `id`, so accept that
@@ -22,12 +71,54 @@ def _verify_with_user_service(token: str) -> Optional[Dict]:
                 return {"user_id": uid}
         elif r.status_code in (401, 403):
             return None
-    except requests.RequestException as e:
-        print(f"[auth] user-service error: {e}")
+    except httpx.HTTPError as e:
+        logger.error(f"[auth] user-service error: {e}")
     return None
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
-    user = _verify_with_user_service(credentials.credentials)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate":"Bearer"})
+
+def _cache_get(token: str) -> Optional[Dict]:
+    entry = _principal_cache.get(token)
+    if entry is None:
+        return None
+    principal, expires_at = entry
+    if expires_at <= time.time():
+        _principal_cache.pop(token, None)
+        return None
+    _principal_cache.move_to_end(token)
+    return principal
+
+
+def _cache_put(token: str, principal: Dict, expires_at: float):
+    _principal_cache[token] = (principal, expires_at)
+    _principal_cache.move_to_end(token)
+    while len(_principal_cache) > settings.AUTH_CACHE_MAX_ENTRIES:
+        _principal_cache.popitem(last=False)
+
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    token = credentials.credentials
+    user = _cache_get(token)
+    if user:
+        return user
+
+    claims = decode_access_token(token)
+    user = {"user_id": claims["sub"], "claims": claims}
+    # Tokens without exp are verified on every call rather than cached forever
+    expires_at = float(claims.get("exp") or 0)
+
+    if settings.AUTH_REVOCATION_CHECK:
+        if not await _verify_with_user_service(token):
+            raise _unauthorized("Invalid or expired token")
+        # Re-check revocation periodically instead of trusting the token until exp
+        expires_at = min(expires_at, time.time() + settings.AUTH_REVOCATION_CHECK_INTERVAL_SECONDS)
+
+    if expires_at:
+        _cache_put(token, user, expires_at)
     return user
+
+
+async def close_auth_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -1,10 +1,18 @@
-import json
-from redis.asyncio import Redis
+from redis.asyncio import ConnectionPool, Redis
+from app.core.config import settings
 
-redis_client = None
+# One connection pool per process, shared by the matching queue and the
+# collaboration-session store
+redis_pool = ConnectionPool.from_url(
+    settings.REDIS_URL,
+    decode_responses=True,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+)
+redis_client = Redis(connection_pool=redis_pool)
 
 async def get_redis_client() -> Redis:
-    global redis_client
-    if not redis_client:
-        redis_client = Redis.from_url("redis://redis:6379", decode_responses=True)
     return redis_client
+
+async def close_redis_client():
+    await redis_client.aclose()
+    await redis_pool.disconnect()
@@ -34,23 +34,35 @@ async def lifespan(app: FastAPI):
     logger.info(f"Matching Timeout: {settings.MATCHING_TIMEOUT_SECONDS}s")
     logger.info("=" * 50)
 
-    # Test DB connection (sync engine example)
+    # Test DB connection
     try:
+        from sqlalchemy import text
         from app.core.database import engine
-        # If you are using ASYNC engine, use: async with engine.begin() as conn: await conn.run_sync(lambda _: None)
-        with engine.connect() as conn:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
             logger.info("✓ Database connection successful")
     except Exception as e:
         logger.error(f"✗ Database connection failed: {e}")
 
     # Test Redis
     try:
-        from app.utils.matching_queue import matching_queue
-        matching_queue.redis_client.ping()
+        from app.core.redis import redis_client
+        await redis_client.ping()
         logger.info("✓ Redis connection successful")
     except Exception as e:
         logger.error(f"✗ Redis connection failed: {e}")
 
+    # Start the matcher and deadline poller, unless a separate
+    # matcher worker (run_matcher.py) owns them
+    if settings.EMBEDDED_MATCHER:
+        try:
+            from app.worker import start_matching
+            await start_matching()
+        except Exception as e:
+            logger.error(f"✗ Matcher failed to start: {e}")
+    else:
+        logger.info("Matching runs in a separate worker (EMBEDDED_MATCHER=false)")
+
     # yield control to application runtime
     try:
         yield
@@ -58,18 +70,44 @@ async def lifespan(app: FastAPI):
         # SHUTDOWN
         logger.info("Shutting down PeerPrep Matching Service")
 
+        # Stop matcher and deadline poller
+        if settings.EMBEDDED_MATCHER:
+            from app.worker import stop_matching
+            await stop_matching()
+
+        # Stop WebSocket fan-out listener
+        try:
+            from app.api.matching import manager
+            await manager.close()
+        except Exception as e:
+            logger.error(f"Error closing WebSocket fan-out: {e}")
+
+        # Close Question Service HTTP session
+        try:
+            from app.api.matching import qclient
+            await qclient.close()
+        except Exception as e:
+            logger.error(f"Error closing question client: {e}")
+
+        # Close user-service HTTP client
+        try:
+            from app.core.auth import close_auth_client
+            await close_auth_client()
+        except Exception as e:
+            logger.error(f"Error closing auth client: {e}")
+
         # Close DB
         try:
             from app.core.database import engine
-            engine.dispose()
+            await engine.dispose()
             logger.info("✓ Database connections closed")
         except Exception as e:
             logger.error(f"Error closing database: {e}")
 
         # Close Redis
         try:
-            from app.utils.matching_queue import matching_queue
-            matching_queue.redis_client.close()
+            from app.core.redis import close_redis_client
+            await close_redis_client()
             logger.info("✓ Redis connections closed")
         except Exception as e:
             logger.error(f"Error closing Redis: {e}")
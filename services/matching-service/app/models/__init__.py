@@ -1,9 +1,11 @@
-from app.models.match_request import MatchRequest, MatchStatus, DifficultyLevel
-from app.models.match import Match
+from app.models.match_request import MatchRequest, MatchRequestArchive, MatchStatus, DifficultyLevel
+from app.models.match import Match, MatchArchive
 
 __all__ = [
     "MatchRequest",
+    "MatchRequestArchive",
     "MatchStatus",
     "DifficultyLevel",
-    "Match"
+    "Match",
+    "MatchArchive"
 ]
\ No newline at end of file
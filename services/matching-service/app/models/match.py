@@ -1,11 +1,10 @@
-from sqlalchemy import Column, String, DateTime, Boolean
+from sqlalchemy import Column, String, DateTime, Boolean, Index
 from sqlalchemy.sql import func
 from datetime import datetime
 from app.core.database import Base
 
-class Match(Base):
-    __tablename__ = "matches"
-    
+class MatchColumns:
+    """Columns shared by the hot table and its archive"""
     id = Column(String, primary_key=True)
     request1_id = Column(String, nullable=False)
     request2_id = Column(String, nullable=False)
@@ -21,5 +20,22 @@ class Match(Base):
     # Session info
     collaboration_session_id = Column(String, nullable=True)
     
-    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
-    confirmed_at = Column(DateTime(timezone=True), nullable=True)
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+    confirmed_at = Column(DateTime(timezone=True), nullable=True)
+
+class Match(MatchColumns, Base):
+    __tablename__ = "matches"
+    __table_args__ = (
+        # Latest match per user, looked up from either side
+        Index("ix_matches_user1_created", "user1_id", "created_at"),
+        Index("ix_matches_user2_created", "user2_id", "created_at"),
+        # Match for a request (status / SSE endpoints)
+        Index("ix_matches_request1_id", "request1_id"),
+        Index("ix_matches_request2_id", "request2_id"),
+    )
+
+class MatchArchive(MatchColumns, Base):
+    """Old matches moved out of matches by the archiver"""
+    __tablename__ = "matches_archive"
+
+    archived_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, DateTime, Index, Enum as SQLEnum
+from sqlalchemy.sql import func
 from datetime import datetime
 from app.core.database import Base
 import enum
@@ -14,14 +15,29 @@ class MatchStatus(str, enum.Enum):
     TIMEOUT = "timeout"
     CANCELLED = "cancelled"
 
-class MatchRequest(Base):
-    __tablename__ = "match_requests"
-    
+class MatchRequestColumns:
+    """Columns shared by the hot table and its archive"""
     id = Column(String, primary_key=True)
-    user_id = Column(String, nullable=False, index=True)
-    difficulty = Column(SQLEnum(DifficultyLevel), nullable=False, index=True)
-    topic = Column(String, nullable=False, index=True)
-    status = Column(SQLEnum(MatchStatus), default=MatchStatus.PENDING, index=True)
+    user_id = Column(String, nullable=False)
+    difficulty = Column(SQLEnum(DifficultyLevel), nullable=False)
+    topic = Column(String, nullable=False)
+    status = Column(SQLEnum(MatchStatus), default=MatchStatus.PENDING)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     matched_at = Column(DateTime, nullable=True)
-    timeout_at = Column(DateTime, nullable=True)
\ No newline at end of file
+    timeout_at = Column(DateTime, nullable=True)
+
+class MatchRequest(MatchRequestColumns, Base):
+    __tablename__ = "match_requests"
+    __table_args__ = (
+        # Per-user pending lookups in create_match_request
+        Index("ix_match_requests_user_status_created", "user_id", "status", "created_at"),
+    )
+
+class MatchRequestArchive(MatchRequestColumns, Base):
+    """Finished requests moved out of match_requests by the archiver"""
+    __tablename__ = "match_requests_archive"
+    __table_args__ = (
+        Index("ix_match_requests_archive_user_id", "user_id"),
+    )
+
+    archived_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
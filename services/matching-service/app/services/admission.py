@@ -0,0 +1,96 @@
+import math
+import time
+
+from app.core.config import settings
+from app.core.redis import redis_client
+
+# Sorted set of admitted, still-pending requests across all replicas:
+# member = request_id, score = admission time (epoch seconds)
+ACTIVE_REQUESTS_KEY = "matching_active_requests"
+# Hash per user: {"tokens", "ts"} token bucket for POST /request
+RATE_LIMIT_KEY_PREFIX = "matching_rate:"
+
+# KEYS[1] = active requests key, KEYS[2] = user's token bucket
+# ARGV[1] = now, ARGV[2] = request_id, ARGV[3] = max active requests,
+# ARGV[4] = drop members admitted before this time (leaked slots),
+# ARGV[5] = refill rate in tokens/second (0 disables), ARGV[6] = bucket size
+# Returns {"ok"} or {reason, retry_after_seconds}. Capacity is checked
+# first, so a request turned away as busy doesn't cost the user a token.
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return {'busy'}
+end
+local rate = tonumber(ARGV[5])
+if rate > 0 then
+    local burst = tonumber(ARGV[6])
+    local bucket = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        return {'rate_limited', tostring((1 - tokens) / rate)}
+    end
+    redis.call('HSET', KEYS[2], 'tokens', tokens - 1, 'ts', now)
+    redis.call('EXPIRE', KEYS[2], math.ceil(burst / rate) + 1)
+end
+redis.call('ZADD', KEYS[1], now, ARGV[2])
+return {'ok'}
+"""
+
+
+class AdmissionRejected(Exception):
+    """Raised when a match request is refused; carries the Retry-After hint"""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """
+    Cluster-wide admission control for match requests.
+
+    Every pending request holds a slot in one Redis sorted set, capped at
+    MAX_CONCURRENT_MATCHES, and each user may additionally be limited by a
+    token bucket. Both checks run in one script before any DB work is done.
+    """
+
+    def __init__(self):
+        self.redis_client = redis_client
+        self._admit = self.redis_client.register_script(ADMIT_SCRIPT)
+
+    @staticmethod
+    def _slot_lifetime() -> float:
+        # A pending request is timed out well before this; older slots leaked
+        return settings.MATCHING_TIMEOUT_SECONDS * 2 + settings.CONFIRM_MATCH_TIMEOUT_SECONDS
+
+    async def admit(self, user_id: str, request_id: str):
+        """Take a slot for a new request, or raise AdmissionRejected"""
+        now = time.time()
+        rate = settings.USER_RATE_LIMIT_PER_MINUTE / 60
+        result = await self._admit(
+            keys=[ACTIVE_REQUESTS_KEY, f"{RATE_LIMIT_KEY_PREFIX}{user_id}"],
+            args=[now, request_id, settings.MAX_CONCURRENT_MATCHES,
+                  now - self._slot_lifetime(), rate, settings.USER_RATE_LIMIT_BURST],
+            client=self.redis_client,
+        )
+        if result[0] == "rate_limited":
+            raise AdmissionRejected("Too many match requests, slow down", float(result[1]))
+        if result[0] == "busy":
+            raise AdmissionRejected("Matching is at capacity, try again shortly", settings.ADMISSION_RETRY_AFTER_SECONDS)
+
+    async def readmit(self, *request_ids: str):
+        """Give requeued requests their slot back (they were admitted before)"""
+        if request_ids:
+            now = time.time()
+            await self.redis_client.zadd(ACTIVE_REQUESTS_KEY, {r: now for r in request_ids})
+
+    async def release(self, *request_ids: str):
+        """Free the slots of requests that stopped waiting"""
+        if request_ids:
+            await self.redis_client.zrem(ACTIVE_REQUESTS_KEY, *request_ids)
+
+
+admission = AdmissionController()
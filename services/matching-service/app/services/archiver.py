@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.match_request import MatchRequest, MatchRequestArchive, MatchStatus
+from app.models.match import Match, MatchArchive
+
+logger = logging.getLogger(__name__)
+
+
+class MatchArchiver:
+    """
+    Moves finished history out of the hot tables.
+
+    Requests that are no longer pending and matches older than
+    ARCHIVE_AFTER_DAYS are copied to the *_archive tables and deleted, in
+    batches of ARCHIVE_BATCH_SIZE, so the per-user lookups on the hot tables
+    stay the same size however much history accumulates. Rows are claimed
+    with SKIP LOCKED, so several workers can run the job at once.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the periodic archival job on the running loop"""
+        if self._task is None and settings.ARCHIVE_AFTER_DAYS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        from app.core.database import SessionLocal
+
+        while True:
+            try:
+                async with SessionLocal() as db:
+                    requests, matches = await self.archive_once(db)
+                if requests or matches:
+                    logger.info(f"Archived {requests} match request(s) and {matches} match(es)")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Match archival failed")
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+    async def archive_once(self, db: AsyncSession):
+        """Archive everything currently eligible; returns (requests, matches) moved"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+        requests = await self._drain(
+            db, MatchRequest, MatchRequestArchive,
+            # match_requests.created_at is a naive UTC timestamp
+            MatchRequest.status != MatchStatus.PENDING,
+            MatchRequest.created_at < cutoff.replace(tzinfo=None),
+        )
+        matches = await self._drain(db, Match, MatchArchive, Match.created_at < cutoff)
+        return requests, matches
+
+    async def _drain(self, db: AsyncSession, model, archive_model, *conditions) -> int:
+        moved = 0
+        while True:
+            n = await self._move_batch(db, model, archive_model, *conditions)
+            moved += n
+            if n < settings.ARCHIVE_BATCH_SIZE:
+                return moved
+
+    @staticmethod
+    async def _move_batch(db: AsyncSession, model, archive_model, *conditions) -> int:
+        """Copy one batch of rows to the archive table and delete them, in one transaction"""
+        ids = (await db.scalars(
+            select(model.id)
+            .where(*conditions)
+            .order_by(model.created_at)
+            .limit(settings.ARCHIVE_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not ids:
+            await db.rollback()
+            return 0
+
+        columns = [c.name for c in model.__table__.columns]
+        await db.execute(
+            insert(archive_model).from_select(
+                columns, select(*model.__table__.columns).where(model.id.in_(ids))
+            )
+        )
+        await db.execute(delete(model).where(model.id.in_(ids)))
+        await db.commit()
+        return len(ids)
+
+
+archiver = MatchArchiver()
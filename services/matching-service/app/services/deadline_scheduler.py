@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of pending deadlines: member = "{kind}:{item_id}", score = due time (epoch seconds)
+DEADLINES_KEY = "matching_deadlines"
+
+# Deadline kinds
+REQUEST_TIMEOUT = "request_timeout"
+CONFIRM_TIMEOUT = "confirm_timeout"
+REQUEST_RELAX = "request_relax"
+
+# Sorted set of claimed deadlines: same members, score = lease expiry.
+# A member leaves it only once its handler has finished.
+INFLIGHT_KEY = "matching_deadlines_inflight"
+
+# KEYS[1] = deadlines key, KEYS[2] = in-flight key
+# ARGV[1] = now, ARGV[2] = max batch size, ARGV[3] = lease expiry
+# Puts expired leases (a poller that died mid-batch) back as due, unless
+# they were rescheduled meanwhile, then moves due deadlines into the
+# in-flight set under a new lease. Each deadline is claimed by one poller
+# at a time even when several replicas are running.
+CLAIM_DUE_SCRIPT = """
+local unpack = unpack or table.unpack
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, member in ipairs(expired) do
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[1], member)
+    redis.call('ZREM', KEYS[2], member)
+end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    redis.call('ZADD', KEYS[2], ARGV[3], member)
+end
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+# KEYS[1] = deadlines key, KEYS[2] = in-flight key
+# ARGV[1] = lease expiry, ARGV[2] = retry time ('' to drop), ARGV[3..] = members
+# Ends the lease on members still held under ARGV[1]. A lease that already
+# expired and was reclaimed, or a deadline cancelled meanwhile, is left
+# alone. Retries never overwrite a deadline rescheduled during the handler.
+RELEASE_SCRIPT = """
+local lease = tonumber(ARGV[1])
+local released = 0
+for i = 3, #ARGV do
+    local score = redis.call('ZSCORE', KEYS[2], ARGV[i])
+    if score and tonumber(score) == lease then
+        redis.call('ZREM', KEYS[2], ARGV[i])
+        if ARGV[2] ~= '' then
+            redis.call('ZADD', KEYS[1], 'NX', ARGV[2], ARGV[i])
+        end
+        released = released + 1
+    end
+end
+return released
+"""
+
+BatchHandler = Callable[[List[str]], Awaitable[None]]
+
+
+class DeadlineScheduler:
+    """
+    Persistent deadline scheduler for match and confirmation timeouts.
+
+    Deadlines live in a Redis sorted set instead of sleeping coroutines, so
+    they survive restarts and cost one set member each. A single poller per
+    process claims due deadlines in batches and hands them to the handler
+    registered for their kind, one call per kind per batch.
+
+    Claiming leases a deadline rather than removing it: it is only deleted
+    after its handler succeeds, and comes back due if the lease runs out
+    first, so a crash mid-batch delays deadlines instead of losing them.
+    Handlers must therefore tolerate seeing an item twice.
+    """
+
+    def __init__(self):
+        self.redis_client = redis_client
+        self._claim_due = self.redis_client.register_script(CLAIM_DUE_SCRIPT)
+        self._release = self.redis_client.register_script(RELEASE_SCRIPT)
+        self._handlers: Dict[str, BatchHandler] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, kind: str, handler: BatchHandler):
+        """Register the batch handler called with the item ids of due deadlines"""
+        self._handlers[kind] = handler
+
+    @staticmethod
+    def _member(kind: str, item_id: str) -> str:
+        return f"{kind}:{item_id}"
+
+    async def schedule(self, kind: str, item_id: str, delay_seconds: float):
+        """Schedule (or reschedule) a deadline `delay_seconds` from now"""
+        due = time.time() + delay_seconds
+        await self.redis_client.zadd(DEADLINES_KEY, {self._member(kind, item_id): due})
+
+    async def schedule_many(self, kind: str, item_ids: List[str], delay_seconds: float):
+        """Schedule the same deadline for several items in one round trip"""
+        if item_ids:
+            due = time.time() + delay_seconds
+            await self.redis_client.zadd(DEADLINES_KEY, {self._member(kind, i): due for i in item_ids})
+
+    async def cancel(self, kind: str, *item_ids: str):
+        """Drop deadlines that no longer need to fire"""
+        if item_ids:
+            members = [self._member(kind, i) for i in item_ids]
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.zrem(DEADLINES_KEY, *members)
+                pipe.zrem(INFLIGHT_KEY, *members)
+                await pipe.execute()
+
+    async def start(self):
+        """Start the poller on the running loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the poller; unclaimed deadlines stay in Redis for the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Deadline poller failed")
+                claimed = 0
+
+            # A full batch means more may already be due
+            if claimed < settings.DEADLINE_BATCH_SIZE:
+                await asyncio.sleep(settings.DEADLINE_POLL_INTERVAL_SECONDS)
+
+    async def poll_once(self) -> int:
+        """Claim and fire one batch of due deadlines; returns how many were claimed"""
+        now = time.time()
+        lease = now + settings.DEADLINE_LEASE_SECONDS
+        due = await self._claim_due(
+            keys=[DEADLINES_KEY, INFLIGHT_KEY],
+            args=[now, settings.DEADLINE_BATCH_SIZE, lease],
+            client=self.redis_client,
+        )
+        if not due:
+            return 0
+
+        by_kind: Dict[str, List[str]] = defaultdict(list)
+        for member in due:
+            kind, _, item_id = member.partition(":")
+            by_kind[kind].append(item_id)
+
+        for kind, item_ids in by_kind.items():
+            handler = self._handlers.get(kind)
+            retry_at = ""
+            if handler is None:
+                logger.warning(f"No handler for {len(item_ids)} '{kind}' deadline(s); dropping")
+            else:
+                try:
+                    await handler(item_ids)
+                except Exception:
+                    logger.exception(f"Handler for '{kind}' failed; retrying {len(item_ids)} deadline(s)")
+                    retry_at = time.time() + settings.DEADLINE_RETRY_DELAY_SECONDS
+            await self._release(
+                keys=[DEADLINES_KEY, INFLIGHT_KEY],
+                args=[lease, retry_at, *(self._member(kind, i) for i in item_ids)],
+                client=self.redis_client,
+            )
+
+        return len(due)
+
+deadline_scheduler = DeadlineScheduler()
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.match import Match
+from app.services.matching_service import matching_service
+from app.utils.matching_queue import matching_queue, QUEUE_EVENTS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+Bucket = Tuple[str, str]
+
+
+class Matcher:
+    """
+    Event-driven matcher for the Redis matching queues.
+
+    MatchingQueue.add_to_queue notifies the matcher whenever a bucket
+    (difficulty + topic) receives a new entry: directly in the same process,
+    and over Redis pub/sub for a matcher in its own worker (run_matcher.py).
+    Each bucket has a single coroutine that sleeps until it is woken, then
+    pops the oldest entries in batches and pairs each batch in one pass and
+    one transaction. Requests that keep waiting are handed back by the
+    deadline scheduler (REQUEST_RELAX) to be matched in wider buckets.
+    """
+
+    def __init__(self):
+        # Called once per created match (e.g. to notify both users)
+        self.on_match: Optional[Callable[[Match], Awaitable[None]]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._events: Dict[Bucket, asyncio.Event] = {}
+        self._tasks: Dict[Bucket, asyncio.Task] = {}
+        self._pubsub = None
+        self._subscriber: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start listening for queue notifications on the running loop"""
+        self._loop = asyncio.get_running_loop()
+        matching_queue.subscribe(self.notify)
+        self._pubsub = matching_queue.redis_client.pubsub()
+        await self._pubsub.subscribe(QUEUE_EVENTS_CHANNEL)
+        self._subscriber = asyncio.create_task(self._listen())
+
+        # Pick up requests that were queued before this process started
+        for difficulty, topic in await matching_queue.get_active_buckets():
+            self._wake((difficulty, topic))
+
+    async def stop(self):
+        """Stop all bucket coroutines"""
+        matching_queue.unsubscribe(self.notify)
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            await asyncio.gather(self._subscriber, return_exceptions=True)
+            self._subscriber = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._events.clear()
+        self._loop = None
+
+    def notify(self, difficulty: str, topic: str):
+        """Wake the matcher for a bucket (safe to call from any thread)"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._wake, (difficulty, topic))
+
+    async def _listen(self):
+        """Wake buckets announced by other processes"""
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Matcher pub/sub listener error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message and message["type"] == "message":
+                difficulty, _, topic = message["data"].partition(":")
+                self._wake((difficulty, topic))
+
+    def _wake(self, bucket: Bucket):
+        event = self._events.get(bucket)
+        if event is None:
+            event = self._events[bucket] = asyncio.Event()
+            self._tasks[bucket] = asyncio.get_running_loop().create_task(self._run(bucket))
+        event.set()
+
+    async def _run(self, bucket: Bucket):
+        event = self._events[bucket]
+        while True:
+            await event.wait()
+            event.clear()
+            try:
+                retry = await self._drain(*bucket)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Matcher failed for bucket {bucket[0]}:{bucket[1]}")
+                retry = True
+            if retry:
+                # Entries may still be queued; try again even if no new one arrives
+                await asyncio.sleep(settings.MATCHER_RETRY_DELAY_SECONDS)
+                event.set()
+
+    async def relax(self, request_ids: List[str]):
+        """Deadline handler: match long-waiting requests outside their own bucket"""
+        from app.core.database import SessionLocal
+
+        async with SessionLocal() as db:
+            matches = await matching_service.relax_requests(db, request_ids)
+        await self._announce(matches)
+
+    async def _announce(self, matches: List[Match]):
+        if self.on_match:
+            for match in matches:
+                try:
+                    await self.on_match(match)
+                except Exception:
+                    logger.exception(f"on_match failed for match {match.id}")
+
+    async def _drain(self, difficulty: str, topic: str) -> bool:
+        """
+        Pair waiting requests in a bucket, one batch per tick, until no more pairs can be made.
+
+        Returns True when pairs may still be possible but the batch is locked
+        by another matcher, so the bucket should be looked at again later.
+        """
+        from app.core.database import SessionLocal
+
+        while True:
+            size = await matching_queue.get_queue_size(difficulty, topic)
+            if size < 2:
+                return False
+
+            entries = await matching_queue.pop_batch(difficulty, topic, settings.MATCH_BATCH_SIZE)
+            # Fresh session per tick so request rows are never read from a stale identity map
+            async with SessionLocal() as db:
+                matches = await matching_service.create_matches(db, difficulty, topic, entries)
+
+            await self._announce(matches)
+            if matches:
+                continue
+
+            # The whole queue was one user's entries: nothing to pair until someone else joins
+            if len(entries) < settings.MATCH_BATCH_SIZE and len({e["user_id"] for e in entries}) < 2:
+                return False
+            # Entries that were no longer pending were dropped; pair what is left
+            if await matching_queue.get_queue_size(difficulty, topic) < size:
+                continue
+            # Everything went back to the queue: its rows are locked by another matcher
+            return True
+
+
+matcher = Matcher()
@@ -1,16 +1,24 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt, ExpiredSignatureError
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
 from app.models.match_request import MatchRequest, MatchStatus, DifficultyLevel
 from app.models.match import Match
 from app.utils.matching_queue import matching_queue
+from app.utils.related_topics import related_topics
+from app.services.deadline_scheduler import deadline_scheduler, REQUEST_TIMEOUT, CONFIRM_TIMEOUT, REQUEST_RELAX
+from app.services.admission import admission
+from app.services.notifier import notify_match_cancelled
 from datetime import datetime, timezone
 import uuid
-from typing import Optional, Union
+import logging
+from typing import List, Tuple, Union
 from datetime import datetime, timedelta, timezone
 
+logger = logging.getLogger(__name__)
+
 class MatchingService:
     
     bearer = HTTPBearer(auto_error=True)
@@ -44,45 +52,63 @@ class MatchingService:
 
         return {"user_id": user_id, "claims": claims}
 
-    def create_match_request(
+    async def create_match_request(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         user_id: str, 
         difficulty: DifficultyLevel, 
         topic: str
     ) -> MatchRequest:
-        """Create a new match request and add to queue"""
-        
+        """
+        Create a new match request and add to queue.
+
+        Raises AdmissionRejected when the user is rate limited or the
+        service is at MAX_CONCURRENT_MATCHES, before touching the DB.
+        """
+        request_id = str(uuid.uuid4())
+        await admission.admit(user_id, request_id)
+        try:
+            return await self._create_match_request(db, request_id, user_id, difficulty, topic)
+        except Exception:
+            await admission.release(request_id)
+            raise
+
+    async def _create_match_request(
+        self,
+        db: AsyncSession,
+        request_id: str,
+        user_id: str,
+        difficulty: DifficultyLevel,
+        topic: str
+    ) -> MatchRequest:
         now = datetime.now(timezone.utc)
 
         # Expire stale pending(s) for this user
         timeout_seconds = int(settings.MATCHING_TIMEOUT_SECONDS)
         expiry_cutoff = now - timedelta(seconds=timeout_seconds)
-        stale = (
-          db.query(MatchRequest)
-            .filter(MatchRequest.user_id == user_id,
-                    MatchRequest.status == MatchStatus.PENDING,
-                    MatchRequest.created_at < expiry_cutoff)
-            .all()
-        )
+        stale = (await db.scalars(
+            select(MatchRequest)
+            .where(MatchRequest.user_id == user_id,
+                   MatchRequest.status == MatchStatus.PENDING,
+                   MatchRequest.created_at < expiry_cutoff)
+        )).all()
         for r in stale:
             r.status = MatchStatus.TIMEOUT
             r.timeout_at = now
             db.add(r)
 
         # Block truly-active pending (still within timeout)
-        active_pending = (
-          db.query(MatchRequest)
-            .filter(MatchRequest.user_id == user_id,
-                    MatchRequest.status == MatchStatus.PENDING,
-                    MatchRequest.created_at >= expiry_cutoff)
-            .first()
+        active_pending = await db.scalar(
+            select(MatchRequest)
+            .where(MatchRequest.user_id == user_id,
+                   MatchRequest.status == MatchStatus.PENDING,
+                   MatchRequest.created_at >= expiry_cutoff)
+            .limit(1)
         )
         if active_pending:
             raise ValueError("You already have a pending request.")
                 
         # Create match request
-        request_id = str(uuid.uuid4())
         match_request = MatchRequest(
             id=request_id,
             user_id=user_id,
@@ -93,11 +119,17 @@ class MatchingService:
         )
         
         db.add(match_request)
-        db.commit()
-        db.refresh(match_request)
+        await db.commit()
+        await db.refresh(match_request)
+        for r in stale:
+            await notify_match_cancelled(user_id, r.id, "expired")
+
+        # Expire the request if nobody is found in time
+        await deadline_scheduler.schedule(REQUEST_TIMEOUT, request_id, settings.MATCHING_TIMEOUT_SECONDS)
+        await self._schedule_relaxation([request_id], settings.MATCH_RELAX_ANY_DIFFICULTY_AFTER_SECONDS)
         
         # Add to Redis queue
-        matching_queue.add_to_queue(
+        await matching_queue.add_to_queue(
             request_id=request_id,
             user_id=user_id,
             difficulty=difficulty.value,
@@ -106,75 +138,176 @@ class MatchingService:
         
         return match_request
     
-    def find_and_create_match(
-        self, 
-        db: Session, 
-        request_id: str
-    ) -> Optional[Match]:
-        """Try to find a match for the request"""
-        
-        # Get the match request
-        match_request = db.query(MatchRequest).filter(
-            MatchRequest.id == request_id
-        ).first()
-        
-        if not match_request or match_request.status != MatchStatus.PENDING:
-            return None
-        
-        # Look for match in queue
-        partner_data = matching_queue.find_match(
-            difficulty=match_request.difficulty.value,
-            topic=match_request.topic,
-            exclude_user_id=match_request.user_id
-        )
-        
-        if not partner_data:
-            return None
-        
-        # Get partner's match request
-        partner_request = db.query(MatchRequest).filter(
-            MatchRequest.id == partner_data["request_id"]
-        ).first()
-        
-        if not partner_request or partner_request.status != MatchStatus.PENDING:
-            return None
-        
-        # Create match
-        match = Match(
-            id=str(uuid.uuid4()),
-            request1_id=match_request.id,
-            request2_id=partner_request.id,
-            user1_id=match_request.user_id,
-            user2_id=partner_request.user_id,
-            difficulty=match_request.difficulty.value,
-            topic=match_request.topic
-        )
-        
-        # Update both requests to matched
-        match_request.status = MatchStatus.MATCHED
-        match_request.matched_at = datetime.now(timezone.utc)
-        partner_request.status = MatchStatus.MATCHED
-        partner_request.matched_at = datetime.now(timezone.utc)
-        
-        db.add(match)
-        db.commit()
-        db.refresh(match)
-        
-        # Remove from queue
-        matching_queue.remove_from_queue(
-            request_id=match_request.id,
-            difficulty=match_request.difficulty.value,
-            topic=match_request.topic
-        )
-        
-        return match
-    
-    def cancel_match_request(self, db: Session, request_id: str, user_id: str):
+    @staticmethod
+    def _pair_oldest_first(entries: List[dict]) -> Tuple[List[Tuple[dict, dict]], List[dict]]:
+        """Pair entries in queue order, never pairing a user with themselves"""
+        pairs = []
+        waiting: List[dict] = []
+        for entry in entries:
+            for i, other in enumerate(waiting):
+                if other["user_id"] != entry["user_id"]:
+                    pairs.append((waiting.pop(i), entry))
+                    break
+            else:
+                waiting.append(entry)
+        return pairs, waiting
+
+    async def create_matches(
+        self,
+        db: AsyncSession,
+        difficulty: str,
+        topic: str,
+        entries: List[dict]
+    ) -> List[Match]:
+        """
+        Pair a batch of entries popped from a bucket (oldest first) and write
+        every resulting match in one transaction.
+
+        The claim happens in the database: the batch's request rows are
+        locked with FOR UPDATE SKIP LOCKED, and paired requests move from
+        PENDING to MATCHED in one UPDATE ... RETURNING, so a request can
+        never end up in two matches even with matchers on several replicas.
+
+        Entries whose request is no longer pending are dropped; unpaired
+        ones and rows locked by another transaction are put back in the
+        queue at their original position.
+        """
+        if not entries:
+            return []
+
+        # Lock what nobody else is working on; locked rows are simply not returned
+        rows = (await db.execute(
+            select(MatchRequest.id, MatchRequest.user_id, MatchRequest.status)
+            .where(MatchRequest.id.in_([e["request_id"] for e in entries]))
+            .with_for_update(skip_locked=True)
+        )).all()
+        status_by_id = {row.id: row.status for row in rows}
+        users_by_id = {row.id: row.user_id for row in rows}
+        # Rows missing from the result are locked elsewhere, or orphans with no
+        # row at all; orphans are recognised by outliving the request timeout
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.MATCHING_TIMEOUT_SECONDS)
+        locked = [
+            e for e in entries
+            if e["request_id"] not in status_by_id and datetime.fromisoformat(e["timestamp"]) > cutoff
+        ]
+        pending = [e for e in entries if status_by_id.get(e["request_id"]) == MatchStatus.PENDING]
+        pairs, unpaired = self._pair_oldest_first(pending)
+
+        matches = []
+        if pairs:
+            matched_ids = [e["request_id"] for pair in pairs for e in pair]
+            try:
+                # Update both requests of every pair to matched
+                claimed = (await db.execute(
+                    update(MatchRequest)
+                    .where(MatchRequest.id.in_(matched_ids), MatchRequest.status == MatchStatus.PENDING)
+                    .values(status=MatchStatus.MATCHED, matched_at=datetime.now(timezone.utc))
+                    .returning(MatchRequest.id)
+                )).scalars().all()
+                if len(claimed) != len(matched_ids):
+                    raise RuntimeError(f"Claimed {len(claimed)} of {len(matched_ids)} locked requests")
+
+                for first, second in pairs:
+                    matches.append(Match(
+                        id=str(uuid.uuid4()),
+                        request1_id=first["request_id"],
+                        request2_id=second["request_id"],
+                        user1_id=users_by_id[first["request_id"]],
+                        user2_id=users_by_id[second["request_id"]],
+                        difficulty=difficulty,
+                        topic=topic
+                    ))
+                db.add_all(matches)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                # Nothing was claimed, so no pending entry may be lost
+                await matching_queue.restore_entries(difficulty, topic, pending + locked)
+                raise
+
+            # Request timeouts no longer apply; the pairs now have to confirm in time
+            await deadline_scheduler.cancel(REQUEST_TIMEOUT, *matched_ids)
+            await deadline_scheduler.cancel(REQUEST_RELAX, *matched_ids)
+            await admission.release(*matched_ids)
+            await deadline_scheduler.schedule_many(
+                CONFIRM_TIMEOUT, [m.id for m in matches], settings.CONFIRM_MATCH_TIMEOUT_SECONDS
+            )
+        else:
+            # Release the row locks
+            await db.rollback()
+
+        await matching_queue.restore_entries(difficulty, topic, unpaired + locked)
+        return matches
+
+    @staticmethod
+    async def _schedule_relaxation(request_ids: List[str], delay_seconds: float):
+        """Re-check waiting requests for a wider match, unless they time out first"""
+        if settings.MATCH_RELAXATION_ENABLED and delay_seconds < settings.MATCHING_TIMEOUT_SECONDS:
+            await deadline_scheduler.schedule_many(REQUEST_RELAX, request_ids, delay_seconds)
+
+    @staticmethod
+    def _relaxed_buckets(difficulty: str, topic: str, waited: float) -> List[Tuple[str, str]]:
+        """Buckets other than its own that a request may match in after waiting `waited` seconds"""
+        buckets = []
+        if waited >= settings.MATCH_RELAX_ANY_DIFFICULTY_AFTER_SECONDS:
+            buckets += [(d.value, topic) for d in DifficultyLevel if d.value != difficulty]
+        if waited >= settings.MATCH_RELAX_RELATED_TOPICS_AFTER_SECONDS:
+            buckets += [(d.value, t) for t in related_topics(topic) for d in DifficultyLevel]
+        return buckets
+
+    async def relax_requests(self, db: AsyncSession, request_ids: List[str]) -> List[Match]:
+        """
+        Try to match requests that have waited a while outside their own bucket.
+
+        Each still-queued request widens its search by how long it has waited
+        (same topic at any difficulty, then related topics) and is paired
+        with the oldest waiting entry heading one of those buckets, looked up
+        through the bucket occupancy index. The match takes the partner's
+        difficulty and topic. Requests left unmatched are re-checked every
+        MATCH_RELAX_INTERVAL_SECONDS until they time out.
+        """
+        rows = (await db.execute(
+            select(MatchRequest.id, MatchRequest.user_id, MatchRequest.difficulty, MatchRequest.topic)
+            .where(MatchRequest.id.in_(request_ids), MatchRequest.status == MatchStatus.PENDING)
+        )).all()
+        await db.rollback()
+        entries = await matching_queue.get_entries([(r.id, r.difficulty.value, r.topic) for r in rows])
+
+        now = datetime.now(timezone.utc)
+        matches: List[Match] = []
+        recheck = []
+        for row, entry in zip(rows, entries):
+            # Not queued: being matched or confirmed right now
+            if entry is None:
+                continue
+            difficulty = row.difficulty.value
+            waited = (now - datetime.fromisoformat(entry["timestamp"])).total_seconds()
+            candidates = await matching_queue.get_occupied(self._relaxed_buckets(difficulty, row.topic, waited))
+            claimed = await matching_queue.claim_partner(row.id, row.user_id, difficulty, row.topic, candidates)
+            if claimed is None:
+                if waited + settings.MATCH_RELAX_INTERVAL_SECONDS < settings.MATCHING_TIMEOUT_SECONDS:
+                    recheck.append(row.id)
+                continue
+
+            own, partner = claimed
+            pair = sorted([own, partner], key=lambda e: e["timestamp"])
+            try:
+                matches += await self.create_matches(db, partner["difficulty"], partner["topic"], pair)
+            except Exception:
+                # Both entries are back in their own buckets; keep going with the batch
+                logger.exception(f"Relaxed match failed for request {row.id}")
+
+        await self._schedule_relaxation(recheck, settings.MATCH_RELAX_INTERVAL_SECONDS)
+        return matches
+
+    async def cancel_match_request(self, db: AsyncSession, request_id: str, user_id: str):
         """Cancel a pending match request"""
-        match_request = db.query(MatchRequest).filter(
-            MatchRequest.id == request_id,
-            MatchRequest.user_id == user_id
-        ).first()
+        match_request = await db.scalar(
+            select(MatchRequest).where(
+                MatchRequest.id == request_id,
+                MatchRequest.user_id == user_id
+            )
+        )
         
         if not match_request:
             raise ValueError("Match request not found")
@@ -183,18 +316,22 @@ class MatchingService:
             raise ValueError("Can only cancel pending requests")
         
         match_request.status = MatchStatus.CANCELLED
-        db.commit()
+        await db.commit()
+        await deadline_scheduler.cancel(REQUEST_TIMEOUT, request_id)
+        await deadline_scheduler.cancel(REQUEST_RELAX, request_id)
+        await admission.release(request_id)
+        await notify_match_cancelled(user_id, request_id, "cancelled")
         
         # Remove from queue
-        matching_queue.remove_from_queue(
+        await matching_queue.remove_from_queue(
             request_id=request_id,
             difficulty=match_request.difficulty.value,
             topic=match_request.topic
         )
     
-    def confirm_match(self, db: Session, match_id: str, user_id: str, confirmed: bool) -> Union[Match, dict]:
+    async def confirm_match(self, db: AsyncSession, match_id: str, user_id: str, confirmed: bool) -> Union[Match, dict]:
         """User confirms they want to proceed with the match"""
-        match = db.query(Match).filter(Match.id == match_id).first()
+        match = await db.get(Match, match_id)
         
         if not match:
             raise ValueError("Match not found")
@@ -208,8 +345,8 @@ class MatchingService:
             else:
                 my_req_id, partner_req_id, partner_id = match.request2_id, match.request1_id, match.user1_id
 
-            my_req = db.query(MatchRequest).filter(MatchRequest.id == my_req_id).first()
-            partner_req = db.query(MatchRequest).filter(MatchRequest.id == partner_req_id).first()
+            my_req = await db.get(MatchRequest, my_req_id)
+            partner_req = await db.get(MatchRequest, partner_req_id)
 
             # cancel match
             if my_req and my_req.status != MatchStatus.CANCELLED:
@@ -221,19 +358,14 @@ class MatchingService:
                 partner_req.status = MatchStatus.PENDING
                 partner_req.matched_at = None
                 db.add(partner_req)
-
-                difficulty_val = partner_req.difficulty.value if hasattr(partner_req.difficulty, "value") else partner_req.difficulty
-                matching_queue.add_to_queue(
-                    request_id=partner_req.id,
-                    user_id=partner_req.user_id,
-                    difficulty=difficulty_val,
-                    topic=partner_req.topic,
-                )
-
             # remove the match
-            db.delete(match)
-            db.commit()
-            return {"cancelled": True, "match_id": match_id}
+            await db.delete(match)
+            await db.commit()
+            await deadline_scheduler.cancel(CONFIRM_TIMEOUT, match_id)
+
+            if partner_req:
+                await self._requeue(partner_req)
+            return {"cancelled": True, "match_id": match_id, "partner_id": partner_id}
 
         
         # Update confirmation status
@@ -244,44 +376,88 @@ class MatchingService:
         else:
             raise ValueError("User not part of this match")
         
-        db.commit()
-        db.refresh(match)
+        await db.commit()
+        await db.refresh(match)
         
         return match
     
-    def create_and_store_session_id(self, db: Session, match_id: str) -> str:
-        """Generates a session ID for a confirmed match and stores it in the DB"""
-        match = db.query(Match).filter(Match.id == match_id).first()
-        if not match:
+    async def create_and_store_session_id(self, db: AsyncSession, match_id: str) -> str:
+        """
+        Generates a session ID for a confirmed match and stores it in the DB.
+
+        Idempotent: when both users confirm at once, whoever stores an ID
+        first wins and every caller gets that same ID back.
+        """
+        session_id = await db.scalar(
+            update(Match)
+            .where(Match.id == match_id, Match.collaboration_session_id.is_(None))
+            .values(collaboration_session_id=str(uuid.uuid4()))
+            .returning(Match.collaboration_session_id)
+        )
+        await db.commit()
+        if session_id:
+            return session_id
+
+        session_id = await db.scalar(
+            select(Match.collaboration_session_id).where(Match.id == match_id)
+        )
+        if not session_id:
             raise ValueError("Match not found")
+        return session_id
+
+    async def _requeue(self, match_request: MatchRequest):
+        """Put a request that is PENDING again back in its queue with a fresh timeout"""
+        difficulty_val = match_request.difficulty.value if hasattr(match_request.difficulty, "value") else match_request.difficulty
+        await deadline_scheduler.schedule(REQUEST_TIMEOUT, match_request.id, settings.MATCHING_TIMEOUT_SECONDS)
+        await self._schedule_relaxation([match_request.id], settings.MATCH_RELAX_ANY_DIFFICULTY_AFTER_SECONDS)
+        await admission.readmit(match_request.id)
+        await matching_queue.add_to_queue(
+            request_id=match_request.id,
+            user_id=match_request.user_id,
+            difficulty=difficulty_val,
+            topic=match_request.topic,
+        )
+
+    async def handle_timeouts(self, db: AsyncSession, request_ids: List[str]) -> List[str]:
+        """Time out every still-pending request in the batch; returns the affected user ids"""
+        result = await db.execute(
+            update(MatchRequest)
+            .where(MatchRequest.id.in_(request_ids), MatchRequest.status == MatchStatus.PENDING)
+            .values(status=MatchStatus.TIMEOUT, timeout_at=datetime.now(timezone.utc))
+            .returning(MatchRequest.id, MatchRequest.user_id, MatchRequest.difficulty, MatchRequest.topic)
+        )
+        timed_out = result.all()
+        await db.commit()
+        await admission.release(*request_ids)
+
+        # Remove from queue
+        await matching_queue.remove_many_from_queue(
+            [(row.id, row.difficulty.value, row.topic) for row in timed_out]
+        )
+        return [row.user_id for row in timed_out]
 
-        # Generate a unique session ID
-        session_id = str(uuid.uuid4())
+    async def expire_unconfirmed_matches(self, db: AsyncSession, match_ids: List[str]) -> List[Match]:
+        """Delete matches in the batch that were not confirmed by both users and requeue their requests"""
+        matches = (await db.scalars(select(Match).where(Match.id.in_(match_ids)))).all()
+        expired = [m for m in matches if not (m.user1_confirmed and m.user2_confirmed)]
+        if not expired:
+            return []
 
-        # Store it in the DB
-        match.collaboration_session_id = session_id
-        db.commit()
-        db.refresh(match)
+        request_ids = [rid for m in expired for rid in (m.request1_id, m.request2_id)]
+        requests = (await db.scalars(select(MatchRequest).where(MatchRequest.id.in_(request_ids)))).all()
+        for r in requests:
+            r.status = MatchStatus.PENDING
+            r.matched_at = None
 
-        return session_id
+        # delete or mark match as expired; simplest is delete
+        for m in expired:
+            await db.delete(m)
+        await db.commit()
 
+        # put both users back into the Redis queue
+        for r in requests:
+            await self._requeue(r)
 
-    def handle_timeout(self, db: Session, request_id: str):
-        """Handle match request timeout"""
-        match_request = db.query(MatchRequest).filter(
-            MatchRequest.id == request_id
-        ).first()
-        
-        if match_request and match_request.status == MatchStatus.PENDING:
-            match_request.status = MatchStatus.TIMEOUT
-            match_request.timeout_at = datetime.now(timezone.utc)
-            db.commit()
-            
-            # Remove from queue
-            matching_queue.remove_from_queue(
-                request_id=request_id,
-                difficulty=match_request.difficulty.value,
-                topic=match_request.topic
-            )
+        return expired
 
 matching_service = MatchingService()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import json
+import logging
+from typing import List
+
+from app.core.redis import redis_client
+from app.models.match import Match
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub channel per user; any process (API replica or matcher worker)
+# publishes here and the API replica holding the user's socket delivers it
+USER_CHANNEL_PREFIX = "matching_user:"
+
+
+def user_channel(user_id: str) -> str:
+    return f"{USER_CHANNEL_PREFIX}{user_id}"
+
+
+async def notify_user(user_id: str, message: dict):
+    """Send a matching event to the user, whichever API replica they are connected to"""
+    try:
+        await redis_client.publish(user_channel(user_id), json.dumps(message))
+    except Exception as e:
+        logger.error(f"Failed to publish message for {user_id}: {e}")
+
+
+async def notify_match_found(match: Match):
+    """Notify both users of a new match"""
+    await notify_user(match.user1_id, {
+        "type": "match_found",
+        "match_id": match.id,
+        "partner_id": match.user2_id,
+        "difficulty": match.difficulty,
+        "topic": match.topic
+    })
+
+    await notify_user(match.user2_id, {
+        "type": "match_found",
+        "match_id": match.id,
+        "partner_id": match.user1_id,
+        "difficulty": match.difficulty,
+        "topic": match.topic
+    })
+
+
+async def notify_match_cancelled(user_id: str, request_id: str, reason: str):
+    """Tell the user a request ended without a match (cancelled, or expired by a newer one)"""
+    await notify_user(user_id, {
+        "type": "match_cancelled",
+        "request_id": request_id,
+        "reason": reason
+    })
+
+
+async def handle_request_timeouts(request_ids: List[str]):
+    """Time out a batch of match requests whose deadline has passed"""
+    from app.core.database import SessionLocal
+    from app.services.matching_service import matching_service
+
+    async with SessionLocal() as db:
+        user_ids = await matching_service.handle_timeouts(db, request_ids)
+
+    for user_id in user_ids:
+        await notify_user(user_id, {"type": "match_timeout"})
+
+
+async def handle_confirm_timeouts(match_ids: List[str]):
+    """Expire matches that were not confirmed in time and requeue both users"""
+    from app.core.database import SessionLocal
+    from app.services.matching_service import matching_service
+
+    async with SessionLocal() as db:
+        expired = await matching_service.expire_unconfirmed_matches(db, match_ids)
+
+    for m in expired:
+        await notify_user(m.user1_id, {"type": "match_expired", "reason": "confirmation_timeout"})
+        await notify_user(m.user2_id, {"type": "match_expired", "reason": "confirmation_timeout"})
+
+
+def register_matching_handlers():
+    """Wire match and deadline events to user notifications (API or worker process)"""
+    from app.services.matcher import matcher
+    from app.services.deadline_scheduler import deadline_scheduler, REQUEST_TIMEOUT, CONFIRM_TIMEOUT, REQUEST_RELAX
+
+    matcher.on_match = notify_match_found
+    deadline_scheduler.register(REQUEST_TIMEOUT, handle_request_timeouts)
+    deadline_scheduler.register(CONFIRM_TIMEOUT, handle_confirm_timeouts)
+    deadline_scheduler.register(REQUEST_RELAX, matcher.relax)
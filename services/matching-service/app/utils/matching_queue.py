@@ -1,75 +1,318 @@
-import redis
 import json
-from typing import Optional, List
+import logging
+from typing import Callable, Dict, Optional, List, Tuple
 from datetime import datetime, timezone
 from app.core.config import settings
+from app.core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Sorted set per bucket: member = request_id, score = enqueue timestamp
+QUEUE_KEY_PREFIX = "matching_queue:"
+# Hash per bucket: field = request_id, value = {"user_id", "timestamp"} JSON
+META_KEY_PREFIX = "matching_queue_meta:"
+# Pub/sub channel announcing "{difficulty}:{topic}" whenever a bucket receives
+# a new entry, so matchers in other processes wake up
+QUEUE_EVENTS_CHANNEL = "matching_queue_events"
+
+# Sorted set of non-empty buckets: member = "{difficulty}:{topic}",
+# score = number of queued entries. Kept in step with the queues by the
+# scripts below, so finding occupied buckets never scans keys.
+OCCUPANCY_KEY = "matching_bucket_occupancy"
+
+# Shared by every script that changes a bucket
+SYNC_OCCUPANCY = """
+local function sync_occupancy(queue_key, bucket)
+    local n = redis.call('ZCARD', queue_key)
+    if n > 0 then
+        redis.call('ZADD', KEYS[3], n, bucket)
+    else
+        redis.call('ZREM', KEYS[3], bucket)
+    end
+end
+"""
+
+# KEYS[1] = queue key, KEYS[2] = meta key, KEYS[3] = occupancy key
+# ARGV[1] = bucket, ARGV[2] = ttl, ARGV[3] = channel to announce the bucket on ('' for none),
+# then (request_id, score, meta) for every entry
+QUEUE_ENTRIES_SCRIPT = SYNC_OCCUPANCY + """
+for i = 4, #ARGV, 3 do
+    redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+end
+-- keep the bucket alive while it is still receiving entries
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+sync_occupancy(KEYS[1], ARGV[1])
+if ARGV[3] ~= '' then
+    redis.call('PUBLISH', ARGV[3], ARGV[1])
+end
+return 1
+"""
+
+# KEYS[1] = queue key, KEYS[2] = meta key, KEYS[3] = occupancy key
+# ARGV[1] = bucket, ARGV[2..] = request_ids
+REMOVE_ENTRIES_SCRIPT = SYNC_OCCUPANCY + """
+for i = 2, #ARGV do
+    redis.call('ZREM', KEYS[1], ARGV[i])
+    redis.call('HDEL', KEYS[2], ARGV[i])
+end
+sync_occupancy(KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS[1] = queue key, KEYS[2] = meta key, KEYS[3] = occupancy key
+# ARGV[1] = max entries, ARGV[2] = bucket
+# Removes up to ARGV[1] of the oldest entries in one step, so concurrent
+# matchers never work on the same members.
+# Returns {id1, meta1, id2, meta2, ...}; meta is nil for orphaned members.
+POP_BATCH_SCRIPT = SYNC_OCCUPANCY + """
+local unpack = unpack or table.unpack
+local ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids == 0 then
+    sync_occupancy(KEYS[1], ARGV[2])
+    return {}
+end
+local metas = redis.call('HMGET', KEYS[2], unpack(ids))
+redis.call('ZREM', KEYS[1], unpack(ids))
+redis.call('HDEL', KEYS[2], unpack(ids))
+sync_occupancy(KEYS[1], ARGV[2])
+local out = {}
+for i, id in ipairs(ids) do
+    out[2 * i - 1] = id
+    out[2 * i] = metas[i]
+end
+return out
+"""
+
+# KEYS[1] = own queue key, KEYS[2] = own meta key, KEYS[3] = occupancy key,
+# then (queue key, meta key) of every candidate bucket
+# ARGV[1] = own request_id, ARGV[2] = own user_id, ARGV[3] = own bucket,
+# then the candidate bucket names in the same order
+# Pairs a queued request with the oldest entry (of another user) at the head
+# of any candidate bucket, removing both in one step.
+# Returns {own meta, partner id, partner meta, partner bucket} or nil.
+CLAIM_PARTNER_SCRIPT = SYNC_OCCUPANCY + """
+local own_meta = redis.call('HGET', KEYS[2], ARGV[1])
+if not own_meta or not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return nil
+end
+local best, best_score, best_meta, best_c
+for c = 0, (#KEYS - 3) / 2 - 1 do
+    local queue_key, meta_key = KEYS[4 + 2 * c], KEYS[5 + 2 * c]
+    -- a user has at most one pending request, so two heads are enough
+    local head = redis.call('ZRANGE', queue_key, 0, 1, 'WITHSCORES')
+    for j = 1, #head, 2 do
+        local score = tonumber(head[j + 1])
+        if best_score and score >= best_score then
+            break
+        end
+        local meta = redis.call('HGET', meta_key, head[j])
+        if meta and cjson.decode(meta)['user_id'] ~= ARGV[2] then
+            best, best_score, best_meta, best_c = head[j], score, meta, c
+            break
+        end
+    end
+end
+if not best then
+    return nil
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+sync_occupancy(KEYS[1], ARGV[3])
+redis.call('ZREM', KEYS[4 + 2 * best_c], best)
+redis.call('HDEL', KEYS[5 + 2 * best_c], best)
+sync_occupancy(KEYS[4 + 2 * best_c], ARGV[4 + best_c])
+return {own_meta, best, best_meta, ARGV[4 + best_c]}
+"""
 
 class MatchingQueue:
     def __init__(self):
-        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-    
+        self.redis_client = redis_client
+        self._queue_entries = self.redis_client.register_script(QUEUE_ENTRIES_SCRIPT)
+        self._remove_entries = self.redis_client.register_script(REMOVE_ENTRIES_SCRIPT)
+        self._pop_batch = self.redis_client.register_script(POP_BATCH_SCRIPT)
+        self._claim_partner = self.redis_client.register_script(CLAIM_PARTNER_SCRIPT)
+        # Called with (difficulty, topic) whenever a bucket receives a new entry
+        self._listeners: List[Callable[[str, str], None]] = []
+
+    def subscribe(self, listener: Callable[[str, str], None]):
+        """Register a callback notified when a bucket receives a new entry"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[str, str], None]):
+        """Remove a previously registered bucket listener"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, difficulty: str, topic: str):
+        for listener in list(self._listeners):
+            try:
+                listener(difficulty, topic)
+            except Exception as e:
+                logger.error(f"Queue listener failed for {difficulty}:{topic}: {e}")
+
+    @staticmethod
+    def _bucket(difficulty: str, topic: str) -> str:
+        return f"{difficulty}:{topic}"
+
     def _get_queue_key(self, difficulty: str, topic: str) -> str:
         """Generate Redis key for specific difficulty + topic combination"""
-        return f"matching_queue:{difficulty}:{topic}"
-    
-    def add_to_queue(self, request_id: str, user_id: str, difficulty: str, topic: str):
-        """Add user to matching queue"""
-        key = self._get_queue_key(difficulty, topic)
-        now = datetime.now(timezone.utc)
-        member = json.dumps({
-            "request_id": request_id,
-            "user_id": user_id,
-            "timestamp": now.isoformat()
-            },
-            separators=(",", ":"),
+        return f"{QUEUE_KEY_PREFIX}{difficulty}:{topic}"
+
+    def _get_meta_key(self, difficulty: str, topic: str) -> str:
+        """Generate Redis key for the entry metadata of a bucket"""
+        return f"{META_KEY_PREFIX}{difficulty}:{topic}"
+
+    def _bucket_keys(self, difficulty: str, topic: str) -> List[str]:
+        return [self._get_queue_key(difficulty, topic), self._get_meta_key(difficulty, topic), OCCUPANCY_KEY]
+
+    @staticmethod
+    def _to_entry(request_id: str, meta: str) -> dict:
+        return {"request_id": request_id, **json.loads(meta)}
+
+    async def _write_entries(self, difficulty: str, topic: str, entries: List[Tuple[str, str, datetime]], channel: str = ""):
+        """Queue (request_id, user_id, timestamp) entries in a bucket; older = smaller score"""
+        args = [self._bucket(difficulty, topic), settings.MATCHING_TIMEOUT_SECONDS + 10, channel]
+        for request_id, user_id, timestamp in entries:
+            meta = json.dumps(
+                {"user_id": user_id, "timestamp": timestamp.isoformat()},
+                separators=(",", ":"),
+            )
+            args += [request_id, timestamp.timestamp(), meta]
+        await self._queue_entries(keys=self._bucket_keys(difficulty, topic), args=args, client=self.redis_client)
+
+    async def add_to_queue(self, request_id: str, user_id: str, difficulty: str, topic: str):
+        """Add user to matching queue (or move an existing entry to the back)"""
+        await self._write_entries(
+            difficulty, topic, [(request_id, user_id, datetime.now(timezone.utc))], channel=QUEUE_EVENTS_CHANNEL
         )
-        score = now.timestamp()  # older = smaller score
-
-        # add or update with score
-        self.redis_client.zadd(key, {member: score})
-        # set TTL only if not already set
-        if self.redis_client.ttl(key) in (-1, -2):
-            self.redis_client.expire(key, settings.MATCHING_TIMEOUT_SECONDS + 10)
-            
-    def find_match(self, difficulty: str, topic: str, exclude_user_id: str) -> Optional[dict]:
-        key = self._get_queue_key(difficulty, topic)
-        # Pop up to N oldest, skip self, reinsert skipped with original score
-        batch = self.redis_client.zpopmin(key, 5)  # returns list of (member, score)
-        if not batch:
+        self._notify(difficulty, topic)
+
+    async def get_entry(self, request_id: str, difficulty: str, topic: str) -> Optional[dict]:
+        """Look up a queued entry by request_id"""
+        meta = await self.redis_client.hget(self._get_meta_key(difficulty, topic), request_id)
+        if not meta:
             return None
+        return self._to_entry(request_id, meta)
+
+    async def get_entries(self, lookups: List[Tuple[str, str, str]]) -> List[Optional[dict]]:
+        """Look up several (request_id, difficulty, topic) entries in one round trip"""
+        if not lookups:
+            return []
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for request_id, difficulty, topic in lookups:
+                pipe.hget(self._get_meta_key(difficulty, topic), request_id)
+            metas = await pipe.execute()
+        return [
+            self._to_entry(request_id, meta) if meta else None
+            for (request_id, _, _), meta in zip(lookups, metas)
+        ]
+
+    async def get_active_buckets(self) -> List[Tuple[str, str]]:
+        """List (difficulty, topic) buckets that currently hold entries"""
+        buckets = []
+        for bucket in await self.redis_client.zrange(OCCUPANCY_KEY, 0, -1):
+            difficulty, _, topic = bucket.partition(":")
+            buckets.append((difficulty, topic))
+        return buckets
+
+    async def get_occupied(self, buckets: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """The subset of `buckets` holding at least one entry, from the occupancy index"""
+        if not buckets:
+            return []
+        counts = await self.redis_client.zmscore(OCCUPANCY_KEY, [self._bucket(d, t) for d, t in buckets])
+        return [bucket for bucket, count in zip(buckets, counts) if count]
 
-        picked = None
-        to_reinsert = []
-        for member, score in batch:
-            data = json.loads(member)
-            if data.get("user_id") != exclude_user_id:
-                picked = data
-                # don't reinsert picked (we are consuming it)
-                continue
-            # skip self -> keep ordering by re-inserting
-            to_reinsert.append((member, score))
-
-        # Reinsert skipped ones with original score
-        if to_reinsert:
-            self.redis_client.zadd(key, {m: s for (m, s) in to_reinsert})
-
-        return picked
-    
-    def remove_from_queue(self, request_id: str, difficulty: str, topic: str):
+    async def pop_batch(self, difficulty: str, topic: str, limit: int) -> List[dict]:
+        """Atomically remove and return up to `limit` of the oldest entries in a bucket"""
+        result = await self._pop_batch(
+            keys=self._bucket_keys(difficulty, topic),
+            args=[limit, self._bucket(difficulty, topic)],
+            client=self.redis_client,
+        )
+        entries = []
+        for request_id, meta in zip(result[::2], result[1::2]):
+            # Members without metadata cannot be matched; they stay dropped
+            if meta:
+                entries.append(self._to_entry(request_id, meta))
+        return entries
+
+    async def claim_partner(
+        self,
+        request_id: str,
+        user_id: str,
+        difficulty: str,
+        topic: str,
+        candidates: List[Tuple[str, str]]
+    ) -> Optional[Tuple[dict, dict]]:
+        """
+        Atomically take a queued request and the oldest entry of another user
+        heading any of the candidate buckets. Both entries are returned
+        tagged with the bucket they came from, or None if nothing qualifies.
+        """
+        if not candidates:
+            return None
+        keys = self._bucket_keys(difficulty, topic)
+        for d, t in candidates:
+            keys += [self._get_queue_key(d, t), self._get_meta_key(d, t)]
+        result = await self._claim_partner(
+            keys=keys,
+            args=[request_id, user_id, self._bucket(difficulty, topic), *(self._bucket(d, t) for d, t in candidates)],
+            client=self.redis_client,
+        )
+        if not result:
+            return None
+        own_meta, partner_id, partner_meta, partner_bucket = result
+        partner_difficulty, _, partner_topic = partner_bucket.partition(":")
+        own = {**self._to_entry(request_id, own_meta), "difficulty": difficulty, "topic": topic}
+        partner = {**self._to_entry(partner_id, partner_meta), "difficulty": partner_difficulty, "topic": partner_topic}
+        return own, partner
+
+    async def restore_entries(self, difficulty: str, topic: str, entries: List[dict]):
+        """
+        Put popped entries back with their original position in the queue.
+
+        Entries tagged with their own difficulty/topic go back to that bucket.
+        Listeners are not notified: restoring entries creates no new pair.
+        """
+        by_bucket: Dict[Tuple[str, str], List[Tuple[str, str, datetime]]] = {}
+        for entry in entries:
+            bucket = (entry.get("difficulty", difficulty), entry.get("topic", topic))
+            by_bucket.setdefault(bucket, []).append(
+                (entry["request_id"], entry["user_id"], datetime.fromisoformat(entry["timestamp"]))
+            )
+        for (d, t), bucket_entries in by_bucket.items():
+            await self._write_entries(d, t, bucket_entries)
+
+    async def remove_from_queue(self, request_id: str, difficulty: str, topic: str):
         """Remove specific request from queue"""
-        queue_key = self._get_queue_key(difficulty, topic)
-        
-        # Find and remove the request
-        all_requests = self.redis_client.zrange(queue_key, 0, -1)
-        for req in all_requests:
-            data = json.loads(req)
-            if data["request_id"] == request_id:
-                self.redis_client.zrem(queue_key, req)
-                break
-    
-    def get_queue_size(self, difficulty: str, topic: str) -> int:
+        await self._remove_entries(
+            keys=self._bucket_keys(difficulty, topic),
+            args=[self._bucket(difficulty, topic), request_id],
+            client=self.redis_client,
+        )
+
+    async def remove_many_from_queue(self, entries: List[Tuple[str, str, str]]):
+        """Remove several (request_id, difficulty, topic) entries in one round trip"""
+        if not entries:
+            return
+        by_bucket: Dict[Tuple[str, str], List[str]] = {}
+        for request_id, difficulty, topic in entries:
+            by_bucket.setdefault((difficulty, topic), []).append(request_id)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for (difficulty, topic), request_ids in by_bucket.items():
+                await self._remove_entries(
+                    keys=self._bucket_keys(difficulty, topic),
+                    args=[self._bucket(difficulty, topic), *request_ids],
+                    client=pipe,
+                )
+            await pipe.execute()
+
+    async def get_queue_size(self, difficulty: str, topic: str) -> int:
         """Get current queue size for monitoring"""
         queue_key = self._get_queue_key(difficulty, topic)
-        return self.redis_client.zcard(queue_key)
+        return await self.redis_client.zcard(queue_key)
 
-matching_queue = MatchingQueue()
\ No newline at end of file
+matching_queue = MatchingQueue()
@@ -0,0 +1,41 @@
+from typing import Dict, List, Set
+
+# Question Service topics (LeetCode tags) that practise overlapping skills.
+# Used to widen the search for users who have waited a while in a sparse
+# topic; relations are symmetric, see related_topics().
+_TOPIC_GROUPS: Dict[str, List[str]] = {
+    "Array": ["Two Pointers", "Sliding Window", "Prefix Sum", "Sorting", "Hash Table", "Matrix"],
+    "String": ["Two Pointers", "Sliding Window", "Hash Table", "String Matching", "Trie"],
+    "Hash Table": ["Array", "String", "Counting"],
+    "Linked List": ["Two Pointers", "Recursion", "Stack"],
+    "Stack": ["Queue", "Monotonic Stack", "Linked List", "Recursion"],
+    "Queue": ["Stack", "Breadth-First Search", "Monotonic Queue"],
+    "Tree": ["Binary Tree", "Binary Search Tree", "Depth-First Search", "Breadth-First Search", "Recursion"],
+    "Binary Tree": ["Tree", "Binary Search Tree", "Depth-First Search", "Breadth-First Search"],
+    "Graph": ["Depth-First Search", "Breadth-First Search", "Union Find", "Topological Sort", "Shortest Path"],
+    "Dynamic Programming": ["Memoization", "Recursion", "Greedy", "Backtracking"],
+    "Backtracking": ["Recursion", "Depth-First Search", "Dynamic Programming"],
+    "Greedy": ["Sorting", "Heap (Priority Queue)", "Dynamic Programming"],
+    "Binary Search": ["Sorting", "Array", "Binary Search Tree"],
+    "Heap (Priority Queue)": ["Sorting", "Greedy"],
+    "Math": ["Bit Manipulation", "Number Theory", "Geometry"],
+    "Bit Manipulation": ["Math"],
+    "Recursion": ["Divide and Conquer", "Memoization"],
+}
+
+
+def _build() -> Dict[str, Set[str]]:
+    related: Dict[str, Set[str]] = {}
+    for topic, others in _TOPIC_GROUPS.items():
+        for other in others:
+            related.setdefault(topic, set()).add(other)
+            related.setdefault(other, set()).add(topic)
+    return related
+
+
+RELATED_TOPICS = _build()
+
+
+def related_topics(topic: str) -> List[str]:
+    """Topics close enough to `topic` to pair users who waited too long"""
+    return sorted(RELATED_TOPICS.get(topic, ()))
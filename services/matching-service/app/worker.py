@@ -0,0 +1,42 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def start_matching():
+    """Start the matching tier: bucket matcher, deadline poller and archiver"""
+    from app.services.notifier import register_matching_handlers
+    from app.services.matcher import matcher
+    from app.services.deadline_scheduler import deadline_scheduler
+    from app.services.archiver import archiver
+
+    register_matching_handlers()
+    await matcher.start()
+    logger.info("✓ Matcher started")
+    await deadline_scheduler.start()
+    logger.info("✓ Deadline scheduler started")
+    await archiver.start()
+
+
+async def stop_matching():
+    """Stop the matching tier; queued entries and deadlines stay in Redis"""
+    from app.services.matcher import matcher
+    from app.services.deadline_scheduler import deadline_scheduler
+    from app.services.archiver import archiver
+
+    try:
+        await matcher.stop()
+        logger.info("✓ Matcher stopped")
+    except Exception as e:
+        logger.error(f"Error stopping matcher: {e}")
+
+    try:
+        await deadline_scheduler.stop()
+        logger.info("✓ Deadline scheduler stopped")
+    except Exception as e:
+        logger.error(f"Error stopping deadline scheduler: {e}")
+
+    try:
+        await archiver.stop()
+    except Exception as e:
+        logger.error(f"Error stopping archiver: {e}")
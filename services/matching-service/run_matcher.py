@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+
+logging.basicConfig(
+    level=getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger("matching-worker")
+
+
+async def main():
+    """
+    Matcher worker: pairs queued requests and handles request/confirmation
+    deadlines, separate from the API. API replicas (EMBEDDED_MATCHER=false)
+    wake it over Redis pub/sub and receive its user events the same way.
+    """
+    from app.worker import start_matching, stop_matching
+    from app.core.database import engine
+    from app.core.redis import close_redis_client
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info("Starting PeerPrep matcher worker")
+    await start_matching()
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Shutting down PeerPrep matcher worker")
+        await stop_matching()
+        await engine.dispose()
+        await close_redis_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
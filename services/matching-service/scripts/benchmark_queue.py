@@ -0,0 +1,115 @@
+"""
+Benchmark matching-queue lookup, removal and re-queue as a bucket grows
+
+Usage:
+    python scripts/benchmark_queue.py                   # uses REDIS_URL from settings
+    python scripts/benchmark_queue.py --redis-url redis://localhost:6381/0
+    python scripts/benchmark_queue.py --fakeredis       # in-process, needs `pip install fakeredis[lua]`
+
+Each operation should cost the same whether the bucket holds 1k or 100k
+entries, since entries are addressed by request_id instead of scanned.
+"""
+import sys
+import os
+import time
+import asyncio
+import random
+import argparse
+import json
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.config import settings
+from app.utils.matching_queue import matching_queue, OCCUPANCY_KEY
+
+DIFFICULTY = "Benchmark"
+TOPIC = "queue-benchmark"
+SIZES = [1_000, 10_000, 100_000]
+OPS_PER_SIZE = 2_000
+
+
+async def fill_bucket(size: int):
+    """Grow the benchmark bucket to `size` entries"""
+    client = matching_queue.redis_client
+    key = matching_queue._get_queue_key(DIFFICULTY, TOPIC)
+    meta_key = matching_queue._get_meta_key(DIFFICULTY, TOPIC)
+    start = await client.zcard(key)
+    now = datetime.now(timezone.utc)
+
+    for chunk_start in range(start, size, 10_000):
+        pipe = client.pipeline(transaction=False)
+        for i in range(chunk_start, min(chunk_start + 10_000, size)):
+            meta = json.dumps({"user_id": f"user-{i}", "timestamp": now.isoformat()}, separators=(",", ":"))
+            pipe.zadd(key, {f"req-{i}": now.timestamp() + i})
+            pipe.hset(meta_key, f"req-{i}", meta)
+        await pipe.execute()
+
+
+async def time_op(label: str, size: int, op) -> float:
+    ids = [f"req-{random.randrange(size)}" for _ in range(OPS_PER_SIZE)]
+    started = time.perf_counter()
+    for request_id in ids:
+        await op(request_id)
+    elapsed = time.perf_counter() - started
+    per_op_us = elapsed / OPS_PER_SIZE * 1_000_000
+    print(f"  {label:<22} {per_op_us:>10.1f} µs/op")
+    return per_op_us
+
+
+async def requeue(request_id: str):
+    await matching_queue.remove_from_queue(request_id, DIFFICULTY, TOPIC)
+    await matching_queue.add_to_queue(request_id, f"user-{request_id}", DIFFICULTY, TOPIC)
+
+
+async def cleanup():
+    await matching_queue.redis_client.delete(
+        matching_queue._get_queue_key(DIFFICULTY, TOPIC),
+        matching_queue._get_meta_key(DIFFICULTY, TOPIC),
+    )
+    await matching_queue.redis_client.zrem(OCCUPANCY_KEY, f"{DIFFICULTY}:{TOPIC}")
+
+
+async def run(args):
+    if args.fakeredis:
+        from fakeredis import aioredis
+        matching_queue.redis_client = aioredis.FakeRedis(decode_responses=True)
+        target = "fakeredis"
+    else:
+        from redis.asyncio import Redis
+        matching_queue.redis_client = Redis.from_url(args.redis_url, decode_responses=True)
+        target = args.redis_url
+
+    print("=" * 60)
+    print(f"Matching queue benchmark against {target}")
+    print("=" * 60)
+
+    await cleanup()
+    results = {}
+    try:
+        for size in SIZES:
+            await fill_bucket(size)
+            print(f"\nBucket size {await matching_queue.get_queue_size(DIFFICULTY, TOPIC):,}")
+            results[size] = {
+                "lookup": await time_op("lookup (get_entry)", size, lambda r: matching_queue.get_entry(r, DIFFICULTY, TOPIC)),
+                "remove+requeue": await time_op("remove + re-queue", size, requeue),
+            }
+    finally:
+        await cleanup()
+
+    print("\nCost relative to the smallest bucket:")
+    smallest = results[SIZES[0]]
+    for size in SIZES[1:]:
+        ratios = ", ".join(f"{op} x{results[size][op] / smallest[op]:.2f}" for op in smallest)
+        print(f"  {size:>7,}: {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=settings.REDIS_URL)
+    parser.add_argument("--fakeredis", action="store_true", help="run against an in-process fakeredis server")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
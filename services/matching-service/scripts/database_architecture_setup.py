@@ -4,6 +4,7 @@ Run this before starting the service for the first time
 """
 import sys
 import os
+import asyncio
 
 # Add parent directory to path so we can import from app
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -13,6 +14,13 @@ from app.models.match_request import MatchRequest
 from app.models.match import Match
 
 
+async def _run_on_engine(fn):
+    """Run a sync metadata operation (create_all/drop_all) on the async engine"""
+    async with engine.begin() as conn:
+        await conn.run_sync(fn)
+    await engine.dispose()
+
+
 def create_tables():
     """Create all tables in the database"""
     print("=" * 60)
@@ -26,7 +34,7 @@ def create_tables():
         print("  2. matches")
         
         # Create all tables
-        Base.metadata.create_all(bind=engine)
+        asyncio.run(_run_on_engine(Base.metadata.create_all))
         
         print("\n✓ Tables created successfully!")
         print("\nDatabase schema:")
@@ -56,7 +64,7 @@ def drop_tables():
     
     if response.lower() == 'yes':
         try:
-            Base.metadata.drop_all(bind=engine)
+            asyncio.run(_run_on_engine(Base.metadata.drop_all))
             print("✓ All tables dropped successfully")
         except Exception as e:
             print(f"✗ Error dropping tables: {e}")
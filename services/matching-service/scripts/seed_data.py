@@ -3,12 +3,13 @@ Test database and Redis connections before running the service
 """
 import sys
 import os
+import redis
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from app.core.config import settings
-from app.core.database import engine
-from app.utils.matching_queue import matching_queue
+from sqlalchemy import create_engine, text
+from app.utils.matching_queue import QUEUE_KEY_PREFIX
 
 
 def test_database():
@@ -18,9 +19,12 @@ def test_database():
     print("=" * 60)
     
     try:
+        # The service itself uses the async engine; a sync one is enough here
+        engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+
         # Try to connect
         with engine.connect() as conn:
-            result = conn.execute("SELECT version();")
+            result = conn.execute(text("SELECT version();"))
             version = result.fetchone()[0]
             
             print("✓ Database connection successful!")
@@ -28,11 +32,11 @@ def test_database():
             print(f"  Database: {settings.DATABASE_URL.split('/')[-1]}")
             
             # Check if tables exist
-            result = conn.execute("""
+            result = conn.execute(text("""
                 SELECT table_name 
                 FROM information_schema.tables 
                 WHERE table_schema = 'public'
-            """)
+            """))
             tables = [row[0] for row in result.fetchall()]
             
             if tables:
@@ -58,26 +62,29 @@ def test_redis():
     print("=" * 60)
     
     try:
+        # The service itself uses the async client; a sync one is enough here
+        redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+
         # Try to ping Redis
-        response = matching_queue.redis_client.ping()
+        response = redis_client.ping()
         
         if response:
             print("✓ Redis connection successful!")
             print(f"  Redis URL: {settings.REDIS_URL}")
             
             # Try to set and get a test value
-            matching_queue.redis_client.set("test_key", "test_value", ex=5)
-            value = matching_queue.redis_client.get("test_key")
+            redis_client.set("test_key", "test_value", ex=5)
+            value = redis_client.get("test_key")
             
             if value == "test_value":
                 print("  ✓ Read/Write operations working")
             
             # Check for any existing queue data
-            keys = matching_queue.redis_client.keys("matching_queue:*")
+            keys = redis_client.keys(f"{QUEUE_KEY_PREFIX}*")
             if keys:
                 print(f"\n  Active matching queues: {len(keys)}")
                 for key in keys[:5]:  # Show first 5
-                    size = matching_queue.redis_client.zcard(key)
+                    size = redis_client.zcard(key)
                     print(f"    - {key}: {size} waiting users")
             
             return True
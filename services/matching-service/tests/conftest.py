@@ -0,0 +1,44 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+import pytest_asyncio
+
+# Every module takes its settings, engine and Redis client at import, so the
+# test database (SQLite through aiosqlite) and Redis (fakeredis, with Lua)
+# are put in place before anything from app is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'matching_test.db')}"
+
+from fakeredis import aioredis
+
+import app.core.redis as core_redis
+
+core_redis.redis_client = aioredis.FakeRedis(decode_responses=True)
+
+from app.core.database import Base, SessionLocal, engine
+import app.models  # noqa: F401  (registers the tables)
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """One loop for the whole run: the engine and Redis client outlive a test"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    yield core_redis.redis_client
+    await core_redis.redis_client.flushall()
+
+
+@pytest_asyncio.fixture
+async def db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        yield session
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.admission import ACTIVE_REQUESTS_KEY, AdmissionController, AdmissionRejected
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_MATCHES", 2)
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_PER_MINUTE", 60)
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_BURST", 2)
+    return AdmissionController()
+
+
+@pytest.mark.asyncio
+async def test_capacity_is_shared_and_released(admission, redis_client):
+    """Test slots are capped across users and freed by release, then taken again by readmit"""
+    await admission.admit("u1", "r1")
+    await admission.admit("u2", "r2")
+    with pytest.raises(AdmissionRejected, match="capacity"):
+        await admission.admit("u3", "r3")
+
+    await admission.release("r1")
+    await admission.admit("u3", "r3")
+    await admission.readmit("r1")
+    assert await redis_client.zcard(ACTIVE_REQUESTS_KEY) == 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_per_user(admission, redis_client):
+    """Test a user past the burst is told when to retry while others are unaffected"""
+    await admission.admit("u1", "r1")
+    await admission.release("r1")
+    await admission.admit("u1", "r2")
+    await admission.release("r2")
+
+    with pytest.raises(AdmissionRejected, match="slow down") as rejected:
+        await admission.admit("u1", "r3")
+    assert rejected.value.retry_after == 1
+    await admission.admit("u2", "r4")
+
+
+@pytest.mark.asyncio
+async def test_busy_rejection_costs_no_token(admission, redis_client):
+    """Test retries turned away at capacity leave the user's token bucket untouched"""
+    await admission.admit("u1", "r1")
+    await admission.admit("u2", "r2")
+    for attempt in range(5):
+        with pytest.raises(AdmissionRejected, match="capacity"):
+            await admission.admit("u3", f"busy{attempt}")
+
+    await admission.release("r1", "r2")
+    await admission.admit("u3", "r3")
+    await admission.admit("u3", "r4")
+
+
+@pytest.mark.asyncio
+async def test_leaked_slots_expire(admission, redis_client):
+    """Test slots older than a request could live are reclaimed"""
+    stale = time.time() - admission._slot_lifetime() - 1
+    await redis_client.zadd(ACTIVE_REQUESTS_KEY, {"leaked1": stale, "leaked2": stale})
+
+    await admission.admit("u1", "r1")
+    assert await redis_client.zrange(ACTIVE_REQUESTS_KEY, 0, -1) == ["r1"]
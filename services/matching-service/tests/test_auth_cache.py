@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from app.core import auth
+from app.core.config import settings
+
+
+def make_token(user_id: str, expires_in: float = 3600) -> str:
+    claims = {"sub": user_id, "type": "access"}
+    if expires_in is not None:
+        claims["exp"] = int(time.time() + expires_in)
+    return jwt.encode(claims, settings.AUTH_ACCESS_SECRET, algorithm=settings.AUTH_ALGORITHM)
+
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    auth._principal_cache.clear()
+    yield
+    auth._principal_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_verified_token_is_served_from_cache(monkeypatch):
+    """Test a second request with the same token skips decoding"""
+    token = make_token("u1")
+    assert (await auth.verify_token(bearer(token)))["user_id"] == "u1"
+
+    def decode_again(token):
+        raise AssertionError("token decoded twice")
+
+    monkeypatch.setattr(auth, "decode_access_token", decode_again)
+    assert (await auth.verify_token(bearer(token)))["user_id"] == "u1"
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(monkeypatch):
+    """Test the oldest unused principal is dropped once the cache is full"""
+    monkeypatch.setattr(settings, "AUTH_CACHE_MAX_ENTRIES", 2)
+    t1, t2, t3 = make_token("u1"), make_token("u2"), make_token("u3")
+    await auth.verify_token(bearer(t1))
+    await auth.verify_token(bearer(t2))
+    await auth.verify_token(bearer(t1))  # t2 is now the least recently used
+    await auth.verify_token(bearer(t3))
+
+    assert list(auth._principal_cache) == [t1, t3]
+
+
+@pytest.mark.asyncio
+async def test_rejected_token_is_not_cached():
+    """Test a token that fails verification leaves nothing behind"""
+    with pytest.raises(HTTPException):
+        await auth.verify_token(bearer("not-a-token"))
+    assert len(auth._principal_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_expired_and_unexpiring_tokens_are_not_served_from_cache():
+    """Test cached principals end with the token, and tokens without exp are never cached"""
+    token = make_token("u1")
+    await auth.verify_token(bearer(token))
+    principal, _ = auth._principal_cache[token]
+    auth._principal_cache[token] = (principal, time.time() - 1)
+
+    assert auth._cache_get(token) is None
+    assert token not in auth._principal_cache
+
+    await auth.verify_token(bearer(make_token("u2", expires_in=None)))
+    assert len(auth._principal_cache) == 0
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.match import Match
+from app.models.match_request import DifficultyLevel, MatchRequest, MatchStatus
+from app.services.deadline_scheduler import CONFIRM_TIMEOUT, DEADLINES_KEY
+from app.services.matcher import matcher
+from app.services.matching_service import matching_service
+from app.utils.matching_queue import OCCUPANCY_KEY, matching_queue
+
+EASY = DifficultyLevel.EASY.value
+
+
+async def queue_request(db, request_id, user_id, status=MatchStatus.PENDING, age=0.0):
+    """A request row plus its queue entry, `age` seconds old"""
+    created = datetime.now(timezone.utc) - timedelta(seconds=age)
+    db.add(MatchRequest(
+        id=request_id, user_id=user_id, difficulty=DifficultyLevel.EASY,
+        topic="Array", status=status, created_at=created,
+    ))
+    await db.commit()
+    await matching_queue._write_entries(EASY, "Array", [(request_id, user_id, created)])
+
+
+@pytest.mark.asyncio
+async def test_pop_batch_takes_oldest_entries(redis_client):
+    """Test POP_BATCH_SCRIPT removes the oldest entries in order and keeps the occupancy index"""
+    now = datetime.now(timezone.utc)
+    await matching_queue._write_entries(EASY, "Array", [
+        ("r3", "u3", now), ("r1", "u1", now - timedelta(seconds=2)), ("r2", "u2", now - timedelta(seconds=1)),
+    ])
+
+    batch = await matching_queue.pop_batch(EASY, "Array", 2)
+
+    assert [e["request_id"] for e in batch] == ["r1", "r2"]
+    assert batch[0]["user_id"] == "u1"
+    assert await redis_client.zscore(OCCUPANCY_KEY, f"{EASY}:Array") == 1
+    await matching_queue.pop_batch(EASY, "Array", 2)
+    assert await matching_queue.get_active_buckets() == []
+
+
+@pytest.mark.asyncio
+async def test_batch_pairs_oldest_first_and_requeues_the_rest(db, redis_client):
+    """Test a batch is paired in queue order, never with oneself, in one transaction"""
+    await queue_request(db, "a", "u1", age=3)
+    await queue_request(db, "b", "u1", age=2)
+    await queue_request(db, "c", "u2", age=1)
+
+    entries = await matching_queue.pop_batch(EASY, "Array", 10)
+    matches = await matching_service.create_matches(db, EASY, "Array", entries)
+
+    assert [(m.request1_id, m.request2_id) for m in matches] == [("a", "c")]
+    statuses = dict((await db.execute(select(MatchRequest.id, MatchRequest.status))).all())
+    assert statuses == {"a": MatchStatus.MATCHED, "b": MatchStatus.PENDING, "c": MatchStatus.MATCHED}
+    assert await matching_queue.get_entry("b", EASY, "Array") is not None
+    assert await redis_client.zscore(DEADLINES_KEY, f"{CONFIRM_TIMEOUT}:{matches[0].id}")
+
+
+@pytest.mark.asyncio
+async def test_drain_continues_past_a_batch_of_dropped_entries(db, redis_client, monkeypatch):
+    """Test a batch that only dropped stale entries doesn't stop the bucket from being paired"""
+    monkeypatch.setattr(settings, "MATCH_BATCH_SIZE", 2)
+    await queue_request(db, "a", "u1", age=3)
+    await queue_request(db, "stale", "u1", status=MatchStatus.CANCELLED, age=2)
+    await queue_request(db, "b", "u2", age=1)
+
+    assert await matcher._drain(EASY, "Array") is False
+
+    assert (await db.scalars(select(Match.request2_id))).all() == ["b"]
+    assert await matching_queue.get_queue_size(EASY, "Array") == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_asks_for_a_retry_when_the_batch_is_held_elsewhere(db, redis_client):
+    """Test entries put back untouched (rows locked by another matcher) are retried later"""
+    now = datetime.now(timezone.utc)
+    # Fresh entries without a row readable here look exactly like SKIP LOCKED rows
+    await matching_queue._write_entries(EASY, "Array", [("x", "u1", now), ("y", "u2", now)])
+
+    assert await matcher._drain(EASY, "Array") is True
+    assert await matching_queue.get_queue_size(EASY, "Array") == 2
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.deadline_scheduler import DEADLINES_KEY, INFLIGHT_KEY, DeadlineScheduler
+
+
+@pytest.mark.asyncio
+async def test_due_deadlines_fire_once_per_kind(redis_client):
+    """Test due deadlines reach their kind's handler in one call and are then gone"""
+    scheduler = DeadlineScheduler()
+    fired = []
+
+    async def handler(ids):
+        fired.append(sorted(ids))
+
+    scheduler.register("a", handler)
+    await scheduler.schedule_many("a", ["r1", "r2"], -1)
+    await scheduler.schedule("a", "later", 60)
+
+    assert await scheduler.poll_once() == 2
+    assert fired == [["r1", "r2"]]
+    assert await scheduler.poll_once() == 0
+    assert await redis_client.zrange(DEADLINES_KEY, 0, -1) == ["a:later"]
+    assert await redis_client.zcard(INFLIGHT_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_handler_retries_without_overwriting_reschedule(redis_client):
+    """Test a failed batch comes back after the retry delay, but a newer schedule wins"""
+    scheduler = DeadlineScheduler()
+
+    async def failing(ids):
+        await scheduler.schedule("a", "r2", 60)
+        raise RuntimeError("db down")
+
+    scheduler.register("a", failing)
+    await scheduler.schedule_many("a", ["r1", "r2"], -1)
+    await scheduler.poll_once()
+
+    scores = dict(await redis_client.zrange(DEADLINES_KEY, 0, -1, withscores=True))
+    assert scores["a:r2"] - scores["a:r1"] > 60 - settings.DEADLINE_RETRY_DELAY_SECONDS - 1
+    assert await redis_client.zcard(INFLIGHT_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_deadlines_of_a_dead_poller_are_claimed_again(redis_client, monkeypatch):
+    """Test deadlines whose handler never finished fire again once the lease runs out"""
+    scheduler = DeadlineScheduler()
+
+    async def dies(ids):
+        raise asyncio.CancelledError()
+
+    scheduler.register("a", dies)
+    await scheduler.schedule("a", "r1", -1)
+    monkeypatch.setattr(settings, "DEADLINE_LEASE_SECONDS", 0)
+    with pytest.raises(asyncio.CancelledError):
+        await scheduler.poll_once()
+    assert await redis_client.zrange(INFLIGHT_KEY, 0, -1) == ["a:r1"]
+
+    fired = []
+
+    async def handler(ids):
+        fired.append(ids)
+
+    scheduler.register("a", handler)
+    monkeypatch.setattr(settings, "DEADLINE_LEASE_SECONDS", 30)
+    assert await scheduler.poll_once() == 1
+    assert fired == [["r1"]]
+    assert await redis_client.zcard(INFLIGHT_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_drops_scheduled_and_leased_deadlines(redis_client):
+    """Test a cancelled deadline neither fires nor comes back from an expired lease"""
+    scheduler = DeadlineScheduler()
+    await scheduler.schedule("a", "r1", 60)
+    await redis_client.zadd(INFLIGHT_KEY, {"a:r2": 0})
+
+    await scheduler.cancel("a", "r1", "r2")
+
+    assert await redis_client.zcard(DEADLINES_KEY) == 0
+    assert await redis_client.zcard(INFLIGHT_KEY) == 0
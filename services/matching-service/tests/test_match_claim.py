@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.models.match import Match
+from app.models.match_request import DifficultyLevel, MatchRequest, MatchStatus
+from app.services.matching_service import matching_service
+from app.utils.matching_queue import matching_queue
+
+EASY = DifficultyLevel.EASY.value
+
+# SQLite has no row locks (FOR UPDATE SKIP LOCKED compiles to a plain
+# SELECT), so a row locked by another matcher is stood in for by an entry
+# whose row the claim cannot see.
+
+
+def entry(request_id, user_id, age=0.0):
+    timestamp = datetime.now(timezone.utc) - timedelta(seconds=age)
+    return {"request_id": request_id, "user_id": user_id, "timestamp": timestamp.isoformat()}
+
+
+async def add_request(db, request_id, user_id, status=MatchStatus.PENDING):
+    db.add(MatchRequest(
+        id=request_id, user_id=user_id, difficulty=DifficultyLevel.EASY,
+        topic="Array", status=status, created_at=datetime.now(timezone.utc),
+    ))
+    await db.commit()
+
+
+async def queued_ids():
+    return [e["request_id"] for e in await matching_queue.pop_batch(EASY, "Array", 100)]
+
+
+@pytest.mark.asyncio
+async def test_claim_drops_finished_entries_and_restores_locked_ones(db, redis_client):
+    """Test only still-pending requests are paired; locked rows go back, finished and orphaned ones don't"""
+    await add_request(db, "a", "u1")
+    await add_request(db, "done", "u2", status=MatchStatus.CANCELLED)
+    orphan = entry("orphan", "u3", age=settings.MATCHING_TIMEOUT_SECONDS + 1)
+
+    matches = await matching_service.create_matches(
+        db, EASY, "Array", [entry("a", "u1", 3), entry("done", "u2", 2), orphan, entry("locked", "u4", 1)]
+    )
+
+    assert matches == []
+    assert sorted(await queued_ids()) == ["a", "locked"]
+
+
+@pytest.mark.asyncio
+async def test_failed_claim_loses_no_entry(db, redis_client, monkeypatch):
+    """Test a claim that fails to commit leaves every request pending and queued"""
+    await add_request(db, "a", "u1")
+    await add_request(db, "b", "u2")
+
+    async def commit_fails():
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(db, "commit", commit_fails)
+    with pytest.raises(RuntimeError):
+        await matching_service.create_matches(
+            db, EASY, "Array", [entry("a", "u1", 2), entry("b", "u2", 1), entry("locked", "u3")]
+        )
+    monkeypatch.undo()
+
+    assert sorted(await queued_ids()) == ["a", "b", "locked"]
+    assert await db.scalar(select(func.count()).select_from(Match)) == 0
+    statuses = (await db.scalars(select(MatchRequest.status))).all()
+    assert statuses == [MatchStatus.PENDING, MatchStatus.PENDING]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.match_request import DifficultyLevel, MatchRequest, MatchStatus
+from app.services.deadline_scheduler import DEADLINES_KEY, REQUEST_RELAX
+from app.services.matching_service import matching_service
+from app.utils.matching_queue import matching_queue
+
+EASY, MEDIUM, HARD = (d.value for d in DifficultyLevel)
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(settings, "MATCH_RELAXATION_ENABLED", True)
+    monkeypatch.setattr(settings, "MATCH_RELAX_ANY_DIFFICULTY_AFTER_SECONDS", 15)
+    monkeypatch.setattr(settings, "MATCH_RELAX_RELATED_TOPICS_AFTER_SECONDS", 30)
+    monkeypatch.setattr(settings, "MATCH_RELAX_INTERVAL_SECONDS", 5)
+    monkeypatch.setattr(settings, "MATCHING_TIMEOUT_SECONDS", 60)
+
+
+async def queue_request(db, request_id, user_id, difficulty, topic, age):
+    """A pending request row plus its queue entry, `age` seconds old"""
+    created = datetime.now(timezone.utc) - timedelta(seconds=age)
+    db.add(MatchRequest(
+        id=request_id, user_id=user_id, difficulty=DifficultyLevel(difficulty),
+        topic=topic, status=MatchStatus.PENDING, created_at=created,
+    ))
+    await db.commit()
+    await matching_queue._write_entries(difficulty, topic, [(request_id, user_id, created)])
+
+
+@pytest.mark.asyncio
+async def test_claim_partner_takes_oldest_head_of_another_user(redis_client):
+    """Test CLAIM_PARTNER_SCRIPT skips the caller's own entries and picks the oldest candidate head"""
+    now = datetime.now(timezone.utc)
+    await matching_queue._write_entries(EASY, "Array", [("own", "u1", now)])
+    await matching_queue._write_entries(MEDIUM, "Array", [
+        ("mine", "u1", now - timedelta(seconds=5)), ("newer", "u2", now - timedelta(seconds=3)),
+    ])
+    await matching_queue._write_entries(HARD, "Array", [("oldest", "u3", now - timedelta(seconds=4))])
+
+    own, partner = await matching_queue.claim_partner(
+        "own", "u1", EASY, "Array", [(MEDIUM, "Array"), (HARD, "Array")]
+    )
+
+    assert (own["request_id"], partner["request_id"]) == ("own", "oldest")
+    assert (partner["difficulty"], partner["topic"]) == (HARD, "Array")
+    assert sorted(await matching_queue.get_active_buckets()) == [(MEDIUM, "Array")]
+    assert await matching_queue.claim_partner("own", "u1", EASY, "Array", [(MEDIUM, "Array")]) is None
+
+
+@pytest.mark.asyncio
+async def test_waiting_request_matches_at_another_difficulty(db, redis_client):
+    """Test a request past the first threshold pairs with the same topic at any difficulty"""
+    await queue_request(db, "waiting", "u1", EASY, "Array", age=20)
+    await queue_request(db, "fresh", "u2", MEDIUM, "Array", age=1)
+
+    matches = await matching_service.relax_requests(db, ["waiting"])
+
+    assert [(m.request1_id, m.request2_id, m.difficulty) for m in matches] == [("waiting", "fresh", MEDIUM)]
+    statuses = (await db.scalars(select(MatchRequest.status))).all()
+    assert statuses == [MatchStatus.MATCHED, MatchStatus.MATCHED]
+
+
+@pytest.mark.asyncio
+async def test_related_topics_only_after_the_longer_wait(db, redis_client):
+    """Test related topics are searched only after the second threshold; until then the request is rechecked"""
+    await queue_request(db, "waiting", "u1", EASY, "Array", age=20)
+    await queue_request(db, "related", "u2", EASY, "Two Pointers", age=1)
+
+    assert await matching_service.relax_requests(db, ["waiting"]) == []
+    assert await redis_client.zscore(DEADLINES_KEY, f"{REQUEST_RELAX}:waiting")
+
+    await matching_queue.remove_from_queue("waiting", EASY, "Array")
+    created = datetime.now(timezone.utc) - timedelta(seconds=31)
+    await matching_queue._write_entries(EASY, "Array", [("waiting", "u1", created)])
+
+    matches = await matching_service.relax_requests(db, ["waiting"])
+    assert [(m.request1_id, m.topic) for m in matches] == [("waiting", "Two Pointers")]
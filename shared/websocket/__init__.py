@@ -0,0 +1,11 @@
+"""
+WebSocket delivery helpers shared by the real-time services.
+
+```python
+from shared.websocket.connection import ClientConnection
+
+connection = ClientConnection(user_id, websocket, queue_size=64, send_timeout=5)
+connection.send(json.dumps(message))
+await connection.serve(on_message)
+```
+"""
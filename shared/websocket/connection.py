@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# What to do with a message that does not fit in a full send queue
+CLOSE_SLOW_CLIENT = "close"
+DROP_OLDEST = "drop_oldest"
+
+
+class ClientConnection:
+    """
+    One WebSocket with its own writer task and bounded send queue, so a slow
+    or half-dead client only ever delays itself.
+
+    Messages are queued already encoded, so a broadcast encodes once for all
+    recipients. Messages sent with a `coalesce_key` replace a queued message
+    with the same key (e.g. the latest cursor position of a peer), and are
+    dropped rather than overflow the queue. Any other overflow, and any send
+    slower than `send_timeout`, closes the socket with code 1013, unless the
+    policy is DROP_OLDEST. Counters go to `metrics` ("coalesced_messages",
+    "dropped_messages", "slow_disconnects").
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        websocket: Any,
+        queue_size: int,
+        send_timeout: float,
+        slow_client_policy: str = CLOSE_SLOW_CLIENT,
+        metrics: Optional[Dict[str, int]] = None,
+    ):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.slow_client_policy = slow_client_policy
+        self.metrics = metrics if metrics is not None else {}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Coalesce key -> latest payload of a queued message
+        self._pending: Dict[str, str] = {}
+        self.last_seen = time.monotonic()
+        self.closed = asyncio.Event()
+        self._writer = asyncio.create_task(self._write())
+
+    def _count(self, name: str):
+        self.metrics[name] = self.metrics.get(name, 0) + 1
+
+    def send(self, data: str, coalesce_key: Optional[str] = None):
+        """Queue an encoded message without waiting on the socket"""
+        if self.closed.is_set():
+            return
+        if coalesce_key is not None:
+            if coalesce_key in self._pending:
+                self._pending[coalesce_key] = data
+                self._count("coalesced_messages")
+            elif self.queue.full():
+                self._count("dropped_messages")
+            else:
+                self._pending[coalesce_key] = data
+                self.queue.put_nowait((coalesce_key, None))
+            return
+        try:
+            self.queue.put_nowait((None, data))
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_client_policy == DROP_OLDEST:
+            key, _ = self.queue.get_nowait()
+            self.queue.task_done()
+            if key is not None:
+                self._pending.pop(key, None)
+            self.queue.put_nowait((None, data))
+            self._count("dropped_messages")
+        else:
+            logger.warning(f"Send queue full for {self.user_id}; disconnecting")
+            self._count("slow_disconnects")
+            self._abort(code=1013)
+
+    def send_json(self, message: dict):
+        self.send(json.dumps(message))
+
+    async def _write(self):
+        try:
+            while True:
+                key, data = await self.queue.get()
+                if key is not None:
+                    data = self._pending.pop(key)
+                # Not asyncio.wait_for: on Python 3.11 it can swallow a cancel
+                # that arrives as the send completes, and close() then hangs
+                async with asyncio.timeout(self.send_timeout):
+                    await self.websocket.send_text(data)
+                self.queue.task_done()
+        except asyncio.CancelledError:
+            raise
+        except TimeoutError:
+            logger.warning(f"Send to {self.user_id} timed out; disconnecting")
+            self._count("slow_disconnects")
+            self._abort(code=1013)
+        except Exception:
+            self._abort()
+
+    async def serve(self, on_message: Optional[Callable[[dict], Awaitable[None]]] = None):
+        """
+        Read client messages until the client leaves or the server closes the
+        socket, passing each decoded message to `on_message` if given.
+        Raises what the reader raised, e.g. WebSocketDisconnect.
+        """
+        reader = asyncio.create_task(self._read(on_message))
+        closed = asyncio.create_task(self.closed.wait())
+        try:
+            await asyncio.wait({reader, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            reader.cancel()
+            closed.cancel()
+            await asyncio.gather(reader, closed, return_exceptions=True)
+        if reader.done() and not reader.cancelled() and reader.exception():
+            raise reader.exception()
+
+    async def _read(self, on_message: Optional[Callable[[dict], Awaitable[None]]]):
+        while True:
+            data = await self.websocket.receive_text()
+            # Any message (e.g. {"type": "pong"}) shows the client is alive
+            self.last_seen = time.monotonic()
+            if on_message is not None:
+                await on_message(json.loads(data))
+
+    def _abort(self, code: int = 1000):
+        """Close from synchronous code (or the writer itself) without waiting"""
+        if not self.closed.is_set():
+            self.closed.set()
+            asyncio.create_task(self._shutdown(code))
+
+    async def close(self, code: int = 1000, drain: bool = False):
+        """
+        Stop the writer and close the socket; safe to call more than once.
+        With `drain`, messages already queued are sent first, for at most
+        `send_timeout`.
+        """
+        if drain and not self.closed.is_set():
+            try:
+                async with asyncio.timeout(self.send_timeout):
+                    await self.queue.join()
+            except TimeoutError:
+                pass
+        if not self.closed.is_set():
+            self.closed.set()
+            await self._shutdown(code)
+
+    async def _shutdown(self, code: int):
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        try:
+            async with asyncio.timeout(self.send_timeout):
+                await self.websocket.close(code=code)
+        except Exception:
+            pass